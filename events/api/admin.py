@@ -1,8 +1,49 @@
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Event
+from .cache import bump_data_version
+from .models import EmailDigest, EmailSubscriber, Event, EventChange, Task
 
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'date', 'site',)
+    list_display = ('pk', 'name', 'date', 'site', 'is_active', 'last_seen')
+    list_filter = ('is_active',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        transaction.on_commit(bump_data_version)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(bump_data_version)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(bump_data_version)
+
+
+@admin.register(EventChange)
+class EventChangeAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'name', 'date', 'site', 'created_at')
+    list_filter = ('kind',)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'attempts', 'run_at',
+                    'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+
+
+@admin.register(EmailDigest)
+class EmailDigestAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'version', 'sent', 'failed', 'created_at')
+    exclude = ('html',)
+
+
+@admin.register(EmailSubscriber)
+class EmailSubscriberAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'email', 'is_active', 'last_digest', 'last_error')
+    list_filter = ('is_active',)
+    search_fields = ('email',)
@@ -0,0 +1,110 @@
+"""Кэш готовых ответов API со списком мероприятий.
+
+Ключ ответа включает номер версии данных. Синхронизация и запись через
+API увеличивают номер версии, поэтому после изменения таблицы старые
+ответы больше не читаются и вытесняются из кэша по таймауту. Под тем же
+номером кэшируется состояние таблицы, из которого строятся ETag и
+Last-Modified.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .services import table_state
+
+DATA_VERSION_KEY = 'events:data_version'
+
+
+def get_data_version() -> int:
+    """Текущий номер версии данных.
+
+    Если номера в кэше нет (кэш очищен или перезапущен), он заводится
+    заново от текущего времени, чтобы не совпасть с номером, под которым
+    в кэше могли остаться старые ответы.
+
+    :rtype: int
+    :return: номер версии
+    """
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version() -> int:
+    """Увеличение номера версии данных после изменения таблицы.
+
+    :rtype: int
+    :return: новый номер версии
+    """
+    try:
+        return cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        get_data_version()
+        return cache.incr(DATA_VERSION_KEY)
+
+
+def get_table_state(version: int) -> dict:
+    """Состояние таблицы мероприятий (services.table_state), кэшированное
+    под номером версии данных.
+
+    :param version: номер версии данных
+    :type version: int
+
+    :rtype: dict
+    :return: словарь с ключами updated_at (datetime или None) и count
+    """
+    key = f'events:state:{version}'
+    state = cache.get(key)
+    if state is None:
+        state = table_state()
+        cache.set(key, state, settings.EVENTS_LIST_CACHE_TIMEOUT)
+    return state
+
+
+def list_cache_key(query_params, version: int) -> str:
+    """Ключ кэша ответа со списком мероприятий.
+
+    :param query_params: параметры запроса
+    :type query_params: QueryDict
+    :param version: номер версии данных
+    :type version: int
+
+    :rtype: str
+    :return: ключ, не зависящий от порядка параметров; включает текущую
+    дату, так как от неё зависит фильтр upcoming
+    """
+    query = urlencode(sorted(query_params.lists()), doseq=True)
+    digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+    return f'events:list:{version}:{timezone.localdate()}:{digest}'
+
+
+def get_list_response(query_params, version: int):
+    """Готовый JSON ответа со списком мероприятий из кэша.
+
+    :param query_params: параметры запроса
+    :type query_params: QueryDict
+    :param version: номер версии данных
+    :type version: int
+
+    :rtype: bytes or None
+    :return: тело ответа или None, если его нет в кэше
+    """
+    return cache.get(list_cache_key(query_params, version))
+
+
+def set_list_response(query_params, content: bytes, version: int) -> None:
+    """Сохранение готового JSON ответа со списком мероприятий.
+
+    :param version: номер версии данных, прочитанный до выборки из БД:
+    если за время выборки версия изменилась, ответ сохранится под старым
+    номером и читаться не будет
+    :type version: int
+    """
+    cache.set(list_cache_key(query_params, version), content,
+              settings.EVENTS_LIST_CACHE_TIMEOUT)
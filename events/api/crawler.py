@@ -0,0 +1,173 @@
+"""Асинхронная загрузка страниц с мероприятиями.
+
+Страницы загружаются параллельно через один пул соединений httpx с
+ограничением числа одновременных запросов, паузой между запросами к
+одному хосту и повторами с экспоненциальной задержкой.
+"""
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+Page = namedtuple('Page', ('html', 'etag', 'last_modified'))
+
+# Ответы, после которых запрос имеет смысл повторить.
+RETRY_STATUSES = frozenset((
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+))
+
+
+class HostRateLimiter:
+    """Ограничение частоты запросов к одному хосту.
+
+    Между началами двух запросов к хосту проходит не меньше 1 / rate
+    секунд; запросы к разным хостам друг друга не ждут.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self.locks = {}
+        self.next_time = {}
+
+    async def wait(self, host: str):
+        if not self.interval:
+            return
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = self.next_time.get(host, 0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_time[host] = time.monotonic() + self.interval
+
+
+class Crawler:
+    """Параллельная загрузка страниц.
+
+    :param concurrency: максимум одновременных запросов
+    :param rate: максимум запросов в секунду к одному хосту
+    :param retries: количество повторов при сетевой ошибке или ответах
+    429/5xx
+    :param backoff: начальная задержка перед повтором, в секундах
+    :param timeout: таймаут запроса, в секундах
+    :param transport: транспорт httpx (для тестов)
+    """
+
+    def __init__(self, concurrency: int = None, rate: float = None,
+                 retries: int = None, backoff: float = None,
+                 timeout: float = None, transport=None):
+        self.concurrency = concurrency or settings.EVENTS_CRAWL_CONCURRENCY
+        self.limiter = HostRateLimiter(
+            settings.EVENTS_CRAWL_RATE if rate is None else rate)
+        self.retries = (settings.EVENTS_CRAWL_RETRIES
+                        if retries is None else retries)
+        self.backoff = (settings.EVENTS_CRAWL_BACKOFF
+                        if backoff is None else backoff)
+        self.timeout = timeout or settings.EVENTS_CRAWL_TIMEOUT
+        self.transport = transport
+
+    async def fetch(self, client, semaphore, url: str, etag: str = '',
+                    last_modified: str = ''):
+        """Загрузка одной страницы с условными заголовками и повторами.
+
+        :rtype: Page or None
+        :return: страница или None, если сервер ответил 304 Not Modified
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        host = urlsplit(url).netloc
+
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                await self.limiter.wait(host)
+                async with semaphore:
+                    response = await client.get(url, headers=headers)
+            except httpx.TransportError as error:
+                if attempt == self.retries:
+                    raise
+                logging.warning(f'Ошибка загрузки {url}: {error}, '
+                                f'повтор через {delay} с')
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                return None
+            if (response.status_code in RETRY_STATUSES
+                    and attempt < self.retries):
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                logging.warning(f'{url} ответил {response.status_code}, '
+                                f'повтор через {delay} с')
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            return Page(
+                html=response.text,
+                etag=response.headers.get('ETag', ''),
+                last_modified=response.headers.get('Last-Modified', ''),
+            )
+
+    async def fetch_many(self, requests: list,
+                         return_exceptions: bool = False) -> list:
+        """Параллельная загрузка страниц через общий пул соединений.
+
+        :param requests: список кортежей (url, etag, last_modified)
+        :type requests: list
+        :param return_exceptions: возвращать ошибки вместо страниц, а не
+        прерывать загрузку
+        :type return_exceptions: bool
+
+        :rtype: list
+        :return: страницы (Page, None или исключение) в порядке запросов
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency,
+                              max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            limits=limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+            transport=self.transport,
+        ) as client:
+            return await asyncio.gather(
+                *(self.fetch(client, semaphore, *request)
+                  for request in requests),
+                return_exceptions=return_exceptions,
+            )
+
+
+def fetch_pages(requests: list, return_exceptions: bool = False,
+                crawler: Crawler = None) -> list:
+    """Синхронная обёртка над Crawler.fetch_many.
+
+    :param requests: список кортежей (url, etag, last_modified)
+    :type requests: list
+    :param return_exceptions: возвращать ошибки вместо страниц
+    :type return_exceptions: bool
+    :param crawler: загрузчик; по умолчанию - с параметрами из настроек
+    :type crawler: Crawler
+
+    :rtype: list
+    :return: страницы (Page, None или исключение) в порядке запросов
+    """
+    if not requests:
+        return []
+    crawler = crawler or Crawler()
+    started = time.monotonic()
+    pages = asyncio.run(crawler.fetch_many(requests, return_exceptions))
+    logging.info(f'Загружено страниц: {len(requests)} за '
+                 f'{time.monotonic() - started:.2f} с')
+    return pages
@@ -0,0 +1,174 @@
+"""Рассылка дайджеста предстоящих мероприятий по почте.
+
+Письмо рендерится один раз на версию данных (состояние таблицы
+мероприятий и дата) и сохраняется в EmailDigest. Подписчикам оно
+отправляется пачками через одно SMTP-соединение (get_connection()),
+которое открывается один раз на всю рассылку, а не на каждое письмо.
+После каждой пачки подписчикам записывается последний доставленный
+дайджест или ошибка доставки, поэтому повторный запуск (например,
+повтор задачи очереди) отправляет письма только тем, кто их не получил.
+Если кому-то письмо не доставлено, send_digest завершается ошибкой
+DigestNotDelivered, и задача очереди повторяется с задержкой.
+"""
+import logging
+import os
+import smtplib
+import socket
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import EmailDigest, EmailSubscriber
+from .services import list_events, table_state
+
+DIGEST_SUBJECT = 'Новые мероприятия'
+DIGEST_MESSAGE = 'Здравствуйте! Приглашаем вас на наши мероприятия'
+# Ошибки разрыва соединения с почтовым сервером (например, сервер
+# ограничивает число писем за сессию).
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError,
+                     socket.timeout)
+
+
+class DigestNotDelivered(Exception):
+    """Дайджест доставлен не всем подписчикам."""
+
+
+def digest_version() -> str:
+    """Версия дайджеста: дата и состояние таблицы мероприятий.
+
+    Дайджест содержит мероприятия начиная с сегодняшнего дня, поэтому
+    версия меняется и со сменой дня.
+
+    :rtype: str
+    :return: версия
+    """
+    state = table_state()
+    updated_at = state['updated_at']
+    return '{}-{}-{}'.format(
+        timezone.localdate().isoformat(), state['count'],
+        int(updated_at.timestamp()) if updated_at else 0)
+
+
+def build_digest() -> EmailDigest:
+    """Дайджест текущей версии данных; рендерится, только если его ещё нет.
+
+    :rtype: EmailDigest
+    :return: дайджест
+    """
+    version = digest_version()
+    digest = EmailDigest.objects.filter(version=version).first()
+    if digest is not None:
+        return digest
+    events = list_events(upcoming=True)
+    text = '\n'.join([f'{DIGEST_MESSAGE}.', ''] + [
+        f'{event.date:%d.%m.%Y} - {event.name}\n{event.site}'
+        for event in events
+    ])
+    html = render_to_string('email.html', {'subject': DIGEST_SUBJECT,
+                                           'message': DIGEST_MESSAGE,
+                                           'events': events})
+    digest, _ = EmailDigest.objects.get_or_create(
+        version=version,
+        defaults={'subject': DIGEST_SUBJECT, 'text': text, 'html': html})
+    return digest
+
+
+def digest_recipients(digest: EmailDigest, last_id: int,
+                      batch_size: int) -> list:
+    """Следующая пачка получателей дайджеста.
+
+    :rtype: list
+    :return: список пар (ID, почта) по возрастанию ID
+    """
+    return list(
+        EmailSubscriber.objects.filter(is_active=True, id__gt=last_id)
+        .filter(Q(last_digest__isnull=True) | ~Q(last_digest=digest))
+        .order_by('id').values_list('id', 'email')[:batch_size]
+    )
+
+
+def send_message(connection, message) -> None:
+    """Отправка письма через открытое соединение.
+
+    SMTP backend Django не переоткрывает разорванное соединение, поэтому
+    при разрыве оно закрывается и открывается заново, а письмо
+    отправляется ещё раз.
+    """
+    try:
+        connection.send_messages([message])
+    except DISCONNECT_ERRORS as error:
+        logging.warning(f'Соединение с почтовым сервером разорвано: {error}')
+        try:
+            connection.close()
+        except OSError:
+            pass
+        connection.open()
+        connection.send_messages([message])
+
+
+def send_digest(digest: EmailDigest, batch_size: int = None,
+                connection=None) -> int:
+    """Отправка дайджеста подписчикам, которые его ещё не получили.
+
+    :param digest: дайджест
+    :type digest: EmailDigest
+    :param batch_size: размер пачки подписчиков между сохранениями
+    состояния (по умолчанию EMAIL_DIGEST_BATCH_SIZE)
+    :type batch_size: int
+    :param connection: соединение почтового backend'а (по умолчанию
+    get_connection())
+
+    :raises DigestNotDelivered: если хотя бы одно письмо не доставлено
+    (состояние доставленных сохраняется)
+
+    :rtype: int
+    :return: количество отправленных писем
+    """
+    batch_size = batch_size or settings.EMAIL_DIGEST_BATCH_SIZE
+    connection = connection or get_connection()
+    from_email = os.getenv('EMAIL_HOST_USER')
+    sent = failed = last_id = 0
+    connection.open()
+    try:
+        while True:
+            recipients = digest_recipients(digest, last_id, batch_size)
+            if not recipients:
+                break
+            delivered, errors = [], {}
+            for subscriber_id, email in recipients:
+                message = EmailMultiAlternatives(
+                    digest.subject, digest.text, from_email, [email],
+                    connection=connection)
+                message.attach_alternative(digest.html, 'text/html')
+                try:
+                    send_message(connection, message)
+                except Exception as error:
+                    logging.warning(f'Дайджест {digest.pk} не доставлен '
+                                    f'на {email}: {error}')
+                    errors[subscriber_id] = str(error)
+                else:
+                    delivered.append(subscriber_id)
+            with transaction.atomic():
+                EmailSubscriber.objects.filter(id__in=delivered).update(
+                    last_digest=digest, last_error='')
+                for subscriber_id, error in errors.items():
+                    EmailSubscriber.objects.filter(id=subscriber_id).update(
+                        last_error=error)
+                EmailDigest.objects.filter(pk=digest.pk).update(
+                    sent=F('sent') + len(delivered),
+                    failed=F('failed') + len(errors))
+            sent += len(delivered)
+            failed += len(errors)
+            last_id = recipients[-1][0]
+    finally:
+        connection.close()
+    logging.info(f'Дайджест {digest.pk} отправлен: {sent}, '
+                 f'не доставлен: {failed}')
+    if failed:
+        raise DigestNotDelivered(
+            f'Дайджест {digest.pk} не доставлен {failed} подписчикам')
+    return sent
@@ -0,0 +1,64 @@
+import datetime
+
+import coreapi
+import coreschema
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .services import filter_events
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def parse_date(value: str, param: str) -> datetime.date:
+    """Разбор даты из параметра запроса.
+
+    :param value: дата в формате ГГГГ-ММ-ДД
+    :type value: str
+    :param param: имя параметра (для текста ошибки)
+    :type param: str
+
+    :rtype: datetime.date
+    :return: дата
+    """
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(
+            {param: 'Ожидается дата в формате ГГГГ-ММ-ДД.'})
+
+
+class EventFilterBackend(BaseFilterBackend):
+    """Фильтры списка мероприятий.
+
+    Параметры запроса:
+    ``date_from``, ``date_to`` - границы периода (включительно);
+    ``upcoming=true`` - только мероприятия начиная с сегодняшнего дня;
+    ``search`` - подстрока в названии без учёта регистра.
+    """
+
+    fields = (
+        ('date_from', 'Дата начала периода (ГГГГ-ММ-ДД)'),
+        ('date_to', 'Дата конца периода (ГГГГ-ММ-ДД)'),
+        ('upcoming', 'Только предстоящие мероприятия (true)'),
+        ('search', 'Поиск по названию'),
+    )
+
+    def get_schema_fields(self, view):
+        return [
+            coreapi.Field(name=name, required=False, location='query',
+                          schema=coreschema.String(description=description))
+            for name, description in self.fields
+        ]
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        return filter_events(
+            queryset,
+            date_from=(params.get('date_from')
+                       and parse_date(params['date_from'], 'date_from')),
+            date_to=(params.get('date_to')
+                     and parse_date(params['date_to'], 'date_to')),
+            upcoming=params.get('upcoming', '').lower() in TRUE_VALUES,
+            search=params.get('search', ''),
+        )
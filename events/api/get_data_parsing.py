@@ -1,8 +1,14 @@
 import datetime
+import hashlib
 import logging
-from urllib.request import urlopen
+from http import HTTPStatus
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-from bs4 import BeautifulSoup
+from django.conf import settings
+
+from .crawler import fetch_pages
+from .parsers import get_parser
 
 logging.basicConfig(
     format='%(asctime)s, %(levelname)s, %(name)s, %(message)s',
@@ -12,6 +18,10 @@ logging.basicConfig(
     encoding='utf-8',
 )
 
+EVENTS_URL = "https://events.yandex.ru/"
+
+# Размер части при потоковом чтении страницы, в байтах.
+CHUNK_SIZE = 16 * 1024
 
 MONTHS_CHOICE = {
     'января': '01',
@@ -29,19 +39,93 @@ MONTHS_CHOICE = {
 }
 
 
-def site_parsing() -> str:
-    """Получение данных сайта (парсинг).
+def open_page(url: str, etag: str = '', last_modified: str = ''):
+    """Открытие страницы с условными заголовками.
 
-    :rtype: bs4.element.Tag
-    :return: тип данных объекта BeautifulSoup, представляющий HTML теги
+    :param url: адрес страницы
+    :type url: str
+    :param etag: ETag из предыдущего ответа
+    :type etag: str
+    :param last_modified: Last-Modified из предыдущего ответа
+    :type last_modified: str
+
+    :rtype: http.client.HTTPResponse or None
+    :return: открытый ответ сервера (тело ещё не прочитано) или None, если
+    сервер ответил 304 Not Modified
     """
-    url = "https://events.yandex.ru/"
-    page = urlopen(url)
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        page = urlopen(Request(url, headers=headers),
+                       timeout=settings.EVENTS_CRAWL_TIMEOUT)
+    except HTTPError as error:
+        if error.code == HTTPStatus.NOT_MODIFIED:
+            logging.info('Страница не изменилась (304)')
+            return None
+        raise
     logging.info("URL успешно открыт")
-    html = page.read().decode("utf-8")
-    logging.info("HTML контент считался и декодировался")
-    soup = BeautifulSoup(html, "html.parser")
-    events = soup.find(class_='events__container')
+    return page
+
+
+def iter_page_chunks(page, chunk_size: int = CHUNK_SIZE):
+    """Чтение тела ответа частями.
+
+    :param page: открытый ответ сервера
+    :type page: http.client.HTTPResponse
+    :param chunk_size: размер части в байтах
+    :type chunk_size: int
+
+    :rtype: Iterator[bytes]
+    :return: генератор частей тела ответа
+    """
+    while True:
+        chunk = page.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_events_container(html: str, parser=None):
+    """Выделение блока с мероприятиями из HTML страницы.
+
+    :param html: HTML страницы
+    :type html: str
+    :param parser: парсер (см. api.parsers); по умолчанию из настроек
+    :type parser: SoupParser or LxmlParser
+
+    :return: блок с мероприятиями в представлении парсера или None
+    """
+    return (parser or get_parser()).get_container(html)
+
+
+def content_hash(events, parser=None) -> str:
+    """Хэш блока с мероприятиями.
+
+    :param events: блок с мероприятиями
+    :param parser: парсер, которым получен блок
+    :type parser: SoupParser or LxmlParser
+
+    :rtype: str
+    :return: sha256 в шестнадцатеричном виде
+    """
+    fragment = (parser or get_parser()).serialize(events)
+    return hashlib.sha256(fragment.encode('utf-8')).hexdigest()
+
+
+def site_parsing(parser=None):
+    """Получение данных сайта (парсинг).
+
+    :param parser: парсер (см. api.parsers); по умолчанию из настроек
+    :type parser: SoupParser or LxmlParser
+
+    :return: блок с мероприятиями в представлении парсера
+    """
+    page, = fetch_pages([(EVENTS_URL, '', '')])
+    events = get_events_container(page.html, parser)
     logging.info('Данные сайта успешно получены')
     return events
 
@@ -90,53 +174,81 @@ def date_converter(date: str):
         return date[0]
 
 
-def processing_data_website() -> list:
+def card_to_event(card) -> dict:
+    """Преобразование карточки мероприятия в словарь для сохранения.
+
+    :param card: дата, название и ссылка мероприятия со страницы
+    :type card: api.parsers.EventCard
+
+    :rtype: dict
+    :return: словарь с ключами date, name, site
+    """
+    date = None
+    if card.date and 'Дата уточняется' not in card.date:
+        try:
+            date = date_converter(card.date)
+            logging.info('Дата мероприятия: {}'.format(date))
+        except (TypeError, KeyError, IndexError, ValueError):
+            logging.warning('Неверный формат даты: {}'.format(card.date))
+
+    # Создаём ссылку. Так как в некоторых мероприятиях указана полная
+    # ссылка на регистрацию, то мы делаем проверку для создания ссылки.
+    if 'https' not in card.href:
+        site = 'https://events.yandex.ru' + card.href
+    else:
+        site = card.href
+
+    logging.info(f'Добавлено мероприятие: { date }')
+    return {
+        "date": str(date),
+        "name": card.name,
+        "site": site,
+    }
+
+
+def processing_data_website(events=None, parser=None) -> list:
     """Обработка данных сайта после парсинга.
 
     В методе выделяем отдельные данные (дату, название, сайт мероприятий),
     а затем добавляем их в массив, который возвращаем для дальнейших
     операций.
 
+    :param events: уже загруженный блок с мероприятиями; если не передан,
+    сайт парсится заново
+    :param parser: парсер, которым получен блок; по умолчанию из настроек
+    :type parser: SoupParser or LxmlParser
+
     :rtype: list
     :return: Возвращает список (массив) со словарями, имеющими ключи
     date, name, site
     """
-    events = site_parsing()
-    data_events = []
+    parser = parser or get_parser()
+    if events is None:
+        events = site_parsing(parser)
+    if events is None:
+        logging.error('Блок с мероприятиями не найден на странице')
+        return []
 
     logging.info('Парсинг информации о каждом мероприятии запущен')
-    for event in events:
-        if len(event) != 0:
-            # Получаем информацию о дате проведения мероприятия.
-            date_find_in_event = event.find(class_='event-card__date')
-            if 'Дата уточняется' not in date_find_in_event:
-                try:
-                    date = date_converter(date_find_in_event.text)
-                    logging.info('Дата мероприятия: {}'.format(date))
-                except TypeError:
-                    logging.warning('Неверный формат даты: {}'.format(
-                        date_find_in_event.get_text()))
-                    date = None
-
-            name = event.find(class_='event-card__title')
-
-            # Создаём ссылку. Так как в некоторых мероприятиях указана полная
-            # ссылка на регистрацию, то мы делаем проверку для создания ссылки.
-            if 'https' not in event.find('a').get('href'):
-                site = (
-                    'https://events.yandex.ru'
-                    + event.find('a').get('href')
-                )
-            else:
-                site = event.find('a').get('href')
-
-            data_events.append(
-                {
-                    "date": str(date),
-                    "name": name,
-                    "site": site,
-                }
-            )
-            logging.info(f'Добавлено мероприятие: { date }')
+    data_events = [card_to_event(card) for card in parser.parse_cards(events)]
     logging.info('Парсинг информации о каждом мероприятии завершён')
     return data_events
+
+
+def iter_events_website(chunks, parser=None):
+    """Потоковая обработка данных сайта.
+
+    Страница разбирается по мере загрузки, и каждое мероприятие
+    возвращается сразу после закрытия его карточки, без построения
+    дерева всей страницы и списка всех мероприятий.
+
+    :param chunks: части тела страницы (bytes)
+    :type chunks: Iterable[bytes]
+    :param parser: парсер; по умолчанию из настроек
+    :type parser: SoupParser or LxmlParser
+
+    :rtype: Iterator[dict]
+    :return: генератор словарей с ключами date, name, site
+    """
+    for card in (parser or get_parser()).iter_cards(chunks):
+        yield card_to_event(card)
@@ -0,0 +1,71 @@
+import glob
+import os
+import timeit
+
+from api.parsers import PARSERS, get_parser
+from django.core.management.base import BaseCommand
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'tests', 'fixtures',
+)
+
+
+class Command(BaseCommand):
+    """Сравнение скорости парсеров на сохранённых HTML страницах."""
+
+    help = 'Бенчмарк парсеров страницы с мероприятиями'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help='HTML файлы (по умолчанию - api/tests/fixtures/*.html)',
+        )
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=200,
+            help='Количество повторов для каждого парсера',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Запуск бенчмарка.
+
+        Для каждого файла и каждого парсера измеряется полный цикл:
+        выделение блока с мероприятиями и разбор всех карточек.
+
+        :param args: Аргументы команды.
+        :type args: Any
+        :param options: Параметры команды (paths, number).
+        :type options: dict
+        :return: None
+        """
+        paths = options['paths'] or sorted(
+            glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+        number = options['number']
+
+        for path in paths:
+            with open(path, encoding='utf-8') as file:
+                html = file.read()
+            self.stdout.write(f'{os.path.basename(path)}:')
+
+            results = {}
+            for name in PARSERS:
+                parser = get_parser(name)
+                if parser.name != name:
+                    self.stdout.write(f'  {name}: недоступен')
+                    continue
+                cards = len(parser.parse_cards(parser.get_container(html)))
+                seconds = timeit.timeit(
+                    lambda: parser.parse_cards(parser.get_container(html)),
+                    number=number,
+                )
+                results[name] = seconds / number * 1000
+                self.stdout.write(
+                    f'  {name}: {results[name]:.3f} мс, карточек: {cards}')
+
+            if len(results) == len(PARSERS):
+                speedup = results['soup'] / results['lxml']
+                self.stdout.write(f'  ускорение lxml: x{speedup:.1f}')
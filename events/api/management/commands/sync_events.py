@@ -0,0 +1,81 @@
+import logging
+import time
+
+from api.sync import sync_events
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Фоновая синхронизация мероприятий с сайтом."""
+
+    help = 'Обновление таблицы мероприятий данными с events.yandex.ru'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Запускать синхронизацию периодически, а не один раз',
+        )
+        parser.add_argument(
+            '--period',
+            type=int,
+            default=settings.EVENTS_SYNC_PERIOD,
+            help='Интервал между синхронизациями в секундах',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Синхронизировать, даже если страница не изменилась',
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            default=None,
+            help='Разбирать страницу потоково, по мере загрузки',
+        )
+
+    def run_once(self, force=False, stream=None):
+        """Один цикл синхронизации.
+
+        Ошибка в одном цикле не останавливает планировщик: она
+        логируется, а следующая попытка будет через обычный интервал.
+        """
+        try:
+            result = sync_events(force, stream)
+        except Exception as error:
+            logging.exception(f'Ошибка синхронизации мероприятий: {error}')
+            self.stderr.write(f'Ошибка синхронизации: {error}')
+            return
+        if result is None:
+            self.stdout.write('Данные на сайте не изменились')
+            return
+        self.stdout.write(
+            f'Добавлено: {result.created}, обновлено: {result.updated}, '
+            f'удалено: {result.deleted}')
+
+    def handle(self, *args, **options):
+        """
+        Запуск синхронизации.
+
+        :param args: Аргументы команды.
+        :type args: Any
+        :param options: Параметры команды (loop, period, force,
+            stream).
+        :type options: dict
+        :return: None
+        """
+        if not options['loop']:
+            self.run_once(options['force'], options['stream'])
+            return
+
+        period = options['period']
+        force = options['force']
+        while True:
+            started = time.monotonic()
+            self.run_once(force, options['stream'])
+            force = False
+            # Интервал считается от начала цикла, чтобы длительность
+            # синхронизации не сдвигала расписание.
+            elapsed = time.monotonic() - started
+            time.sleep(max(period - elapsed, 0))
@@ -0,0 +1,55 @@
+import logging
+from multiprocessing import Process
+
+from api.tasks import work
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """Воркеры очереди фоновых задач."""
+
+    help = 'Выполнение фоновых задач (отправка писем, синхронизация)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.TASKS_WORKERS,
+            help='Количество процессов-воркеров',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        """
+        Запуск воркеров.
+
+        Один воркер работает в текущем процессе, несколько - в отдельных
+        процессах, каждый со своим соединением с БД.
+
+        :param args: Аргументы команды.
+        :type args: Any
+        :param options: Параметры команды (workers, once).
+        :type options: dict
+        :return: None
+        """
+        workers = options['workers']
+        if workers <= 1:
+            done = work(options['once'])
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+
+        # Соединения с БД не должны наследоваться дочерними процессами.
+        connections.close_all()
+        processes = [Process(target=work, args=(options['once'],))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        logging.info(f'Запущено воркеров: {workers}')
+        for process in processes:
+            process.join()
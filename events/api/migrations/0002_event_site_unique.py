@@ -0,0 +1,30 @@
+# Generated by Django 2.2.19 on 2026-10-18 11:58
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def delete_duplicate_sites(apps, schema_editor):
+    """Оставляем по одной (последней) записи на каждую ссылку."""
+    Event = apps.get_model('api', 'Event')
+    last_ids = (Event.objects.values('site')
+                .annotate(last_id=Max('id'))
+                .values_list('last_id', flat=True))
+    Event.objects.exclude(id__in=list(last_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_sites,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='site',
+            field=models.URLField(max_length=254, unique=True, verbose_name='Сайт'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.19 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_event_site_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=254, unique=True, verbose_name='Адрес страницы')),
+                ('etag', models.CharField(blank=True, max_length=254, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='Last-Modified')),
+                ('content_hash', models.CharField(blank=True, max_length=64, verbose_name='Хэш блока с мероприятиями')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Время загрузки')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_fetchstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='description',
+            field=models.TextField(blank=True, verbose_name='Описание'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_event_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Время изменения'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+def create_name_trigram_index(apps, schema_editor):
+    """Индекс для поиска по названию (name__icontains).
+
+    icontains в PostgreSQL превращается в UPPER(name) LIKE UPPER(...),
+    такой запрос использует GIN-индекс по триграммам. Расширение pg_trgm
+    есть не во всех сборках PostgreSQL: без него индекс не создаётся, а
+    поиск работает полным просмотром таблицы.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions "
+                       "WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS event_name_trgm_idx '
+        'ON api_event USING gin (UPPER(name) gin_trgm_ops)')
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS event_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_event_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+        ),
+        migrations.RunPython(create_name_trigram_index,
+                             drop_name_trigram_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:13
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def fill_search_vectors(apps, schema_editor):
+    Event = apps.get_model('api', 'Event')
+    Event.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('description', weight='B', config='russian')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_event_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='event_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors,
+                             migrations.RunPython.noop),
+    ]
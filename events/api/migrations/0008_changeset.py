@@ -0,0 +1,25 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:14
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_event_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added', django.contrib.postgres.fields.jsonb.JSONField(default=list, verbose_name='Добавленные')),
+                ('changed', django.contrib.postgres.fields.jsonb.JSONField(default=list, verbose_name='Изменённые')),
+                ('removed', django.contrib.postgres.fields.jsonb.JSONField(default=list, verbose_name='Удалённые')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время синхронизации')),
+                ('delivered_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Время рассылки')),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailDigest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=100, unique=True, verbose_name='Версия данных')),
+                ('subject', models.CharField(max_length=200, verbose_name='Тема')),
+                ('text', models.TextField(verbose_name='Текст')),
+                ('html', models.TextField(verbose_name='HTML')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Не доставлено')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmailSubscriber',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Почта')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время подписки')),
+                ('last_digest', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.EmailDigest', verbose_name='Последний доставленный дайджест')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='emailsubscriber',
+            index=models.Index(condition=models.Q(is_active=True), fields=['id'], name='email_subscriber_active_idx'),
+        ),
+    ]
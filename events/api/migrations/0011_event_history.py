@@ -0,0 +1,75 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:39
+
+import hashlib
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_history_fields(apps, schema_editor):
+    """Время последнего изменения - лучшая оценка first_seen и last_seen
+    для существующих записей; хэш считается как в api.sync.event_hash.
+    """
+    Event = apps.get_model('api', 'Event')
+    Event.objects.update(first_seen=models.F('updated_at'),
+                         last_seen=models.F('updated_at'))
+    events = list(Event.objects.only('date', 'name', 'description'))
+    for event in events:
+        content = '\x1f'.join((str(event.date), event.name,
+                               event.description))
+        event.content_hash = hashlib.sha256(
+            content.encode('utf-8')).hexdigest()
+    Event.objects.bulk_update(events, ('content_hash',), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_email_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.URLField(max_length=254, verbose_name='Сайт')),
+                ('kind', models.CharField(choices=[('added', 'Добавлено'), ('changed', 'Изменено'), ('removed', 'Пропало с сайта')], max_length=10, verbose_name='Изменение')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('content_hash', models.CharField(blank=True, max_length=64, verbose_name='Хэш содержимого')),
+                ('previous', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict, verbose_name='Прежние значения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_date_id_idx',
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='first_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Впервые на сайте'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='is_active',
+            field=models.BooleanField(default=True, verbose_name='Есть на сайте'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний раз на сайте'),
+        ),
+        migrations.RunPython(fill_history_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(is_active=True), fields=['date', 'id'], name='event_active_date_id_idx'),
+        ),
+    ]
@@ -1,10 +1,20 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
 
 class Event(models.Model):
+    """Мероприятие.
+
+    Пропавшее с сайта мероприятие не удаляется, а становится неактивным
+    (is_active=False); если оно появится снова, запись активируется.
+    API и бот читают только активные мероприятия.
+    """
     date = models.DateField(
         verbose_name='Дата',
     )
@@ -13,7 +23,289 @@ class Event(models.Model):
         max_length=200,)
     site = models.URLField(
         verbose_name='Сайт',
-        max_length=254,)
+        max_length=254,
+        unique=True,)
+    description = models.TextField(
+        verbose_name='Описание',
+        blank=True,)
+    updated_at = models.DateTimeField(
+        verbose_name='Время изменения',
+        auto_now=True,
+        db_index=True,)
+    # Заполняется в БД, см. api/search.py.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,)
+    first_seen = models.DateTimeField(
+        verbose_name='Впервые на сайте',
+        default=timezone.now,)
+    last_seen = models.DateTimeField(
+        verbose_name='Последний раз на сайте',
+        default=timezone.now,)
+    is_active = models.BooleanField(
+        verbose_name='Есть на сайте',
+        default=True,)
+    # Хэш даты, названия и описания, см. api/sync.py.
+    content_hash = models.CharField(
+        verbose_name='Хэш содержимого',
+        max_length=64,
+        blank=True,)
+
+    class Meta:
+        indexes = (
+            # Курсорная пагинация и фильтры по периоду: только активные.
+            models.Index(fields=('date', 'id'),
+                         condition=models.Q(is_active=True),
+                         name='event_active_date_id_idx'),
+            GinIndex(fields=('search_vector',),
+                     name='event_search_vector_idx'),
+        )
 
     def __str__(self):
         return self.name
+
+
+class EventChange(models.Model):
+    """Запись журнала изменений мероприятий.
+
+    Журнал только дополняется: синхронизация добавляет записи пачкой, а
+    изменения после известной записи выбираются запросом по ID (см.
+    api.services.changes_since). Мероприятие определяется ссылкой, поэтому
+    запись остаётся и после удаления мероприятия из БД.
+    """
+    ADDED = 'added'
+    CHANGED = 'changed'
+    REMOVED = 'removed'
+    KINDS = (
+        (ADDED, 'Добавлено'),
+        (CHANGED, 'Изменено'),
+        (REMOVED, 'Пропало с сайта'),
+    )
+
+    site = models.URLField(
+        verbose_name='Сайт',
+        max_length=254,)
+    kind = models.CharField(
+        verbose_name='Изменение',
+        max_length=10,
+        choices=KINDS,)
+    date = models.DateField(
+        verbose_name='Дата',)
+    name = models.CharField(
+        verbose_name='Название',
+        max_length=200,)
+    content_hash = models.CharField(
+        verbose_name='Хэш содержимого',
+        max_length=64,
+        blank=True,)
+    # Прежние значения изменившихся даты и названия.
+    previous = JSONField(
+        verbose_name='Прежние значения',
+        default=dict,
+        blank=True,)
+    created_at = models.DateTimeField(
+        verbose_name='Время изменения',
+        auto_now_add=True,)
+
+    def __str__(self):
+        return f'{self.get_kind_display()}: {self.name}'
+
+
+class FetchState(models.Model):
+    """Состояние последней загрузки страницы с мероприятиями.
+
+    Хранит заголовки для условных запросов и хэш блока с мероприятиями,
+    чтобы не парсить и не сверять с БД неизменившуюся страницу.
+    """
+    url = models.URLField(
+        verbose_name='Адрес страницы',
+        max_length=254,
+        unique=True,)
+    etag = models.CharField(
+        verbose_name='ETag',
+        max_length=254,
+        blank=True,)
+    last_modified = models.CharField(
+        verbose_name='Last-Modified',
+        max_length=64,
+        blank=True,)
+    content_hash = models.CharField(
+        verbose_name='Хэш блока с мероприятиями',
+        max_length=64,
+        blank=True,)
+    updated_at = models.DateTimeField(
+        verbose_name='Время загрузки',
+        auto_now=True,)
+
+    def __str__(self):
+        return self.url
+
+
+class ChangeSet(models.Model):
+    """Изменения мероприятий, сделанные одной синхронизацией.
+
+    Таблица служит очередью исходящих событий (outbox): запись создаётся в
+    одной транзакции с изменением мероприятий, а бот забирает
+    недоставленные записи и рассылает уведомления. В списках хранятся
+    словари с ключами date, name, site; у изменённых мероприятий ключ
+    previous содержит прежние значения изменившихся полей.
+    """
+    added = JSONField(
+        verbose_name='Добавленные',
+        default=list,)
+    changed = JSONField(
+        verbose_name='Изменённые',
+        default=list,)
+    removed = JSONField(
+        verbose_name='Удалённые',
+        default=list,)
+    created_at = models.DateTimeField(
+        verbose_name='Время синхронизации',
+        auto_now_add=True,)
+    delivered_at = models.DateTimeField(
+        verbose_name='Время рассылки',
+        null=True,
+        blank=True,
+        db_index=True,)
+
+    def __str__(self):
+        return (f'Изменения {self.pk}: +{len(self.added)} '
+                f'~{len(self.changed)} -{len(self.removed)}')
+
+
+class Task(models.Model):
+    """Задача фоновой очереди (см. api/tasks.py).
+
+    Воркеры забирают задачи запросом SELECT ... FOR UPDATE SKIP LOCKED,
+    поэтому одну задачу выполняет один воркер. Упавшая задача
+    повторяется с экспоненциальной задержкой, после max_attempts попыток
+    получает статус dead и больше не выполняется.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    DEAD = 'dead'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (DEAD, 'Не выполнена'),
+    )
+
+    name = models.CharField(
+        verbose_name='Задача',
+        max_length=100,)
+    kwargs = JSONField(
+        verbose_name='Параметры',
+        default=dict,)
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,)
+    attempts = models.PositiveIntegerField(
+        verbose_name='Попыток',
+        default=0,)
+    max_attempts = models.PositiveIntegerField(
+        verbose_name='Максимум попыток',
+        default=5,)
+    run_at = models.DateTimeField(
+        verbose_name='Выполнить после',
+        default=timezone.now,)
+    # Срок, до которого задачу выполняет захвативший её воркер; если
+    # воркер остановился, после него задачу заберёт другой.
+    locked_until = models.DateTimeField(
+        verbose_name='Захвачена до',
+        null=True,
+        blank=True,)
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True,)
+    created_at = models.DateTimeField(
+        verbose_name='Время создания',
+        auto_now_add=True,)
+    finished_at = models.DateTimeField(
+        verbose_name='Время завершения',
+        null=True,
+        blank=True,)
+
+    class Meta:
+        indexes = (
+            # Выбор следующей задачи: только невыполненные.
+            models.Index(fields=('run_at',),
+                         condition=models.Q(status__in=('pending',
+                                                        'running')),
+                         name='task_queue_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
+
+
+class EmailDigest(models.Model):
+    """Письмо-дайджест с предстоящими мероприятиями (см. api/digests.py).
+
+    Письмо рендерится один раз на версию данных и рассылается всем
+    подписчикам рассылки.
+    """
+    version = models.CharField(
+        verbose_name='Версия данных',
+        max_length=100,
+        unique=True,)
+    subject = models.CharField(
+        verbose_name='Тема',
+        max_length=200,)
+    text = models.TextField(
+        verbose_name='Текст',)
+    html = models.TextField(
+        verbose_name='HTML',)
+    sent = models.PositiveIntegerField(
+        verbose_name='Отправлено',
+        default=0,)
+    failed = models.PositiveIntegerField(
+        verbose_name='Не доставлено',
+        default=0,)
+    created_at = models.DateTimeField(
+        verbose_name='Время создания',
+        auto_now_add=True,)
+
+    def __str__(self):
+        return f'Дайджест {self.version}'
+
+
+class EmailSubscriber(models.Model):
+    """Подписчик рассылки дайджестов по почте.
+
+    last_digest - последний доставленный дайджест, last_error - ошибка
+    последней попытки доставки (пусто, если она удалась).
+    """
+    email = models.EmailField(
+        verbose_name='Почта',
+        unique=True,)
+    is_active = models.BooleanField(
+        verbose_name='Активен',
+        default=True,)
+    last_digest = models.ForeignKey(
+        to=EmailDigest,
+        verbose_name='Последний доставленный дайджест',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,)
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True,)
+    created_at = models.DateTimeField(
+        verbose_name='Время подписки',
+        auto_now_add=True,)
+
+    class Meta:
+        indexes = (
+            # Выбор получателей дайджеста: только активные подписчики.
+            models.Index(fields=('id',),
+                         condition=models.Q(is_active=True),
+                         name='email_subscriber_active_idx'),
+        )
+
+    def __str__(self):
+        return self.email
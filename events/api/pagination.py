@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+from .services import EVENTS_ORDERING
+
+
+class EventCursorPagination(CursorPagination):
+    """Постраничный вывод мероприятий по курсору.
+
+    Страница выбирается условием по индексу (date, id), а не смещением,
+    поэтому время ответа не зависит от номера страницы и размера таблицы.
+    """
+
+    ordering = EVENTS_ORDERING
+    page_size = settings.EVENTS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.EVENTS_MAX_PAGE_SIZE
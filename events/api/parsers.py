@@ -0,0 +1,258 @@
+"""Парсеры HTML страницы с мероприятиями.
+
+Каждый парсер умеет выделить блок с мероприятиями из HTML, представить его
+строкой (для хэша) и за один проход по карточкам получить дату, название и
+ссылку каждого мероприятия, а также разобрать страницу потоково, по частям
+(iter_cards). Быстрый парсер на lxml используется, если библиотека
+установлена, иначе - BeautifulSoup.
+"""
+import codecs
+import logging
+from collections import namedtuple
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+from django.conf import settings
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    etree = None
+
+CONTAINER_CLASS = 'events__container'
+DATE_CLASS = 'event-card__date'
+TITLE_CLASS = 'event-card__title'
+
+# Мета-теги страницы мероприятия с описанием, в порядке приоритета.
+DESCRIPTION_META = (
+    ('property', 'og:description'),
+    ('name', 'description'),
+)
+
+EventCard = namedtuple('EventCard', ('date', 'name', 'href'))
+
+
+# Элементы без закрывающего тега: не меняют глубину вложенности.
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr',
+))
+
+
+class CardStreamParser(HTMLParser):
+    """Потоковый разбор карточек мероприятий на html.parser.
+
+    Парсер не строит дерево: он отслеживает глубину вложенности внутри
+    блока с мероприятиями и складывает готовую карточку в ``cards``, как
+    только закрывается её тег.
+    """
+
+    FIELDS = (('date', DATE_CLASS), ('name', TITLE_CLASS))
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.cards = []
+        self.container_closed = False
+        self.depth = 0
+        self.card = None
+        self.texts = {}
+        self.open_fields = {}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if self.depth == 0:
+            if not self.container_closed and CONTAINER_CLASS in classes:
+                self.depth = 1
+            return
+        if tag in VOID_ELEMENTS:
+            return
+
+        self.depth += 1
+        if self.depth == 2:
+            self.card = {'date': None, 'name': None, 'href': None}
+            self.texts = {}
+        if tag == 'a' and self.card['href'] is None:
+            self.card['href'] = attrs.get('href')
+        for field, class_name in self.FIELDS:
+            if class_name in classes and field not in self.texts:
+                self.texts[field] = []
+                self.open_fields[field] = self.depth
+
+    def handle_endtag(self, tag):
+        if self.depth == 0 or tag in VOID_ELEMENTS:
+            return
+
+        for field, depth in list(self.open_fields.items()):
+            if depth == self.depth:
+                self.card[field] = ''.join(self.texts[field])
+                del self.open_fields[field]
+        if self.depth == 2:
+            if self.card['name'] is not None and self.card['href']:
+                self.cards.append(EventCard(**self.card))
+            self.card = None
+        self.depth -= 1
+        if self.depth == 0:
+            self.container_closed = True
+
+    def handle_data(self, data):
+        for field in self.open_fields:
+            self.texts[field].append(data)
+
+
+class BaseParser:
+    """Общая часть парсеров: потоковый разбор страницы.
+
+    Для потокового разбора используется html.parser без построения
+    дерева: HTML-парсер libxml2 (lxml) в режиме feed буферизует данные и
+    отдаёт элементы с большой задержкой.
+    """
+
+    name = None
+
+    def iter_cards(self, chunks):
+        """Генератор карточек по частям страницы (bytes).
+
+        Карточка возвращается сразу после закрытия её тега, чтение
+        прекращается после закрытия блока с мероприятиями.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        stream = CardStreamParser()
+        for chunk in chunks:
+            stream.feed(decoder.decode(chunk))
+            yield from stream.cards
+            stream.cards.clear()
+            if stream.container_closed:
+                return
+        stream.feed(decoder.decode(b'', final=True))
+        stream.close()
+        yield from stream.cards
+
+
+class SoupParser(BaseParser):
+    """Парсер на BeautifulSoup (html.parser), работает без зависимостей."""
+
+    name = 'soup'
+
+    def get_description(self, html: str):
+        soup = BeautifulSoup(html, 'html.parser')
+        for attr, value in DESCRIPTION_META:
+            meta = soup.find('meta', attrs={attr: value})
+            if meta is not None and meta.get('content'):
+                return meta['content'].strip()
+        return None
+
+    def get_container(self, html: str):
+        soup = BeautifulSoup(html, 'html.parser')
+        return soup.find(class_=CONTAINER_CLASS)
+
+    def serialize(self, container) -> str:
+        return str(container)
+
+    def parse_cards(self, container) -> list:
+        cards = []
+        for event in container.children:
+            if not isinstance(event, Tag):
+                continue
+            date = event.find(class_=DATE_CLASS)
+            name = event.find(class_=TITLE_CLASS)
+            link = event.find('a')
+            if name is None or link is None or not link.get('href'):
+                continue
+            cards.append(EventCard(
+                date.text if date is not None else None,
+                name.text,
+                link.get('href'),
+            ))
+        return cards
+
+
+class LxmlParser(BaseParser):
+    """Парсер на lxml.
+
+    Блок с мероприятиями ищется заранее скомпилированным XPath, а поля
+    каждой карточки собираются за один обход её поддерева.
+    """
+
+    name = 'lxml'
+
+    def __init__(self):
+        self.find_container = etree.XPath(
+            '//*[contains(concat(" ", normalize-space(@class), " "), '
+            f'" {CONTAINER_CLASS} ")][1]'
+        )
+        self.find_descriptions = [
+            etree.XPath(f'//meta[@{attr}="{value}"]/@content')
+            for attr, value in DESCRIPTION_META
+        ]
+
+    def get_description(self, html: str):
+        tree = lxml_html.fromstring(html)
+        for find_description in self.find_descriptions:
+            found = find_description(tree)
+            if found and found[0].strip():
+                return found[0].strip()
+        return None
+
+    def get_container(self, html: str):
+        found = self.find_container(lxml_html.fromstring(html))
+        return found[0] if found else None
+
+    def serialize(self, container) -> str:
+        return etree.tostring(container, encoding='unicode')
+
+    def parse_card(self, event):
+        date = name = href = None
+        for element in event.iter():
+            if href is None and element.tag == 'a':
+                href = element.get('href')
+            classes = element.get('class')
+            if not classes:
+                continue
+            classes = classes.split()
+            if date is None and DATE_CLASS in classes:
+                date = ''.join(element.itertext())
+            elif name is None and TITLE_CLASS in classes:
+                name = ''.join(element.itertext())
+        if name is None or not href:
+            return None
+        return EventCard(date, name, href)
+
+    def parse_cards(self, container) -> list:
+        cards = []
+        for event in container:
+            if not isinstance(event.tag, str):
+                continue
+            card = self.parse_card(event)
+            if card is not None:
+                cards.append(card)
+        return cards
+
+
+PARSERS = {
+    SoupParser.name: SoupParser,
+    LxmlParser.name: LxmlParser,
+}
+
+_parsers = {}
+
+
+def get_parser(name: str = None):
+    """Получение парсера по имени.
+
+    :param name: имя парсера (soup или lxml); по умолчанию берётся из
+    настройки EVENTS_PARSER
+    :type name: str
+
+    :rtype: SoupParser or LxmlParser
+    :return: экземпляр парсера
+    """
+    name = name or settings.EVENTS_PARSER
+    if name == LxmlParser.name and etree is None:
+        logging.warning('lxml не установлен, используется BeautifulSoup')
+        name = SoupParser.name
+    if name not in _parsers:
+        _parsers[name] = PARSERS[name]()
+    return _parsers[name]
@@ -0,0 +1,87 @@
+"""Полнотекстовый поиск мероприятий.
+
+Поисковый вектор (название с весом A, описание с весом B, русская
+морфология) хранится в поле Event.search_vector с GIN-индексом. Вектор
+пересчитывается в БД: синхронизацией - пачкой для добавленных и
+изменённых мероприятий, при сохранении одной записи - сигналом post_save.
+Если по словам ничего не найдено, а в PostgreSQL доступно расширение
+pg_trgm, выполняется нечёткий поиск по триграммам названия (опечатки).
+"""
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Upper
+
+from .models import Event
+
+SEARCH_CONFIG = 'russian'
+
+SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+)
+
+_trigram_available = None
+
+
+def update_search_vectors(queryset) -> int:
+    """Пересчёт поискового вектора одним запросом UPDATE.
+
+    :param queryset: мероприятия, для которых нужно пересчитать вектор
+    :type queryset: QuerySet
+
+    :rtype: int
+    :return: количество обновлённых записей
+    """
+    return queryset.update(search_vector=SEARCH_VECTOR)
+
+
+def trigram_available() -> bool:
+    """Установлено ли в БД расширение pg_trgm.
+
+    Результат проверки запоминается на время работы процесса.
+    """
+    global _trigram_available
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available = cursor.fetchone() is not None
+    return _trigram_available
+
+
+def search_events(text: str, limit: int = None) -> list:
+    """Поиск мероприятий по названию и описанию.
+
+    :param text: поисковый запрос
+    :type text: str
+    :param limit: максимальное количество результатов; по умолчанию из
+    настройки EVENTS_SEARCH_LIMIT
+    :type limit: int
+
+    :rtype: list
+    :return: мероприятия, от наиболее к наименее релевантным
+    """
+    limit = limit or settings.EVENTS_SEARCH_LIMIT
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    events = list(
+        Event.objects.filter(is_active=True, search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', 'date', 'id')[:limit]
+    )
+    if events or not trigram_available():
+        return events
+
+    # Нечёткий поиск: выражение UPPER(name) совпадает с выражением
+    # триграммного индекса event_name_trgm_idx.
+    text = text.upper()
+    return list(
+        Event.objects.filter(is_active=True).annotate(
+            upper_name=Upper('name'),
+            similarity=TrigramSimilarity(Upper('name'), text),
+        )
+        .filter(upper_name__trigram_similar=text)
+        .order_by('-similarity', 'date', 'id')[:limit]
+    )
@@ -1,9 +1,16 @@
 from rest_framework import serializers
 
-from .models import Event
+from .models import Event, EventChange
 
 
 class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
-        fields = ('date', 'name', 'site')
+        fields = ('date', 'name', 'site', 'description')
+
+
+class EventChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EventChange
+        fields = ('id', 'kind', 'date', 'name', 'site', 'previous',
+                  'created_at')
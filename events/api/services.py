@@ -0,0 +1,101 @@
+"""Запросы мероприятий, общие для API и телеграм-бота.
+
+API (EventViewSet и его фильтры) и бот читают мероприятия через эти
+функции. Бот работает в том же Django-проекте, поэтому получает данные
+прямо из БД в виде лёгких кортежей EventItem, без HTTP-запроса к API,
+сериализации в JSON и проверки JWT.
+"""
+import datetime
+from collections import namedtuple
+
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Event, EventChange
+
+EventItem = namedtuple('EventItem', ('date', 'name', 'site'))
+
+# Порядок списка; совпадает с порядком курсорной пагинации API.
+EVENTS_ORDERING = ('date', 'id')
+
+
+def filter_events(queryset, date_from: datetime.date = None,
+                  date_to: datetime.date = None, upcoming: bool = False,
+                  search: str = ''):
+    """Фильтры списка мероприятий.
+
+    :param queryset: исходная выборка мероприятий
+    :type queryset: QuerySet
+    :param date_from: начало периода (включительно)
+    :type date_from: datetime.date
+    :param date_to: конец периода (включительно)
+    :type date_to: datetime.date
+    :param upcoming: только мероприятия начиная с сегодняшнего дня
+    :type upcoming: bool
+    :param search: подстрока в названии без учёта регистра
+    :type search: str
+
+    :rtype: QuerySet
+    :return: отфильтрованная выборка
+    """
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    if upcoming:
+        queryset = queryset.filter(date__gte=timezone.localdate())
+    if search:
+        queryset = queryset.filter(name__icontains=search)
+    return queryset
+
+
+def list_events(**filters) -> list:
+    """Мероприятия в порядке даты одним запросом только нужных столбцов.
+
+    :param filters: параметры filter_events
+    :type filters: dict
+
+    :rtype: list
+    :return: список EventItem
+    """
+    queryset = filter_events(Event.objects.filter(is_active=True), **filters)
+    return [
+        EventItem._make(row)
+        for row in queryset.order_by(*EVENTS_ORDERING).values_list(
+            *EventItem._fields)
+    ]
+
+
+def table_state() -> dict:
+    """Состояние таблицы мероприятий: время последнего изменения и число
+    активных записей.
+
+    Время берётся агрегатом по индексу updated_at, а деактивация и
+    удаление записей меняют их число, поэтому по состоянию видно,
+    изменилась ли таблица.
+
+    :rtype: dict
+    :return: словарь с ключами updated_at (datetime или None) и count
+    """
+    return Event.objects.filter(is_active=True).aggregate(
+        updated_at=Max('updated_at'), count=Count('id'))
+
+
+def changes_since(change_id: int = 0, limit: int = None) -> list:
+    """Записи журнала изменений мероприятий после известной записи.
+
+    Один запрос по первичному ключу журнала: чтобы узнать, что изменилось,
+    не нужно сравнивать таблицу мероприятий со своей копией.
+
+    :param change_id: ID последней известной записи журнала
+    :type change_id: int
+    :param limit: максимальное количество записей
+    :type limit: int
+
+    :rtype: list
+    :return: записи EventChange по возрастанию ID
+    """
+    queryset = EventChange.objects.filter(id__gt=change_id).order_by('id')
+    if limit:
+        queryset = queryset[:limit]
+    return list(queryset)
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import ChangeSet, Event, Task
+from .search import update_search_vectors
+from .tasks import enqueue
+
+
+@receiver(post_save, sender=Event)
+def update_event_search_vector(sender, instance, **kwargs):
+    """Пересчёт поискового вектора после сохранения мероприятия."""
+    update_search_vectors(Event.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ChangeSet)
+def enqueue_email_digest(sender, instance, created, **kwargs):
+    """Дайджест по почте после синхронизации, изменившей мероприятия.
+
+    Задача ставится в той же транзакции, что и ChangeSet; если задача
+    дайджеста уже ждёт в очереди, вторая не нужна: дайджест собирается
+    по данным на момент выполнения.
+    """
+    if created and not Task.objects.filter(
+            name='send_email_digest', status=Task.PENDING).exists():
+        enqueue('send_email_digest')
@@ -0,0 +1,543 @@
+import datetime
+import hashlib
+import itertools
+import logging
+from collections import namedtuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .crawler import fetch_pages
+from .get_data_parsing import (content_hash, get_events_container,
+                               iter_events_website, iter_page_chunks,
+                               open_page, processing_data_website)
+from .models import ChangeSet, Event, EventChange, FetchState
+from .parsers import get_parser
+from .search import update_search_vectors
+
+# Размер пачки для bulk_create/bulk_update.
+BATCH_SIZE = 500
+
+SyncResult = namedtuple('SyncResult', ('created', 'updated', 'deleted'))
+
+
+def normalize_site(site: str) -> str:
+    """Приведение ссылки на мероприятие к единому виду.
+
+    Ссылка является естественным ключом мероприятия, поэтому схема и домен
+    приводятся к нижнему регистру, а якорь (#...) отбрасывается.
+
+    :param site: ссылка на мероприятие
+    :type site: str
+
+    :rtype: str
+    :return: нормализованная ссылка
+    """
+    parts = urlsplit(site.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path, parts.query, ''))
+
+
+def page_url(url: str, number: int) -> str:
+    """Ссылка на страницу пагинации списка мероприятий.
+
+    :param url: ссылка на первую страницу списка
+    :type url: str
+    :param number: номер страницы
+    :type number: int
+
+    :rtype: str
+    :return: ссылка с параметром page
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query['page'] = number
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def listing_urls() -> list:
+    """Страницы со списками мероприятий для синхронизации.
+
+    :rtype: list
+    :return: ссылки из EVENTS_SOURCE_URLS и их страницы пагинации до
+    EVENTS_MAX_PAGES включительно
+    """
+    urls = []
+    for source in settings.EVENTS_SOURCE_URLS:
+        source = source.strip()
+        urls.append(source)
+        for number in range(2, settings.EVENTS_MAX_PAGES + 1):
+            urls.append(page_url(source, number))
+    return urls
+
+
+def prepare_events(data_events: list) -> dict:
+    """Подготовка данных с сайта к сверке с БД.
+
+    Мероприятия без даты пропускаются, дубликаты по ссылке схлопываются
+    (остаётся последнее).
+
+    :param data_events: список словарей с ключами date, name, site и
+    необязательным description
+    :type data_events: list
+
+    :rtype: dict
+    :return: словарь {ссылка: (дата, название, описание или None)}
+    """
+    name_max_length = Event._meta.get_field('name').max_length
+    events = {}
+    for event_data in data_events:
+        try:
+            date = datetime.date.fromisoformat(str(event_data['date']))
+        except ValueError:
+            logging.warning(
+                f'Мероприятие без даты пропущено: {event_data["site"]}')
+            continue
+        site = normalize_site(event_data['site'])
+        events[site] = (date, event_data['name'][:name_max_length],
+                        event_data.get('description'))
+    return events
+
+
+def event_diff(event: Event, **previous) -> dict:
+    """Представление мероприятия для ChangeSet.
+
+    :param event: мероприятие
+    :type event: Event
+    :param previous: прежние значения изменившихся полей
+
+    :rtype: dict
+    :return: словарь с ключами date, name, site и, если переданы прежние
+    значения, previous
+    """
+    diff = {'date': str(event.date), 'name': event.name, 'site': event.site}
+    if previous:
+        diff['previous'] = previous
+    return diff
+
+
+def merge_change_sets(change_sets) -> ChangeSet:
+    """Объединение нескольких изменений в одно.
+
+    Для каждой ссылки сравниваются состояние мероприятия до первого и
+    после последнего изменения: добавленное и затем изменённое
+    мероприятие попадает в добавленные с новыми значениями, добавленное и
+    удалённое - никуда, дважды изменённое - в изменённые с самыми старыми
+    значениями в previous.
+
+    :param change_sets: изменения в порядке синхронизаций
+    :type change_sets: Iterable[ChangeSet]
+
+    :rtype: ChangeSet
+    :return: несохранённая запись с объединёнными изменениями
+    """
+    # ссылка -> [состояние до, состояние после]; None - мероприятия нет.
+    states = {}
+    for change_set in change_sets:
+        for event in change_set.added:
+            states.setdefault(event['site'], [None, None])[1] = event
+        for event in change_set.changed:
+            before = dict(event, **event['previous'])
+            before.pop('previous')
+            states.setdefault(event['site'], [before, None])[1] = event
+        for event in change_set.removed:
+            states.setdefault(event['site'], [event, None])[1] = None
+
+    merged = ChangeSet()
+    for site, (before, after) in states.items():
+        if before is None and after is not None:
+            after = dict(after)
+            after.pop('previous', None)
+            merged.added.append(after)
+        elif before is not None and after is None:
+            merged.removed.append(before)
+        elif before is not None:
+            previous = {
+                field: before[field] for field in ('date', 'name')
+                if before[field] != after[field]
+            }
+            if previous:
+                merged.changed.append(dict(after, previous=previous))
+    return merged
+
+
+def event_hash(date: datetime.date, name: str, description: str) -> str:
+    """Хэш содержимого мероприятия.
+
+    :rtype: str
+    :return: sha256 даты, названия и описания в шестнадцатеричном виде
+    """
+    content = '\x1f'.join((str(date), name, description))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def event_change(event: Event, kind: str, **previous) -> EventChange:
+    """Несохранённая запись журнала изменений мероприятия."""
+    return EventChange(site=event.site, kind=kind, date=event.date,
+                       name=event.name, content_hash=event.content_hash,
+                       previous=previous)
+
+
+def upsert_events(scraped: dict) -> tuple:
+    """Добавление новых, обновление изменившихся и активация вернувшихся
+    на сайт мероприятий.
+
+    Описание обновляется, только если оно было получено со страницы
+    мероприятия (не None). Изменение определяется по хэшу содержимого.
+    Для добавленных и изменённых мероприятий одним запросом
+    пересчитывается поисковый вектор, остальным найденным мероприятиям
+    одним запросом обновляется last_seen.
+
+    :param scraped: словарь {ссылка: (дата, название, описание)}
+    :type scraped: dict
+
+    :rtype: tuple
+    :return: добавленные (и вернувшиеся) и обновлённые мероприятия в виде
+    event_diff и несохранённые записи журнала EventChange; у обновлённых в
+    previous - прежние дата и название, если они изменились (изменение
+    одного описания в уведомления не попадает)
+    """
+    existing = Event.objects.filter(site__in=scraped).only(
+        'id', 'site', 'name', 'date', 'description', 'content_hash',
+        'is_active')
+    existing = {event.site: event for event in existing}
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    unchanged = []
+    added = []
+    changed = []
+    changes = []
+    for site, (date, name, description) in scraped.items():
+        event = existing.get(site)
+        if event is None:
+            event = Event(site=site, name=name, date=date,
+                          description=description or '', first_seen=now,
+                          last_seen=now)
+            event.content_hash = event_hash(date, name, event.description)
+            to_create.append(event)
+            added.append(event_diff(event))
+            changes.append(event_change(event, EventChange.ADDED))
+            continue
+        if description is None:
+            description = event.description
+        content_hash = event_hash(date, name, description)
+        if event.is_active and event.content_hash == content_hash:
+            unchanged.append(event.pk)
+            continue
+        previous = {}
+        if event.date != date:
+            previous['date'] = str(event.date)
+        if event.name != name:
+            previous['name'] = event.name
+        event.date = date
+        event.name = name
+        event.description = description
+        event.content_hash = content_hash
+        event.last_seen = now
+        # bulk_update не заполняет auto_now поля.
+        event.updated_at = now
+        if event.is_active:
+            changed.append(event_diff(event, **previous))
+            changes.append(event_change(event, EventChange.CHANGED,
+                                        **previous))
+        else:
+            # Мероприятие вернулось на сайт.
+            event.is_active = True
+            added.append(event_diff(event))
+            changes.append(event_change(event, EventChange.ADDED))
+        to_update.append(event)
+
+    Event.objects.bulk_create(to_create, batch_size=BATCH_SIZE,
+                              ignore_conflicts=True)
+    Event.objects.bulk_update(
+        to_update, ('date', 'name', 'description', 'content_hash',
+                    'is_active', 'last_seen', 'updated_at'),
+        batch_size=BATCH_SIZE)
+    if unchanged:
+        # updated_at не меняется: содержимое таблицы то же.
+        Event.objects.filter(pk__in=unchanged).update(last_seen=now)
+    if to_create or to_update:
+        update_search_vectors(Event.objects.filter(
+            site__in=[event.site for event in to_create + to_update]))
+    return added, changed, changes
+
+
+def reconcile_events(data_events) -> SyncResult:
+    """Сверка данных с сайта с БД.
+
+    Разница вычисляется в памяти, а изменения применяются несколькими
+    запросами в одной транзакции: для каждой пачки из BATCH_SIZE
+    мероприятий - выборка существующих записей по уникальной ссылке,
+    bulk_create новых и bulk_update изменившихся, в конце - выборка
+    пропавших с сайта и их деактивация (записи не удаляются). Данные можно
+    передавать генератором: пачки сохраняются по мере поступления.
+
+    Если что-то изменилось, в той же транзакции сохраняется ChangeSet со
+    списками добавленных, изменённых и удалённых мероприятий, а в журнал
+    EventChange одним запросом добавляются записи об изменениях.
+
+    :param data_events: словари с ключами date, name, site
+    :type data_events: Iterable[dict]
+
+    :rtype: SyncResult
+    :return: количество созданных, обновлённых и удалённых мероприятий
+    """
+    added = []
+    changed = []
+    changes = []
+    updated = 0
+    seen = set()
+    data_events = iter(data_events)
+
+    with transaction.atomic():
+        while True:
+            batch = list(itertools.islice(data_events, BATCH_SIZE))
+            if not batch:
+                break
+            scraped = prepare_events(batch)
+            scraped = {site: event for site, event in scraped.items()
+                       if site not in seen}
+            seen.update(scraped)
+            batch_added, batch_changed, batch_changes = upsert_events(
+                scraped)
+            added.extend(batch_added)
+            updated += len(batch_changed)
+            changed.extend(event for event in batch_changed
+                           if 'previous' in event)
+            changes.extend(batch_changes)
+
+        if not seen:
+            # Пустой результат парсинга скорее говорит о смене вёрстки
+            # сайта, чем о том, что мероприятий не осталось: таблицу не
+            # трогаем.
+            logging.warning('С сайта не получено ни одного мероприятия')
+            return SyncResult(0, 0, 0)
+        missing = list(
+            Event.objects.filter(is_active=True).exclude(site__in=seen)
+            .only('id', 'date', 'name', 'site', 'content_hash')
+        )
+        removed = [event_diff(event) for event in missing]
+        if missing:
+            Event.objects.filter(pk__in=[event.pk for event in missing]) \
+                .update(is_active=False, updated_at=timezone.now())
+            changes.extend(event_change(event, EventChange.REMOVED)
+                           for event in missing)
+        if added or changed or removed:
+            ChangeSet.objects.create(added=added, changed=changed,
+                                     removed=removed)
+        EventChange.objects.bulk_create(changes, batch_size=BATCH_SIZE)
+
+    return SyncResult(len(added), updated, len(removed))
+
+
+def add_descriptions(data_events: list, parser) -> None:
+    """Загрузка описаний со страниц мероприятий.
+
+    Страницы загружаются параллельно и только для мероприятий, у которых
+    в БД ещё нет описания. Ошибка загрузки одной страницы не прерывает
+    синхронизацию.
+
+    :param data_events: словари с ключами date, name, site; найденное
+    описание записывается в ключ description
+    :type data_events: list
+    :param parser: парсер страниц
+    :type parser: SoupParser or LxmlParser
+    """
+    described = set(
+        Event.objects.filter(
+            site__in=[normalize_site(event['site']) for event in data_events]
+        ).exclude(description='').values_list('site', flat=True)
+    )
+    pending = [event for event in data_events
+               if normalize_site(event['site']) not in described]
+    pages = fetch_pages([(event['site'], '', '') for event in pending],
+                        return_exceptions=True)
+    for event, page in zip(pending, pages):
+        if isinstance(page, Exception):
+            logging.warning(
+                f'Не удалось загрузить {event["site"]}: {page}')
+            continue
+        if page is not None:
+            event['description'] = parser.get_description(page.html)
+
+
+def get_fetch_states(urls: list) -> dict:
+    """Состояния последней загрузки страниц.
+
+    :rtype: dict
+    :return: словарь {ссылка: FetchState}; для новых страниц состояние
+    создаётся, но не сохраняется
+    """
+    states = {state.url: state
+              for state in FetchState.objects.filter(url__in=urls)}
+    for url in urls:
+        states.setdefault(url, FetchState(url=url))
+    return states
+
+
+def sync_pages(urls: list, states: dict, parser, force: bool = False):
+    """Синхронизация по полностью загруженным страницам.
+
+    Страницы загружаются параллельно с условными заголовками. Если все
+    страницы ответили 304 или их блоки с мероприятиями не изменились
+    (совпал хэш), парсинг и сверка с БД не выполняются. Иначе страницы,
+    ответившие 304, загружаются повторно без условий: для сверки нужен
+    полный список мероприятий. Если на одной из страниц не найден блок с
+    мероприятиями, сверка не выполняется.
+
+    :param urls: страницы со списками мероприятий
+    :type urls: list
+    :param states: состояния последней загрузки страниц
+    :type states: dict
+    :param parser: парсер страниц
+    :type parser: SoupParser or LxmlParser
+    :param force: не использовать условные заголовки и хэши
+    :type force: bool
+
+    :rtype: SyncResult or None
+    :return: результат сверки или None, если страницы не изменились или
+    не разобраны
+    """
+    requests = [
+        (url, '', '') if force
+        else (url, states[url].etag, states[url].last_modified)
+        for url in urls
+    ]
+    pages = dict(zip(urls, fetch_pages(requests)))
+
+    containers = {}
+    hashes = {}
+    for url, page in pages.items():
+        if page is None:
+            continue
+        states[url].etag = page.etag
+        states[url].last_modified = page.last_modified
+        containers[url] = get_events_container(page.html, parser)
+        hashes[url] = (content_hash(containers[url], parser)
+                       if containers[url] is not None else '')
+
+    changed = [url for url in hashes
+               if hashes[url] != states[url].content_hash]
+    if not changed and not force:
+        logging.info('Страницы с мероприятиями не изменились')
+        for url in containers:
+            states[url].save()
+        return None
+
+    not_modified = [url for url in urls if url not in containers]
+    if not_modified:
+        refetched = fetch_pages([(url, '', '') for url in not_modified])
+        for url, page in zip(not_modified, refetched):
+            containers[url] = get_events_container(page.html, parser)
+
+    broken = [url for url in urls if containers[url] is None]
+    if broken:
+        # Мероприятия неразобранной страницы иначе считались бы пропавшими
+        # с сайта. Состояния страниц не сохраняются: следующая
+        # синхронизация загрузит их заново.
+        logging.warning(f'Блок с мероприятиями не найден: {broken}, '
+                        f'сверка с БД пропущена')
+        return None
+
+    data_events = []
+    for url in urls:
+        data_events.extend(processing_data_website(containers[url], parser))
+    if settings.EVENTS_FETCH_DETAILS:
+        add_descriptions(data_events, parser)
+
+    with transaction.atomic():
+        result = reconcile_events(data_events)
+        # Хэши сохраняются вместе с данными: если сверка упадёт,
+        # следующая синхронизация не будет пропущена.
+        for url, events_hash in hashes.items():
+            states[url].content_hash = events_hash
+            states[url].save()
+    return result
+
+
+def sync_stream(urls: list, states: dict, parser, force: bool = False):
+    """Потоковая синхронизация.
+
+    Страницы читаются по очереди частями, мероприятия разбираются и
+    сохраняются в БД по мере загрузки. Условные заголовки отправляются,
+    только если страница одна: иначе ответ 304 для одной из страниц не
+    позволил бы получить полный список мероприятий.
+
+    :rtype: SyncResult or None
+    :return: результат сверки или None, если страница не изменилась
+    """
+    first_page = None
+    if len(urls) == 1 and not force:
+        state = states[urls[0]]
+        first_page = open_page(urls[0], state.etag, state.last_modified)
+        if first_page is None:
+            return None
+
+    def iter_events():
+        page = first_page
+        for url in urls:
+            page = page or open_page(url)
+            states[url].etag = page.headers.get('ETag', '')
+            states[url].last_modified = page.headers.get('Last-Modified', '')
+            yield from iter_events_website(iter_page_chunks(page), parser)
+            page = None
+
+    with transaction.atomic():
+        result = reconcile_events(iter_events())
+        for url in urls:
+            # Хэш блока в потоковом режиме не считается; старый хэш
+            # сбрасывается, чтобы не пропустить следующую синхронизацию.
+            states[url].content_hash = ''
+            states[url].save()
+    return result
+
+
+def sync_events(force: bool = False, stream: bool = None):
+    """Синхронизация таблицы мероприятий с сайтом.
+
+    Загружаются все страницы из listing_urls(). Если данные на сайте не
+    изменились (ответ 304 или совпадение хэша блока с мероприятиями),
+    парсинг и сверка с БД не выполняются.
+
+    В потоковом режиме страницы разбираются по мере загрузки, а сверка с
+    БД начинается до окончания загрузки. Хэш блока в этом режиме не
+    считается, поэтому пропустить синхронизацию можно только по ответу 304.
+
+    :param force: игнорировать сохранённое состояние и синхронизировать
+    в любом случае
+    :type force: bool
+    :param stream: потоковый режим; по умолчанию из настройки
+    EVENTS_SYNC_STREAMING
+    :type stream: bool
+
+    Если таблица изменилась, увеличивается номер версии данных: ответы
+    API из кэша перестают использоваться.
+
+    :rtype: SyncResult or None
+    :return: количество созданных, обновлённых и удалённых мероприятий или
+    None, если данные на сайте не изменились
+    """
+    logging.info('Синхронизация мероприятий запущена')
+    if stream is None:
+        stream = settings.EVENTS_SYNC_STREAMING
+    parser = get_parser()
+    urls = listing_urls()
+    states = get_fetch_states(urls)
+
+    if stream:
+        result = sync_stream(urls, states, parser, force)
+    else:
+        result = sync_pages(urls, states, parser, force)
+    if result is None:
+        return None
+    if any(result):
+        bump_data_version()
+
+    logging.info(f'Синхронизация завершена: добавлено {result.created}, '
+                 f'обновлено {result.updated}, удалено {result.deleted}')
+    return result
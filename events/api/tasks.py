@@ -0,0 +1,214 @@
+"""Очередь фоновых задач в БД.
+
+Медленная работа (отправка писем, синхронизация с сайтом) не
+выполняется в потоке запроса: enqueue() сохраняет задачу в таблицу Task
+(в той же транзакции, что и вызвавшее её изменение), а воркеры команды
+``python manage.py worker`` забирают и выполняют задачи. Пропускная
+способность растёт с числом воркеров: задача захватывается запросом
+SELECT ... FOR UPDATE SKIP LOCKED, и воркеры не ждут друг друга. Пока
+задача выполняется, воркер продлевает срок её захвата; результат
+сохраняется, только если задачу не захватил заново другой воркер.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .digests import build_digest, send_digest
+from .models import Task
+from .sync import sync_events
+
+# Имя задачи -> функция.
+TASKS = {}
+
+
+def task(func):
+    """Декоратор: функция становится задачей очереди с именем функции."""
+    TASKS[func.__name__] = func
+    return func
+
+
+@task
+def send_post_message():
+    """Письмо с новыми мероприятиями."""
+    subject = 'Письмо с новыми мероприятиями'
+    from_email = os.getenv('EMAIL_HOST_USER')
+    message = ('Здравствуйте! Приглашаем вас на наше мероприятие'
+               'Будем рады видеть вас там!')
+    recipient_list = [os.getenv('EMAIL_HOST_USER'), ]
+    msg_html = render_to_string('email.html',
+                                {'title': subject,
+                                 'message': message})
+
+    send_mail(subject, message, from_email, recipient_list,
+              fail_silently=False, html_message=msg_html)
+
+
+@task
+def sync_events_task(force: bool = False, stream: bool = None):
+    """Синхронизация мероприятий с сайтом."""
+    sync_events(force, stream)
+
+
+@task
+def send_email_digest():
+    """Дайджест предстоящих мероприятий подписчикам рассылки."""
+    send_digest(build_digest())
+
+
+def enqueue(name: str, run_at: datetime.datetime = None, **kwargs) -> Task:
+    """Постановка задачи в очередь.
+
+    :param name: имя задачи из TASKS
+    :type name: str
+    :param run_at: время, раньше которого задачу не выполнять
+    :type run_at: datetime.datetime
+    :param kwargs: параметры задачи (должны сериализоваться в JSON)
+
+    :rtype: Task
+    :return: сохранённая задача
+    """
+    if name not in TASKS:
+        raise ValueError(f'Неизвестная задача: {name}')
+    return Task.objects.create(
+        name=name,
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=settings.TASKS_MAX_ATTEMPTS,
+    )
+
+
+def claim_task():
+    """Захват следующей готовой к выполнению задачи.
+
+    Готова задача в очереди, время которой пришло, или задача, воркер
+    которой не уложился в срок захвата (например, остановился).
+    Заблокированные другими воркерами строки пропускаются.
+
+    :rtype: Task or None
+    :return: захваченная задача или None, если очередь пуста
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        task = (
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Task.PENDING, run_at__lte=now)
+                    | Q(status=Task.RUNNING, locked_until__lt=now))
+            .order_by('run_at')
+            .first()
+        )
+        if task is None:
+            return None
+        task.status = Task.RUNNING
+        task.attempts += 1
+        task.locked_until = now + datetime.timedelta(
+            seconds=settings.TASKS_LEASE)
+        task.save(update_fields=('status', 'attempts', 'locked_until'))
+    return task
+
+
+def renew_lease(task: Task, stop: threading.Event) -> None:
+    """Продление захвата выполняющейся задачи (в отдельном потоке).
+
+    Срок продлевается каждую треть TASKS_LEASE, пока не установлен stop,
+    и только пока задачу не захватил заново другой воркер.
+    """
+    try:
+        while not stop.wait(settings.TASKS_LEASE / 3):
+            Task.objects.filter(
+                pk=task.pk, status=Task.RUNNING, attempts=task.attempts,
+            ).update(locked_until=timezone.now() + datetime.timedelta(
+                seconds=settings.TASKS_LEASE))
+    finally:
+        connection.close()
+
+
+def finish_task(task: Task, **fields) -> bool:
+    """Сохранение результата задачи.
+
+    Условный UPDATE по номеру попытки: если срок захвата истёк и задачу
+    выполняет другой воркер, его результат не перезаписывается.
+
+    :rtype: bool
+    :return: True, если результат сохранён
+    """
+    for field, value in fields.items():
+        setattr(task, field, value)
+    saved = Task.objects.filter(
+        pk=task.pk, attempts=task.attempts).update(**fields)
+    if not saved:
+        logging.warning(f'Задача {task.pk} {task.name} захвачена другим '
+                        f'воркером, результат попытки {task.attempts} '
+                        f'не сохранён')
+    return bool(saved)
+
+
+def run_task(task: Task) -> bool:
+    """Выполнение захваченной задачи.
+
+    При ошибке задача возвращается в очередь с задержкой
+    TASKS_BACKOFF * 2 ** (попытка - 1); после max_attempts попыток она
+    получает статус dead.
+
+    :param task: задача
+    :type task: Task
+
+    :rtype: bool
+    :return: True, если задача выполнена
+    """
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=renew_lease, args=(task, stop),
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        TASKS[task.name](**task.kwargs)
+    except Exception as error:
+        logging.exception(f'Ошибка задачи {task.pk} {task.name}: {error}')
+        fields = {'last_error': traceback.format_exc(),
+                  'locked_until': None}
+        if task.attempts >= task.max_attempts:
+            fields.update(status=Task.DEAD, finished_at=timezone.now())
+        else:
+            fields.update(
+                status=Task.PENDING,
+                run_at=timezone.now() + datetime.timedelta(
+                    seconds=settings.TASKS_BACKOFF * 2 ** (
+                        task.attempts - 1)))
+        finish_task(task, **fields)
+        return False
+    finally:
+        stop.set()
+        heartbeat.join()
+    finish_task(task, status=Task.DONE, locked_until=None,
+                finished_at=timezone.now())
+    return True
+
+
+def work(once: bool = False) -> int:
+    """Цикл воркера: захват и выполнение задач.
+
+    :param once: выполнить готовые задачи и завершиться
+    :type once: bool
+
+    :rtype: int
+    :return: количество выполненных задач (в режиме once)
+    """
+    done = 0
+    while True:
+        close_old_connections()
+        task = claim_task()
+        if task is None:
+            if once:
+                return done
+            time.sleep(settings.TASKS_POLL_INTERVAL)
+            continue
+        done += run_task(task)
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+from api.crawler import Crawler, HostRateLimiter, Page, fetch_pages
+from django.test import SimpleTestCase
+
+
+class CrawlerTest(SimpleTestCase):
+    def crawler(self, handler, **kwargs):
+        kwargs.setdefault('rate', 0)
+        kwargs.setdefault('backoff', 0)
+        return Crawler(transport=httpx.MockTransport(handler), **kwargs)
+
+    def test_fetch_pages_keeps_order(self):
+        """Страницы возвращаются в порядке запросов."""
+        def handler(request):
+            return httpx.Response(200, text=request.url.path,
+                                  headers={'ETag': '"e"'})
+
+        urls = [f'https://example.com/{number}' for number in range(20)]
+        pages = fetch_pages([(url, '', '') for url in urls],
+                            crawler=self.crawler(handler))
+        self.assertEqual([page.html for page in pages],
+                         [f'/{number}' for number in range(20)])
+        self.assertEqual(pages[0], Page('/0', '"e"', ''))
+
+    def test_concurrency_is_bounded(self):
+        """Одновременно выполняется не больше concurrency запросов."""
+        active = []
+        peak = []
+
+        async def handler(request):
+            active.append(request)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.remove(request)
+            return httpx.Response(200, text='')
+
+        fetch_pages([(f'https://example.com/{number}', '', '')
+                     for number in range(12)],
+                    crawler=self.crawler(handler, concurrency=3))
+        self.assertEqual(max(peak), 3)
+
+    def test_conditional_request(self):
+        """ETag передаётся в запросе, ответ 304 превращается в None."""
+        def handler(request):
+            self.assertEqual(request.headers['If-None-Match'], '"v1"')
+            return httpx.Response(304)
+
+        pages = fetch_pages([('https://example.com/', '"v1"', '')],
+                            crawler=self.crawler(handler))
+        self.assertEqual(pages, [None])
+
+    def test_retry(self):
+        """Ответы 5xx и сетевые ошибки повторяются."""
+        responses = [httpx.ConnectError('error'), httpx.Response(503),
+                     httpx.Response(200, text='ok')]
+
+        def handler(request):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        pages = fetch_pages([('https://example.com/', '', '')],
+                            crawler=self.crawler(handler, retries=2))
+        self.assertEqual(pages[0].html, 'ok')
+
+    def test_retry_limit(self):
+        """После исчерпания повторов возвращается ошибка."""
+        def handler(request):
+            return httpx.Response(500)
+
+        pages = fetch_pages([('https://example.com/', '', '')],
+                            return_exceptions=True,
+                            crawler=self.crawler(handler, retries=1))
+        self.assertIsInstance(pages[0], httpx.HTTPStatusError)
+
+    def test_host_rate_limiter(self):
+        """Запросы к одному хосту разнесены во времени."""
+        limiter = HostRateLimiter(rate=100)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for _ in range(4):
+                await limiter.wait('example.com')
+            await limiter.wait('example.org')
+            return loop.time() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.03)
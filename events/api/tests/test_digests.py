@@ -0,0 +1,136 @@
+import datetime
+import tempfile
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+
+from api.digests import DigestNotDelivered, build_digest, send_digest
+from api.models import ChangeSet, EmailDigest, EmailSubscriber, Event, Task
+from api.tasks import claim_task, run_task
+from django.core import mail
+from django.core.mail import get_connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.'
+                                 'EmailBackend')
+@mock.patch.dict('os.environ', EMAIL_HOST_USER='events@example.com')
+class EmailDigestTest(TestCase):
+    def setUp(self):
+        Event.objects.create(
+            name='Митап по Python',
+            date=timezone.localdate() + datetime.timedelta(days=1),
+            site='https://events.yandex.ru/events/1')
+        EmailSubscriber.objects.bulk_create(
+            EmailSubscriber(email=f'user{number}@example.com')
+            for number in range(5))
+        EmailSubscriber.objects.create(email='old@example.com',
+                                       is_active=False)
+
+    def test_digest_is_rendered_once_per_version(self):
+        """Дайджест одной версии данных не рендерится повторно."""
+        digest = build_digest()
+        self.assertIn('Митап по Python', digest.text)
+        self.assertIn('https://events.yandex.ru/events/1', digest.html)
+        with mock.patch('api.digests.render_to_string') as render:
+            self.assertEqual(build_digest().pk, digest.pk)
+        render.assert_not_called()
+
+        Event.objects.create(
+            name='Хакатон', date=timezone.localdate(),
+            site='https://events.yandex.ru/events/2')
+        self.assertNotEqual(build_digest().pk, digest.pk)
+
+    def test_send_in_batches_over_one_connection(self):
+        """Письма отправляются пачками через одно соединение только
+        активным подписчикам."""
+        connection = get_connection()
+        with mock.patch.object(connection, 'open') as open_connection, \
+                mock.patch.object(connection, 'close') as close_connection:
+            result = send_digest(build_digest(), batch_size=2,
+                                 connection=connection)
+        self.assertEqual(result, 5)
+        open_connection.assert_called_once()
+        close_connection.assert_called_once()
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f'user{number}@example.com' for number in range(5)])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        digest = EmailDigest.objects.get()
+        self.assertEqual((digest.sent, digest.failed), (5, 0))
+        self.assertEqual(
+            EmailSubscriber.objects.filter(last_digest=digest).count(), 5)
+
+    def test_failed_recipient_is_retried(self):
+        """Недоставленное письмо записывается подписчику и отправляется
+        при повторе; доставленные не отправляются снова."""
+        connection = get_connection()
+        send_messages = connection.send_messages
+
+        def refuse_first(messages):
+            if messages[0].to == ['user0@example.com']:
+                raise ConnectionError('Ящик недоступен')
+            return send_messages(messages)
+
+        digest = build_digest()
+        with mock.patch.object(connection, 'send_messages',
+                               side_effect=refuse_first):
+            with self.assertRaises(DigestNotDelivered):
+                send_digest(digest, connection=connection)
+        digest.refresh_from_db()
+        self.assertEqual((digest.sent, digest.failed), (4, 1))
+        subscriber = EmailSubscriber.objects.get(email='user0@example.com')
+        self.assertIsNone(subscriber.last_digest)
+        self.assertIn('Ящик недоступен', subscriber.last_error)
+
+        mail.outbox.clear()
+        self.assertEqual(send_digest(digest), 1)
+        self.assertEqual(mail.outbox[0].to, ['user0@example.com'])
+        subscriber.refresh_from_db()
+        self.assertEqual((subscriber.last_digest, subscriber.last_error),
+                         (digest, ''))
+
+    def test_reconnect_after_disconnect(self):
+        """После разрыва соединения оно открывается заново, письмо
+        отправляется повторно, остальные письма доставляются."""
+        connection = get_connection()
+        send_messages = connection.send_messages
+        disconnects = [SMTPServerDisconnected('Слишком много писем')]
+
+        def disconnect_once(messages):
+            if disconnects:
+                raise disconnects.pop()
+            return send_messages(messages)
+
+        with mock.patch.object(connection, 'send_messages',
+                               side_effect=disconnect_once), \
+                mock.patch.object(connection, 'open') as open_connection:
+            result = send_digest(build_digest(), connection=connection)
+        self.assertEqual(result, 5)
+        self.assertEqual(open_connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_digest_is_enqueued_after_changes(self):
+        """Изменения после синхронизации ставят одну задачу дайджеста;
+        недоставленный дайджест - ошибка задачи, она повторяется."""
+        ChangeSet.objects.create(added=[{'date': '2023-12-05',
+                                         'name': 'Митап', 'site': 'a'}])
+        ChangeSet.objects.create()
+        task = Task.objects.get(name='send_email_digest')
+        with mock.patch('api.tasks.send_digest',
+                        side_effect=DigestNotDelivered('1 подписчик')):
+            self.assertFalse(run_task(claim_task()))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.PENDING)
+        self.assertIn('1 подписчик', task.last_error)
+
+    def test_file_backend(self):
+        """Дайджест сохраняется в файлы backend'ом filebased."""
+        with tempfile.TemporaryDirectory() as path:
+            connection = get_connection(
+                'django.core.mail.backends.filebased.EmailBackend',
+                file_path=path)
+            result = send_digest(build_digest(), connection=connection)
+            self.assertEqual(result, 5)
+            with open(connection._fname) as file:
+                self.assertIn('Митап по Python', file.read())
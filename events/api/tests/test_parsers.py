@@ -0,0 +1,97 @@
+import os
+
+from api.get_data_parsing import content_hash, processing_data_website
+from api.parsers import LxmlParser, SoupParser, get_parser
+from django.test import SimpleTestCase
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def iter_chunks(html, size=64):
+    data = html.encode('utf-8')
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as file:
+        return file.read()
+
+
+class ParsersTest(SimpleTestCase):
+    parsers = (SoupParser(), LxmlParser())
+
+    def test_parsers_return_same_cards(self):
+        """Оба парсера одинаково разбирают сохранённые страницы."""
+        for fixture in ('events_page.html', 'events_page_pretty.html'):
+            html = read_fixture(fixture)
+            soup, lxml = (
+                parser.parse_cards(parser.get_container(html))
+                for parser in self.parsers
+            )
+            with self.subTest(fixture=fixture):
+                self.assertTrue(soup)
+                self.assertEqual(soup, lxml)
+
+    def test_processing_data_website(self):
+        """Дата, название и ссылка выделяются из карточек."""
+        html = read_fixture('events_page_pretty.html')
+        for parser in self.parsers:
+            data_events = processing_data_website(
+                parser.get_container(html), parser)
+            with self.subTest(parser=parser.name):
+                self.assertEqual(
+                    [(event['name'], event['site']) for event in data_events],
+                    [
+                        ('Python Meetup',
+                         'https://events.yandex.ru/events/python-meetup'),
+                        ('Go Conf', 'https://events.yandex.ru/events/go-conf'),
+                        ('Frontend Conf',
+                         'https://yandex.ru/promo/frontend-conf'),
+                    ],
+                )
+                self.assertTrue(data_events[0]['date'].endswith('-12-05'))
+                self.assertEqual(data_events[1]['date'], 'None')
+
+    def test_content_hash_is_stable(self):
+        """Хэш блока не зависит от повторного парсинга страницы."""
+        html = read_fixture('events_page.html')
+        for parser in self.parsers:
+            with self.subTest(parser=parser.name):
+                self.assertEqual(
+                    content_hash(parser.get_container(html), parser),
+                    content_hash(parser.get_container(html), parser),
+                )
+
+    def test_get_parser(self):
+        """Парсер выбирается по имени и кэшируется."""
+        self.assertIsInstance(get_parser('soup'), SoupParser)
+        self.assertIs(get_parser('lxml'), get_parser('lxml'))
+
+    def test_iter_cards_matches_parse_cards(self):
+        """Потоковый разбор даёт те же карточки, что и разбор дерева."""
+        for fixture in ('events_page.html', 'events_page_pretty.html'):
+            html = read_fixture(fixture)
+            for parser in self.parsers:
+                with self.subTest(fixture=fixture, parser=parser.name):
+                    self.assertEqual(
+                        list(parser.iter_cards(iter_chunks(html, 7))),
+                        parser.parse_cards(parser.get_container(html)),
+                    )
+
+    def test_iter_cards_is_incremental(self):
+        """Карточка возвращается до того, как страница загружена целиком."""
+        html = read_fixture('events_page.html')
+        total = len(list(iter_chunks(html)))
+        for parser in self.parsers:
+            consumed = []
+
+            def chunks():
+                for chunk in iter_chunks(html):
+                    consumed.append(chunk)
+                    yield chunk
+
+            with self.subTest(parser=parser.name):
+                first = next(parser.iter_cards(chunks()))
+                self.assertEqual(first.name, 'Python Meetup')
+                self.assertLess(len(consumed), total)
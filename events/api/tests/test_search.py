@@ -0,0 +1,61 @@
+from api import search
+from api.models import Event
+from api.search import search_events, trigram_available
+from api.sync import reconcile_events
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+
+class SearchEventsTest(TestCase):
+    def setUp(self):
+        Event.objects.create(
+            date='2023-12-05', name='Конференция Python-разработчиков',
+            site='https://events.yandex.ru/events/python')
+        Event.objects.create(
+            date='2023-12-06', name='Встреча Go',
+            description='Доклады о конкурентности и профилировании',
+            site='https://events.yandex.ru/events/go')
+
+    def names(self, text):
+        return [event.name for event in search_events(text)]
+
+    def test_search_uses_russian_stemming(self):
+        """Слова находятся в других словоформах."""
+        self.assertEqual(self.names('конференции разработчика'),
+                         ['Конференция Python-разработчиков'])
+
+    def test_search_by_description(self):
+        """Поиск идёт и по описанию мероприятия."""
+        self.assertEqual(self.names('доклад'), ['Встреча Go'])
+
+    def test_sync_updates_search_vector(self):
+        """Синхронизация пересчитывает вектор изменённых мероприятий."""
+        reconcile_events([{
+            'date': '2023-12-06',
+            'name': 'Митап по Rust',
+            'site': 'https://events.yandex.ru/events/go',
+        }])
+        self.assertEqual(self.names('митапы'), ['Митап по Rust'])
+        self.assertEqual(self.names('встреча'), [])
+
+    def test_search_falls_back_to_trigrams(self):
+        """Запрос с опечаткой находится по триграммам."""
+        search._trigram_available = None
+        if not trigram_available():
+            self.skipTest('Расширение pg_trgm не установлено')
+        self.assertEqual(self.names('Конференцыя'),
+                         ['Конференция Python-разработчиков'])
+
+    def test_search_endpoint(self):
+        """Эндпоинт /events/search/ возвращает найденные мероприятия."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='user'))
+        response = client.get('/api/v1/events/search/', {'q': 'встречи'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['name'] for event in response.json()],
+                         ['Встреча Go'])
+        self.assertEqual(
+            client.get('/api/v1/events/search/').status_code, 400)
@@ -0,0 +1,446 @@
+import datetime
+import io
+import os
+from contextlib import contextmanager
+from unittest import mock
+
+from api.cache import bump_data_version
+from api.crawler import Page
+from api.get_data_parsing import (EVENTS_URL, content_hash,
+                                  get_events_container, open_page)
+from api.models import ChangeSet, Event, EventChange, FetchState
+from api.services import changes_since
+from api.sync import (SyncResult, event_hash, merge_change_sets, page_url,
+                      reconcile_events, sync_events)
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+FIXTURE_PAGE = os.path.join(
+    os.path.dirname(__file__), 'fixtures', 'events_page.html')
+
+DATA_EVENTS = [
+    {
+        'date': '2023-12-05',
+        'name': 'Мероприятие 1',
+        'site': 'https://events.yandex.ru/events/first',
+    },
+    {
+        'date': '2023-12-06',
+        'name': 'Мероприятие 2',
+        'site': 'https://events.yandex.ru/events/second',
+    },
+]
+
+
+class SyncEventsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(FIXTURE_PAGE, encoding='utf-8') as file:
+            cls.html = file.read()
+
+    def test_sync_saves_events(self):
+        """Синхронизация сохраняет мероприятия с сайта в БД."""
+        with mock.patch('api.sync.fetch_pages',
+                        return_value=[Page(self.html, '"v1"', '')]):
+            result = sync_events()
+        self.assertEqual(result.created, 5)
+        self.assertIn('Python Meetup',
+                      Event.objects.values_list('name', flat=True))
+        self.assertEqual(FetchState.objects.get().etag, '"v1"')
+
+    def test_sync_deactivates_missing_events(self):
+        """Мероприятия, пропавшие с сайта, становятся неактивными."""
+        Event.objects.create(**DATA_EVENTS[1])
+        with mock.patch('api.sync.fetch_pages',
+                        return_value=[Page(self.html, '', '')]):
+            result = sync_events()
+        self.assertEqual(result.deleted, 1)
+        self.assertFalse(
+            Event.objects.get(site=DATA_EVENTS[1]['site']).is_active)
+
+    def test_sync_sends_conditional_headers(self):
+        """Сохранённые ETag и Last-Modified передаются в запросе."""
+        FetchState.objects.create(url=EVENTS_URL, etag='"v1"',
+                                  last_modified='Tue, 05 Dec 2023 10:00:00')
+        with mock.patch('api.sync.fetch_pages', return_value=[None]) as fetch:
+            self.assertIsNone(sync_events())
+        fetch.assert_called_once_with(
+            [(EVENTS_URL, '"v1"', 'Tue, 05 Dec 2023 10:00:00')])
+
+    @mock.patch('api.sync.processing_data_website')
+    def test_sync_skips_unchanged_content(self, parsing):
+        """При совпадении хэша блока мероприятий парсинг не выполняется."""
+        events_hash = content_hash(get_events_container(self.html))
+        FetchState.objects.create(url=EVENTS_URL, content_hash=events_hash)
+        with mock.patch('api.sync.fetch_pages',
+                        return_value=[Page(self.html, '"v2"', '')]):
+            self.assertIsNone(sync_events())
+        parsing.assert_not_called()
+        self.assertEqual(FetchState.objects.get().etag, '"v2"')
+
+    def test_sync_stream(self):
+        """В потоковом режиме страница разбирается по мере чтения."""
+        Event.objects.create(**DATA_EVENTS[1])
+        page = io.BytesIO(self.html.encode('utf-8'))
+        page.headers = {'ETag': '"v3"'}
+        with mock.patch('api.sync.open_page', return_value=page):
+            result = sync_events(stream=True)
+        self.assertEqual(result, SyncResult(created=5, updated=0, deleted=1))
+        state = FetchState.objects.get()
+        self.assertEqual((state.etag, state.content_hash), ('"v3"', ''))
+
+    @override_settings(EVENTS_CRAWL_TIMEOUT=5)
+    def test_open_page_has_timeout(self):
+        """Потоковая загрузка страницы ограничена таймаутом."""
+        with mock.patch('api.get_data_parsing.urlopen') as urlopen:
+            open_page(EVENTS_URL, etag='"v1"')
+        self.assertEqual(urlopen.call_args.kwargs['timeout'], 5)
+        self.assertEqual(urlopen.call_args.args[0].get_header('If-none-match'),
+                         '"v1"')
+
+    @override_settings(EVENTS_MAX_PAGES=2)
+    def test_sync_refetches_not_modified_pages(self):
+        """Если изменилась одна страница, остальные загружаются заново."""
+        second_page = page_url(EVENTS_URL, 2)
+        FetchState.objects.create(url=second_page, etag='"p2"')
+        empty_page = Page('<div class="events__container"></div>', '', '')
+        with mock.patch('api.sync.fetch_pages', side_effect=[
+            [Page(self.html, '', ''), None],
+            [empty_page],
+        ]) as fetch:
+            result = sync_events()
+        self.assertEqual(result.created, 5)
+        self.assertEqual(fetch.call_args_list[1],
+                         mock.call([(second_page, '', '')]))
+
+    @override_settings(EVENTS_MAX_PAGES=2)
+    def test_sync_skips_reconcile_if_page_is_not_parsed(self):
+        """Если одна из страниц не разобрана, мероприятия не считаются
+        пропавшими и хэши страниц не сохраняются."""
+        Event.objects.create(**DATA_EVENTS[1])
+        broken_page = Page('<html>Технические работы</html>', '"p2"', '')
+        with mock.patch('api.sync.fetch_pages',
+                        return_value=[Page(self.html, '"p1"', ''),
+                                      broken_page]):
+            self.assertIsNone(sync_events())
+        self.assertEqual(list(Event.objects.values_list('site', 'is_active')),
+                         [(DATA_EVENTS[1]['site'], True)])
+        self.assertFalse(ChangeSet.objects.exists())
+        self.assertFalse(FetchState.objects.exists())
+
+    @override_settings(EVENTS_FETCH_DETAILS=True)
+    def test_sync_fetches_descriptions(self):
+        """Описание берётся со страницы мероприятия."""
+        detail = Page('<meta property="og:description" content="Доклады">',
+                      '', '')
+
+        def fetch_pages(requests, return_exceptions=False):
+            if requests[0][0] == EVENTS_URL:
+                return [Page(self.html, '', '')]
+            return [detail] + [ValueError()] * (len(requests) - 1)
+
+        with mock.patch('api.sync.fetch_pages', side_effect=fetch_pages):
+            sync_events()
+        event = Event.objects.get(
+            site='https://events.yandex.ru/events/python-meetup')
+        self.assertEqual(event.description, 'Доклады')
+
+
+class EventListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(username='user'))
+
+    @contextmanager
+    def assertOnlyCacheQueries(self):
+        """Запросы выполняются только к общему кэшу в БД."""
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        cache_table = settings.CACHES['default']['LOCATION']
+        self.assertEqual(
+            [query['sql'] for query in queries
+             if f'"{cache_table}"' not in query['sql']], [])
+
+    @mock.patch('api.get_data_parsing.site_parsing')
+    def test_list_does_not_parse_site(self, parsing):
+        """Список мероприятий читается из БД без обращения к сайту."""
+        Event.objects.create(**DATA_EVENTS[0])
+        response = self.client.get('/api/v1/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        parsing.assert_not_called()
+
+    def test_list_hides_inactive_events(self):
+        """Неактивные мероприятия в список не попадают."""
+        Event.objects.create(**DATA_EVENTS[0])
+        Event.objects.create(**DATA_EVENTS[1], is_active=False)
+        response = self.client.get('/api/v1/events/')
+        self.assertEqual(
+            [event['site'] for event in response.json()['results']],
+            [DATA_EVENTS[0]['site']])
+
+    def test_list_is_served_from_cache(self):
+        """Повторный запрос списка не обращается к таблицам данных."""
+        Event.objects.create(**DATA_EVENTS[0])
+        first = self.client.get('/api/v1/events/')
+        with self.assertOnlyCacheQueries():
+            second = self.client.get('/api/v1/events/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    def test_sync_invalidates_cached_list(self):
+        """После синхронизации список читается заново."""
+        Event.objects.create(**DATA_EVENTS[0])
+        self.client.get('/api/v1/events/')
+        with open(FIXTURE_PAGE, encoding='utf-8') as file:
+            page = Page(file.read(), '', '')
+        with mock.patch('api.sync.fetch_pages', return_value=[page]):
+            sync_events()
+        response = self.client.get('/api/v1/events/')
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_list_not_modified(self):
+        """Условный запрос с актуальным ETag получает пустой ответ 304."""
+        Event.objects.create(**DATA_EVENTS[0])
+        etag = self.client.get('/api/v1/events/')['ETag']
+        with self.assertOnlyCacheQueries():
+            response = self.client.get('/api/v1/events/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(EVENTS_CHANGES_LIMIT=1)
+    def test_changes_endpoint(self):
+        """Эндпоинт /events/changes/ отдаёт записи журнала после известной
+        записи, не больше EVENTS_CHANGES_LIMIT."""
+        reconcile_events(DATA_EVENTS)
+        response = self.client.get('/api/v1/events/changes/')
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        self.assertEqual(
+            [(change['kind'], change['site']) for change in first],
+            [(EventChange.ADDED, DATA_EVENTS[0]['site'])])
+        response = self.client.get('/api/v1/events/changes/',
+                                   {'since': first[0]['id']})
+        self.assertEqual([change['site'] for change in response.json()],
+                         [DATA_EVENTS[1]['site']])
+        self.assertEqual(self.client.get('/api/v1/events/changes/',
+                                         {'since': 'last'}).status_code, 400)
+
+    def test_list_etag_changes_with_data(self):
+        """После изменения мероприятия ETag меняется."""
+        event = Event.objects.create(**DATA_EVENTS[0])
+        first = self.client.get('/api/v1/events/')
+        reconcile_events([dict(DATA_EVENTS[0], name='Новое название')])
+        bump_data_version()
+        response = self.client.get('/api/v1/events/',
+                                   HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        updated_at = event.updated_at
+        event.refresh_from_db()
+        self.assertGreater(event.updated_at, updated_at)
+        self.assertEqual(response.json()['results'][0]['name'],
+                         'Новое название')
+
+    def test_list_is_paginated_by_date(self):
+        """Список отдаётся по страницам в порядке дат."""
+        Event.objects.bulk_create(
+            Event(date=datetime.date(2023, 12, 1) + datetime.timedelta(day),
+                  name=f'Мероприятие {day}',
+                  site=f'https://events.yandex.ru/events/{day}')
+            for day in range(5, 0, -1)
+        )
+        names = []
+        url = '/api/v1/events/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            names.extend(event['name'] for event in page['results'])
+            url = page['next']
+        self.assertEqual(names, [f'Мероприятие {day}' for day in range(1, 6)])
+
+    def test_list_filters(self):
+        """Список фильтруется по периоду, предстоящим датам и названию."""
+        today = timezone.localdate()
+        Event.objects.create(date=today - datetime.timedelta(days=1),
+                             name='Python прошедший',
+                             site='https://events.yandex.ru/events/past')
+        Event.objects.create(date=today, name='Go сегодня',
+                             site='https://events.yandex.ru/events/today')
+        Event.objects.create(date=today + datetime.timedelta(days=10),
+                             name='Python будущий',
+                             site='https://events.yandex.ru/events/future')
+        cases = (
+            ({'upcoming': 'true'}, ['Go сегодня', 'Python будущий']),
+            ({'search': 'python'}, ['Python прошедший', 'Python будущий']),
+            ({'date_from': str(today), 'date_to': str(today)},
+             ['Go сегодня']),
+        )
+        for params, expected in cases:
+            with self.subTest(params=params):
+                response = self.client.get('/api/v1/events/', params)
+                self.assertEqual(
+                    [event['name'] for event in response.json()['results']],
+                    expected,
+                )
+
+    def test_list_rejects_invalid_date(self):
+        """Некорректная дата в фильтре - ошибка 400."""
+        response = self.client.get('/api/v1/events/', {'date_from': 'вчера'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReconcileEventsTest(TestCase):
+    def test_reconcile_updates_changed_events(self):
+        """Изменившиеся мероприятия обновляются по ссылке, а не дублируются."""
+        Event.objects.create(date='2023-12-01', name='Старое название',
+                             site=DATA_EVENTS[0]['site'])
+        result = reconcile_events(DATA_EVENTS)
+        self.assertEqual(result, SyncResult(created=1, updated=1, deleted=0))
+        event = Event.objects.get(site=DATA_EVENTS[0]['site'])
+        self.assertEqual(event.name, 'Мероприятие 1')
+        self.assertEqual(str(event.date), '2023-12-05')
+
+    def test_reconcile_publishes_change_set(self):
+        """Сверка сохраняет добавленные, изменённые и удалённые мероприятия."""
+        Event.objects.create(date='2023-12-01', name='Старое название',
+                             site=DATA_EVENTS[0]['site'])
+        Event.objects.create(date='2023-12-07', name='Отменённое',
+                             site='https://events.yandex.ru/events/old')
+        reconcile_events(DATA_EVENTS)
+        change_set = ChangeSet.objects.get()
+        self.assertEqual(change_set.added, [DATA_EVENTS[1]])
+        self.assertEqual(change_set.changed, [dict(
+            DATA_EVENTS[0],
+            previous={'date': '2023-12-01', 'name': 'Старое название'},
+        )])
+        self.assertEqual([event['name'] for event in change_set.removed],
+                         ['Отменённое'])
+        self.assertIsNone(change_set.delivered_at)
+
+    def test_reconcile_without_changes_publishes_nothing(self):
+        """Если ничего не изменилось, ChangeSet не создаётся."""
+        reconcile_events(DATA_EVENTS)
+        reconcile_events(DATA_EVENTS)
+        self.assertEqual(ChangeSet.objects.count(), 1)
+
+    def test_reconcile_query_count_does_not_depend_on_events(self):
+        """Сверка выполняется фиксированным числом запросов."""
+        data_events = [
+            {
+                'date': '2023-12-05',
+                'name': f'Мероприятие {number}',
+                'site': f'https://events.yandex.ru/events/{number}',
+            }
+            for number in range(100)
+        ]
+        # savepoint, выборка, bulk_create, поисковый вектор, выборка
+        # пропавших, ChangeSet и задача дайджеста (проверка и вставка),
+        # журнал EventChange, release savepoint
+        with self.assertNumQueries(10):
+            reconcile_events(data_events)
+        self.assertEqual(Event.objects.count(), 100)
+
+    def test_reconcile_normalizes_site(self):
+        """Ссылки с разным регистром домена и якорем считаются одной."""
+        reconcile_events([
+            dict(DATA_EVENTS[0], site='HTTPS://Events.Yandex.ru/events/a#x'),
+            dict(DATA_EVENTS[0], site='https://events.yandex.ru/events/a'),
+        ])
+        self.assertEqual(
+            list(Event.objects.values_list('site', flat=True)),
+            ['https://events.yandex.ru/events/a'],
+        )
+
+    def test_reconcile_keeps_history(self):
+        """Пропавшее мероприятие не удаляется, вернувшееся активируется;
+        изменения записываются в журнал."""
+        reconcile_events(DATA_EVENTS)
+        first_seen = Event.objects.get(site=DATA_EVENTS[1]['site']).first_seen
+        reconcile_events(DATA_EVENTS[:1])
+        self.assertEqual(list(Event.objects.filter(is_active=True)
+                              .values_list('site', flat=True)),
+                         [DATA_EVENTS[0]['site']])
+
+        last_change = changes_since()[-1].pk
+        result = reconcile_events(DATA_EVENTS)
+        self.assertEqual(result, SyncResult(created=1, updated=0, deleted=0))
+        event = Event.objects.get(site=DATA_EVENTS[1]['site'])
+        self.assertTrue(event.is_active)
+        self.assertEqual(event.first_seen, first_seen)
+        self.assertGreater(event.last_seen, first_seen)
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(ChangeSet.objects.last().added, [DATA_EVENTS[1]])
+
+        self.assertEqual(
+            [(change.kind, change.site) for change in changes_since()],
+            [(EventChange.ADDED, DATA_EVENTS[0]['site']),
+             (EventChange.ADDED, DATA_EVENTS[1]['site']),
+             (EventChange.REMOVED, DATA_EVENTS[1]['site']),
+             (EventChange.ADDED, DATA_EVENTS[1]['site'])])
+        self.assertEqual(len(changes_since(last_change)), 1)
+
+    def test_reconcile_detects_changes_by_hash(self):
+        """Изменение определяется по хэшу содержимого, в том числе
+        изменение одного описания."""
+        reconcile_events(DATA_EVENTS)
+        event = Event.objects.get(site=DATA_EVENTS[0]['site'])
+        self.assertEqual(event.content_hash, event_hash(
+            event.date, event.name, event.description))
+        result = reconcile_events([dict(DATA_EVENTS[0], description='Доклады'),
+                                   DATA_EVENTS[1]])
+        self.assertEqual(result, SyncResult(created=0, updated=1, deleted=0))
+        change = changes_since()[-1]
+        self.assertEqual((change.kind, change.previous),
+                         (EventChange.CHANGED, {}))
+        self.assertEqual(ChangeSet.objects.count(), 1)
+
+    def test_reconcile_skips_events_without_date(self):
+        """Пустой результат парсинга не очищает таблицу."""
+        Event.objects.create(**DATA_EVENTS[0])
+        result = reconcile_events([dict(DATA_EVENTS[1], date='None')])
+        self.assertEqual(result, SyncResult(0, 0, 0))
+        self.assertEqual(Event.objects.count(), 1)
+
+
+class MergeChangeSetsTest(TestCase):
+    def test_merge_change_sets(self):
+        """Несколько изменений объединяются в одно по каждой ссылке."""
+        first, second = DATA_EVENTS
+        old = {'date': '2023-12-07', 'name': 'Отменённое',
+               'site': 'https://events.yandex.ru/events/old'}
+        merged = merge_change_sets([
+            ChangeSet(added=[first, second],
+                      changed=[dict(old, previous={'name': 'Ещё старее'})]),
+            ChangeSet(changed=[dict(first, name='Новое',
+                                    previous={'name': first['name']})],
+                      removed=[second]),
+            ChangeSet(changed=[dict(old, name='Старое',
+                                    previous={'name': old['name']})]),
+        ])
+        self.assertEqual(merged.added, [dict(first, name='Новое')])
+        self.assertEqual(merged.changed, [dict(
+            old, name='Старое', previous={'name': 'Ещё старее'})])
+        self.assertEqual(merged.removed, [])
+
+    def test_merge_reverted_change(self):
+        """Изменение, вернувшее прежние значения, не попадает в итог."""
+        first = DATA_EVENTS[0]
+        merged = merge_change_sets([
+            ChangeSet(changed=[dict(first, name='Новое',
+                                    previous={'name': first['name']})]),
+            ChangeSet(changed=[dict(first, previous={'name': 'Новое'})]),
+        ])
+        self.assertEqual((merged.added, merged.changed, merged.removed),
+                         ([], [], []))
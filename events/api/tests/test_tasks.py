@@ -0,0 +1,91 @@
+import datetime
+import time
+from unittest import mock
+
+from api import tasks
+from api.models import Task
+from api.tasks import claim_task, enqueue, run_task
+from api.views import email_post_message
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+
+@override_settings(TASKS_BACKOFF=10, TASKS_MAX_ATTEMPTS=2,
+                   EMAIL_BACKEND='django.core.mail.backends.locmem.'
+                                 'EmailBackend')
+class TaskQueueTest(TestCase):
+    @mock.patch.dict('os.environ', EMAIL_HOST_USER='events@example.com')
+    def test_email_is_sent_by_worker(self):
+        """Письмо ставится в очередь и отправляется воркером."""
+        email_post_message()
+        self.assertEqual(len(mail.outbox), 0)
+        # Соединение теста открыто в транзакции, воркер его не закрывает.
+        with mock.patch.object(tasks, 'close_old_connections'):
+            call_command('worker', '--once', stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_claimed_task_is_not_claimed_again(self):
+        """Захваченную задачу не забирает другой воркер, пока не истёк
+        срок захвата."""
+        enqueue('send_post_message')
+        task = claim_task()
+        self.assertEqual((task.status, task.attempts), (Task.RUNNING, 1))
+        self.assertIsNone(claim_task())
+        Task.objects.update(
+            locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(claim_task().pk, task.pk)
+
+    def test_failed_task_is_retried_then_dead(self):
+        """Упавшая задача повторяется с задержкой, затем - dead."""
+        enqueue('send_post_message')
+        with mock.patch.dict(tasks.TASKS, send_post_message=mock.Mock(
+                side_effect=ConnectionError('SMTP недоступен'))):
+            self.assertFalse(run_task(claim_task()))
+            task = Task.objects.get()
+            self.assertEqual(task.status, Task.PENDING)
+            self.assertGreater(task.run_at, timezone.now())
+            self.assertIn('SMTP недоступен', task.last_error)
+            self.assertIsNone(claim_task())
+
+            Task.objects.update(run_at=timezone.now())
+            self.assertFalse(run_task(claim_task()))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DEAD)
+        self.assertIsNone(claim_task())
+
+    def test_stale_worker_does_not_overwrite_result(self):
+        """Результат воркера, чью задачу захватили заново, не
+        сохраняется."""
+        enqueue('send_post_message')
+        stale = claim_task()
+        Task.objects.update(
+            locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        claim_task()
+        with mock.patch.dict(tasks.TASKS, send_post_message=mock.Mock()):
+            run_task(stale)
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.RUNNING, 2))
+
+    def test_unknown_task(self):
+        with self.assertRaises(ValueError):
+            enqueue('unknown')
+
+
+class TaskLeaseTest(TransactionTestCase):
+    @override_settings(TASKS_LEASE=0.3)
+    def test_lease_is_renewed_while_running(self):
+        """Пока задача выполняется, другой воркер её не захватывает."""
+        enqueue('send_post_message')
+        claimed = []
+
+        def slow_task():
+            time.sleep(0.5)
+            claimed.append(claim_task())
+
+        with mock.patch.dict(tasks.TASKS, send_post_message=slow_task):
+            self.assertTrue(run_task(claim_task()))
+        self.assertEqual(claimed, [None])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
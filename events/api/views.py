@@ -1,74 +1,124 @@
-import os
-
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from dotenv import load_dotenv
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from .get_data_parsing import processing_data_website
+from .cache import (bump_data_version, get_data_version, get_list_response,
+                    get_table_state, set_list_response)
+from .filters import TRUE_VALUES, EventFilterBackend
 from .models import Event
+from .pagination import EventCursorPagination
 from .permissions import AdminOnly, ReadOnly
-from .serializers import EventSerializer
-
-load_dotenv()
+from .search import search_events
+from .serializers import EventChangeSerializer, EventSerializer
+from .services import changes_since
+from .tasks import enqueue
 
 
 def email_post_message():
-    subject = 'Письмо с новыми мероприятиями'
-    from_email = os.getenv('EMAIL_HOST_USER')
-    message = ('Здравствуйте! Приглашаем вас на наше мероприятие'
-               'Будем рады видеть вас там!')
-    recipient_list = [os.getenv('EMAIL_HOST_USER'), ]
-    msg_html = render_to_string('email.html',
-                                {'title': subject,
-                                 'message': message})
-
-    send_mail(subject, message, from_email, recipient_list,
-              fail_silently=False, html_message=msg_html)
+    """Письмо с новыми мероприятиями отправляется воркером очереди."""
+    return enqueue('send_post_message')
 
 
 class EventViewSet(ModelViewSet):
-    queryset = Event.objects.all()
+    """Мероприятия.
+
+    Данные читаются только из БД. Таблица обновляется фоновой
+    синхронизацией (команда ``python manage.py sync_events``). Список
+    отдаётся по страницам (курсорная пагинация по дате) и фильтруется
+    параметрами date_from, date_to, upcoming и search.
+
+    Готовый JSON списка хранится в кэше под номером версии данных, поэтому
+    повторные запросы обслуживаются без обращения к БД и сериализатору.
+    Список отдаётся с ETag и Last-Modified; на условный запрос с
+    неизменившимися данными возвращается пустой ответ 304.
+    """
+    queryset = Event.objects.filter(is_active=True)
     serializer_class = EventSerializer
+    pagination_class = EventCursorPagination
+    filter_backends = (EventFilterBackend,)
 
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
             return [ReadOnly()]
         return [AdminOnly()]
 
-    def delete_missing_events(self):
-        """Получаем названия мероприятий, которых больше нет на сайте с
-        мероприятиями, но есть в БД.
-        """
-        events_db = self.queryset
-        events_website = processing_data_website()
-
-        events_db_name = set(event.name for event in events_db)
-        events_website_name = set(
-            event_data['name'].text for event_data in events_website
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        version = get_data_version()
+        state = get_table_state(version)
+        # Список с upcoming меняется со сменой дня, поэтому дата входит в
+        # ETag, а Last-Modified для такого списка не отдаётся.
+        upcoming = request.query_params.get('upcoming', '').lower()
+        upcoming = upcoming in TRUE_VALUES
+        updated_at = state['updated_at']
+        etag = '"{}-{}-{}-{}"'.format(
+            state['count'],
+            f'{updated_at.timestamp():.6f}' if updated_at else '',
+            timezone.localdate().isoformat(),
+            renderer.format,
         )
-        missing_events_names = events_db_name - events_website_name
+        last_modified = None
+        if updated_at is not None and not upcoming:
+            last_modified = int(updated_at.timestamp())
 
-        Event.objects.filter(name__in=missing_events_names).delete()
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.render_list(request, renderer, version,
+                                        *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
 
-        return 0
+    def render_list(self, request, renderer, version, *args, **kwargs):
+        """Ответ со списком: JSON берётся из кэша, остальные форматы
+        (browsable API) строятся заново."""
+        if renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        content = get_list_response(request.query_params, version)
+        if content is None:
+            response = super().list(request, *args, **kwargs)
+            content = renderer.render(response.data)
+            set_list_response(request.query_params, content, version)
+        return HttpResponse(content, content_type=renderer.media_type)
 
-    def list(self, request, *args, **kwargs):
-        """Получаем данные после парсинга и добавляем (или обновляем)
-        данных в БД.
-        """
-        data_from_the_site = processing_data_website()
-        for event_data in data_from_the_site:
-            name = event_data['name'].text
-            site = event_data['site']
-            date = event_data['date']
-
-            obj, created = Event.objects.get_or_create(name=name,
-                                                       site=site,
-                                                       date=date)
-            if not created:
-                setattr(obj, 'site', site)
-                obj.save()
-        self.delete_missing_events()
-        return super().list(request)
+    @action(detail=False, pagination_class=None, filter_backends=())
+    def search(self, request):
+        """Полнотекстовый поиск по названию и описанию (параметр q)."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'Укажите поисковый запрос.'})
+        serializer = self.get_serializer(search_events(text), many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, pagination_class=None, filter_backends=())
+    def changes(self, request):
+        """Записи журнала изменений после известной записи (параметр
+        since - ID последней полученной записи), не больше
+        EVENTS_CHANGES_LIMIT."""
+        since = request.query_params.get('since', '0')
+        if not since.isdigit():
+            raise ValidationError({'since': 'Укажите ID записи журнала.'})
+        changes = changes_since(int(since), settings.EVENTS_CHANGES_LIMIT)
+        return Response(EventChangeSerializer(changes, many=True).data)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        transaction.on_commit(bump_data_version)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        transaction.on_commit(bump_data_version)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        transaction.on_commit(bump_data_version)
@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'djoser',
     'api.apps.ApiConfig',
@@ -74,7 +75,10 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Соединения переиспользуются (бот держит по соединению на поток
+        # пула БД); 0 - новое соединение на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
     }
 }
 
@@ -109,6 +113,16 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Кэш готовых ответов API. Синхронизация и API работают в разных
+# процессах, поэтому по умолчанию кэш общий - в БД (таблица создаётся
+# командой createcachetable при запуске контейнера API).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'events_cache'),
+    }
+}
 
 LANGUAGE_CODE = os.getenv('LANGUAGE_CODE', 'en-us')
 TIME_ZONE = os.getenv('TIME_ZONE', 'UTC')
@@ -125,9 +139,51 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+EVENTS_SYNC_PERIOD = int(os.getenv('EVENTS_SYNC_PERIOD', 1800))
+# Парсер страницы с мероприятиями: lxml (быстрый) или soup (BeautifulSoup).
+EVENTS_PARSER = os.getenv('EVENTS_PARSER', 'lxml')
+# Потоковый разбор страницы с мероприятиями по мере её загрузки.
+EVENTS_SYNC_STREAMING = os.getenv('EVENTS_SYNC_STREAMING', '').lower() == 'true'
+# Страницы со списками мероприятий (например, страницы городов) и число
+# страниц пагинации (?page=N), загружаемых с каждой из них.
+EVENTS_SOURCE_URLS = os.getenv('EVENTS_SOURCE_URLS', 'https://events.yandex.ru/').split(',')
+EVENTS_MAX_PAGES = int(os.getenv('EVENTS_MAX_PAGES', 1))
+# Загружать страницы мероприятий, чтобы получить описание.
+EVENTS_FETCH_DETAILS = os.getenv('EVENTS_FETCH_DETAILS', '').lower() == 'true'
+EVENTS_CRAWL_CONCURRENCY = int(os.getenv('EVENTS_CRAWL_CONCURRENCY', 10))
+EVENTS_CRAWL_RATE = float(os.getenv('EVENTS_CRAWL_RATE', 5))
+EVENTS_CRAWL_RETRIES = int(os.getenv('EVENTS_CRAWL_RETRIES', 3))
+EVENTS_CRAWL_BACKOFF = float(os.getenv('EVENTS_CRAWL_BACKOFF', 1))
+EVENTS_CRAWL_TIMEOUT = float(os.getenv('EVENTS_CRAWL_TIMEOUT', 10))
+# Время жизни ответа API со списком мероприятий в кэше, в секундах.
+EVENTS_LIST_CACHE_TIMEOUT = int(os.getenv('EVENTS_LIST_CACHE_TIMEOUT', 3600))
+# Размер страницы списка мероприятий в API по умолчанию и максимальный.
+EVENTS_PAGE_SIZE = int(os.getenv('EVENTS_PAGE_SIZE', 50))
+EVENTS_MAX_PAGE_SIZE = int(os.getenv('EVENTS_MAX_PAGE_SIZE', 500))
+# Максимальное количество результатов полнотекстового поиска.
+EVENTS_SEARCH_LIMIT = int(os.getenv('EVENTS_SEARCH_LIMIT', 20))
+# Максимальное количество записей журнала изменений в одном ответе API.
+EVENTS_CHANGES_LIMIT = int(os.getenv('EVENTS_CHANGES_LIMIT', 500))
+
+# Очередь фоновых задач (api/tasks.py): число воркеров команды worker,
+# попыток выполнения, начальная задержка повтора и срок захвата задачи
+# в секундах, интервал опроса пустой очереди.
+TASKS_WORKERS = int(os.getenv('TASKS_WORKERS', 1))
+TASKS_MAX_ATTEMPTS = int(os.getenv('TASKS_MAX_ATTEMPTS', 5))
+TASKS_BACKOFF = float(os.getenv('TASKS_BACKOFF', 30))
+TASKS_LEASE = int(os.getenv('TASKS_LEASE', 600))
+TASKS_POLL_INTERVAL = float(os.getenv('TASKS_POLL_INTERVAL', 1))
+
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL')
+# Backend можно заменить, например, на locmem или filebased для проверки.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', EMAIL_BACKEND)
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH',
+                            os.path.join(BASE_DIR, 'sent_emails'))
+# Количество писем дайджеста, отправляемых между сохранениями состояния.
+EMAIL_DIGEST_BATCH_SIZE = int(os.getenv('EMAIL_DIGEST_BATCH_SIZE', 100))
@@ -1,7 +1,8 @@
+from api.models import ChangeSet
 from django.contrib import admin
 
 from .forms import ProfileForm
-from .models import Profile, Subscription
+from .models import Broadcast, Profile, Subscription
 
 
 @admin.register(Profile)
@@ -12,4 +13,20 @@ class ProfileAdmin(admin.ModelAdmin):
 
 @admin.register(Subscription)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'profile', 'subscription', 'created_at')
+    list_display = ('id', 'profile', 'subscription', 'created_at',
+                    'last_delivered_version')
+
+    def save_model(self, request, obj, form, change):
+        # Как и команда подписки: включённая подписка получает только
+        # изменения после включения.
+        if obj.subscription and 'subscription' in form.changed_data:
+            latest = ChangeSet.objects.order_by('-pk').first()
+            obj.last_delivered_version = latest.pk if latest else 0
+            obj.rejected_count = 0
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'change_set', 'from_version', 'sent', 'failed',
+                    'last_profile_id', 'created_at', 'finished_at')
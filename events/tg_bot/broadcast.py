@@ -0,0 +1,344 @@
+"""Рассылка сообщений подписчикам с соблюдением лимитов Telegram.
+
+Telegram допускает около 30 сообщений в секунду на бота и одно сообщение
+в секунду в один чат. Сообщения отправляются параллельно (не больше
+BROADCAST_WORKERS одновременно), общий ограничитель частоты не даёт
+превысить лимиты, при ответе RetryAfter пауза выдерживается всеми
+отправками, сетевые ошибки повторяются с экспоненциальной задержкой.
+Прогресс сохраняется в Broadcast после каждой пачки подписчиков.
+"""
+import asyncio
+import datetime
+import logging
+import os
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from telegram.error import (BadRequest, ChatMigrated, Forbidden, NetworkError,
+                            RetryAfter)
+from tg_bot.db import run_db
+from tg_bot.matching import SubscriptionIndex, subset
+from tg_bot.models import Broadcast, Subscription
+
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_CHAT_INTERVAL = float(os.getenv('BROADCAST_CHAT_INTERVAL', 1))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 8))
+BROADCAST_RETRIES = int(os.getenv('BROADCAST_RETRIES', 3))
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', 200))
+# Срок захвата рассылки процессом бота, продлевается после каждой пачки.
+BROADCAST_LEASE = int(os.getenv('BROADCAST_LEASE', 60))
+# Ответы BadRequest, вызванные самим сообщением, а не чатом.
+MESSAGE_ERRORS = ('message is too long', "can't parse entities",
+                  'message text is empty')
+# Сколько рассылок подряд подписчику может быть отклонено сообщение, прежде
+# чем его версия будет пропущена.
+BROADCAST_MAX_REJECTS = int(os.getenv('BROADCAST_MAX_REJECTS', 3))
+
+
+def claim_broadcast(broadcast) -> bool:
+    """Захват рассылки процессом бота.
+
+    Условный UPDATE выполняется атомарно, поэтому при нескольких процессах
+    рассылку захватывает ровно один; если он остановится, после
+    BROADCAST_LEASE секунд рассылку продолжит другой.
+
+    :param broadcast: рассылка
+    :type broadcast: tg_bot.models.Broadcast
+
+    :rtype: bool
+    :return: True, если рассылка захвачена этим процессом
+    """
+    now = timezone.now()
+    locked_until = now + datetime.timedelta(seconds=BROADCAST_LEASE)
+    claimed = Broadcast.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        pk=broadcast.pk,
+    ).update(locked_until=locked_until)
+    if claimed:
+        broadcast.locked_until = locked_until
+        broadcast.refresh_from_db(
+            fields=('last_profile_id', 'sent', 'failed'))
+    return bool(claimed)
+
+
+class RateLimiter:
+    """Ограничение частоты отправки.
+
+    Между двумя отправками проходит не меньше 1 / rate секунд, между
+    отправками в один чат - не меньше chat_interval. pause()
+    приостанавливает все отправки (ответ RetryAfter). Время отправки
+    резервируется синхронно, поэтому блокировка в цикле событий не нужна.
+    """
+
+    def __init__(self, rate: float, chat_interval: float = 0):
+        self.interval = 1 / rate if rate else 0
+        self.chat_interval = chat_interval
+        self.next_time = 0
+        self.chat_next_time = {}
+
+    async def wait(self, chat_id: int):
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_time, self.chat_next_time.get(chat_id, 0))
+        self.next_time = start + self.interval
+        if self.chat_interval:
+            self.chat_next_time[chat_id] = start + self.chat_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def pause(self, seconds: float):
+        self.next_time = max(
+            self.next_time, asyncio.get_running_loop().time() + seconds)
+
+
+Recipient = namedtuple('Recipient', ('profile_id', 'chat_id', 'keywords',
+                                     'date_from', 'date_to'))
+
+
+class BroadcastSender:
+    """Отправка сообщения подписчикам.
+
+    Подписчикам без фильтров отправляется общий текст рассылки.
+    Подписчикам с фильтрами - только подходящие им изменения из
+    broadcast.diff (см. tg_bot.matching): индекс фильтров строится и
+    подборки подбираются один раз на рассылку (по фильтрам на её начало),
+    текст рендерится функцией render один раз на каждую различную
+    подборку; если ничего не подошло, сообщение не отправляется. Текст
+    делится на страницы функцией split (Telegram не принимает сообщения
+    длиннее 4096 символов).
+
+    Если Telegram отклонил само сообщение (а не чат) до первой
+    доставленной страницы, версия подписчика не меняется: изменения
+    придут ему, объединённые с новыми, со следующей рассылкой (завершённая
+    рассылка не повторяется). После BROADCAST_MAX_REJECTS таких отказов
+    подряд версия пропускается. Если часть страниц уже доставлена, отказ
+    считается недоставкой: повтор отправил бы их снова.
+
+    :param send: корутина отправки send(chat_id, text)
+    :param rate: максимум сообщений в секунду
+    :param workers: максимум одновременных отправок
+    :param retries: количество повторов при сетевой ошибке
+    :param backoff: начальная задержка перед повтором, в секундах
+    :param batch_size: размер пачки подписчиков между сохранениями
+    прогресса
+    :param render: функция render(change_set) -> str для подписчиков с
+    фильтрами
+    :param split: функция split(text) -> list, делящая текст на страницы
+    """
+
+    def __init__(self, send, rate: float = BROADCAST_RATE,
+                 workers: int = BROADCAST_WORKERS,
+                 retries: int = BROADCAST_RETRIES, backoff: float = 1,
+                 batch_size: int = BROADCAST_BATCH_SIZE,
+                 chat_interval: float = BROADCAST_CHAT_INTERVAL,
+                 render=None, split=None):
+        self.send = send
+        self.render = render
+        self.split = split
+        # Подборки текущей рассылки: ID чата -> позиции изменений,
+        # позиции изменений -> текст.
+        self.positions = {}
+        self.rendered = {}
+        self.limiter = RateLimiter(rate, chat_interval)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+
+    async def send_one(self, semaphore, chat_id: int, text: str):
+        """Отправка сообщения (всех его страниц) с повторами.
+
+        :rtype: bool or None
+        :return: True, если сообщение доставлено, False, если не доставлено
+        из-за чата, None, если Telegram отклонил само сообщение
+        """
+        pages = self.split(text) if self.split else [text]
+        for number, page in enumerate(pages):
+            delivered = await self.send_page(semaphore, chat_id, page)
+            if delivered is None and number:
+                return False
+            if not delivered:
+                return delivered
+        return True
+
+    async def send_page(self, semaphore, chat_id: int, text: str):
+        """Отправка одной страницы сообщения с повторами (см. send_one)."""
+        attempt = 0
+        while True:
+            await self.limiter.wait(chat_id)
+            try:
+                async with semaphore:
+                    await self.send(chat_id, text)
+                return True
+            except RetryAfter as error:
+                # Лимит превышен: ждут все отправки, попытка не тратится.
+                logging.warning(f'RetryAfter {error.retry_after} с')
+                self.limiter.pause(error.retry_after)
+                continue
+            except (Forbidden, BadRequest, ChatMigrated) as error:
+                if (isinstance(error, BadRequest) and any(
+                        message in str(error).lower()
+                        for message in MESSAGE_ERRORS)):
+                    logging.error(f'Сообщение в чат {chat_id} отклонено: '
+                                  f'{error}')
+                    return None
+                # Бот заблокирован, чат не найден и т.п.: повтор не поможет.
+                logging.warning(f'Сообщение в чат {chat_id} не '
+                                f'доставлено: {error}')
+                return False
+            except NetworkError as error:
+                if attempt >= self.retries:
+                    logging.error(f'Сообщение в чат {chat_id} не '
+                                  f'доставлено: {error}')
+                    return False
+                delay = self.backoff * 2 ** attempt
+                attempt += 1
+                logging.warning(f'Ошибка отправки в чат {chat_id}: {error}, '
+                                f'повтор через {delay} с')
+                await asyncio.sleep(delay)
+
+    def recipients(self, broadcast) -> list:
+        """Следующая пачка получателей рассылки.
+
+        Получатели - активные подписчики с доставленной версией
+        broadcast.from_version после профиля broadcast.last_profile_id.
+        Один запрос по частичному индексу активных подписок
+        (subscription_active_idx); выбираются только ID и фильтры.
+
+        :rtype: list
+        :return: список Recipient по возрастанию ID профиля
+        """
+        return [
+            Recipient._make(row)
+            for row in Subscription.objects.filter(
+                subscription=True,
+                last_delivered_version=broadcast.from_version,
+                profile_id__gt=broadcast.last_profile_id,
+            ).order_by('profile_id').values_list(
+                'profile_id', 'profile__external_id', 'keywords',
+                'date_from', 'date_to')[:self.batch_size]
+        ]
+
+    def filters(self, broadcast) -> list:
+        """Фильтры оставшихся получателей рассылки, у которых они заданы.
+
+        :rtype: list
+        :return: список кортежей (ID чата, слова, начало, конец периода)
+        """
+        return list(Subscription.objects.filter(
+            Q(keywords__len__gt=0) | Q(date_from__isnull=False)
+            | Q(date_to__isnull=False),
+            subscription=True,
+            last_delivered_version=broadcast.from_version,
+            profile_id__gt=broadcast.last_profile_id,
+        ).values_list('profile__external_id', 'keywords', 'date_from',
+                      'date_to'))
+
+    def match(self, broadcast, filters: list) -> None:
+        """Подбор изменений подписчикам с фильтрами на всю рассылку.
+
+        :param broadcast: рассылка с изменениями в broadcast.diff
+        :type broadcast: tg_bot.models.Broadcast
+        :param filters: фильтры получателей (см. filters)
+        :type filters: list
+        """
+        index = SubscriptionIndex()
+        for chat_id, keywords, date_from, date_to in filters:
+            index.add(chat_id, keywords, date_from, date_to)
+        self.positions = index.match_positions(broadcast.diff) if index else {}
+
+    def texts(self, broadcast, recipients: list) -> dict:
+        """Тексты сообщений для пачки получателей.
+
+        :rtype: dict
+        :return: словарь {ID чата: текст}; получателей, которым ничего не
+        подошло, в нём нет
+        """
+        diff = getattr(broadcast, 'diff', None)
+        texts = {}
+        for recipient in recipients:
+            if (diff is None or self.render is None or not (
+                    recipient.keywords or recipient.date_from
+                    or recipient.date_to)):
+                texts[recipient.chat_id] = broadcast.text
+                continue
+            positions = self.positions.get(recipient.chat_id)
+            if positions is None:
+                continue
+            if positions not in self.rendered:
+                self.rendered[positions] = self.render(
+                    subset(diff, positions))
+            texts[recipient.chat_id] = self.rendered[positions]
+        return texts
+
+    @staticmethod
+    def save_progress(broadcast, profile_ids: list,
+                      rejected_ids: list = ()) -> None:
+        """Сохранение прогресса после пачки одной транзакцией.
+
+        Получателям пачки (в том числе тем, кому сообщение не доставлено
+        из-за чата) записывается версия рассылки, чтобы не отправлять им её
+        снова. Получателям, которым сообщение отклонено, увеличивается
+        счётчик отказов; на BROADCAST_MAX_REJECTS-м отказе версия тоже
+        записывается.
+        """
+        with transaction.atomic():
+            Subscription.objects.filter(
+                profile_id__in=profile_ids,
+                last_delivered_version=broadcast.from_version,
+            ).update(last_delivered_version=broadcast.change_set_id,
+                     rejected_count=0)
+            if rejected_ids:
+                rejected = Subscription.objects.filter(
+                    profile_id__in=rejected_ids,
+                    last_delivered_version=broadcast.from_version,
+                )
+                skipped = rejected.filter(
+                    rejected_count__gte=BROADCAST_MAX_REJECTS - 1,
+                ).update(last_delivered_version=broadcast.change_set_id,
+                         rejected_count=0)
+                if skipped:
+                    logging.error(f'Рассылка {broadcast.pk}: версия '
+                                  f'пропущена для {skipped} подписчиков '
+                                  f'после {BROADCAST_MAX_REJECTS} отказов')
+                rejected.update(rejected_count=F('rejected_count') + 1)
+            broadcast.save(update_fields=(
+                'sent', 'failed', 'last_profile_id', 'locked_until'))
+
+    async def run(self, broadcast) -> None:
+        """Рассылка (или её продолжение) всем подписчикам.
+
+        :param broadcast: рассылка
+        :type broadcast: tg_bot.models.Broadcast
+        """
+        semaphore = asyncio.Semaphore(self.workers)
+        self.positions = {}
+        self.rendered = {}
+        if getattr(broadcast, 'diff', None) is not None and self.render:
+            self.match(broadcast, await run_db(self.filters, broadcast))
+        while True:
+            recipients = await run_db(self.recipients, broadcast)
+            if not recipients:
+                break
+            texts = self.texts(broadcast, recipients)
+            results = dict(zip(texts, await asyncio.gather(*(
+                self.send_one(semaphore, chat_id, text)
+                for chat_id, text in texts.items()
+            ))))
+            sent = sum(result is True for result in results.values())
+            broadcast.sent += sent
+            broadcast.failed += len(results) - sent
+            broadcast.last_profile_id = recipients[-1].profile_id
+            broadcast.locked_until = timezone.now() + datetime.timedelta(
+                seconds=BROADCAST_LEASE)
+            rejected = {recipient.profile_id for recipient in recipients
+                        if results.get(recipient.chat_id, False) is None}
+            await run_db(self.save_progress, broadcast, [
+                recipient.profile_id for recipient in recipients
+                if recipient.profile_id not in rejected
+            ], list(rejected))
+        broadcast.finished_at = timezone.now()
+        await run_db(broadcast.save, update_fields=('finished_at',))
+        logging.info(f'Рассылка {broadcast.pk} завершена: отправлено '
+                     f'{broadcast.sent}, не доставлено {broadcast.failed}')
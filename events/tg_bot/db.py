@@ -0,0 +1,64 @@
+"""Доступ к ORM из асинхронного кода бота.
+
+ORM Django синхронный, поэтому запросы выполняются в отдельном пуле
+потоков фиксированного размера (BOT_DB_THREADS): цикл событий не
+блокируется, а число соединений с БД не растёт с числом чатов. У каждого
+потока пула своё постоянное соединение; оно закрывается перед вызовом,
+только если истёк срок CONN_MAX_AGE или соединение стало непригодным.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connections
+
+BOT_DB_THREADS = int(os.getenv('BOT_DB_THREADS', 4))
+
+executor = ThreadPoolExecutor(max_workers=BOT_DB_THREADS,
+                              thread_name_prefix='bot-db')
+
+
+def call_db(func, *args, **kwargs):
+    """Вызов функции с ORM в потоке пула (синхронная часть)."""
+    # Сигналы начала/конца запроса в боте не отправляются: закрываем
+    # устаревшие и разорванные соединения сами.
+    close_old_connections()
+    return func(*args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполнение синхронной функции с ORM в пуле потоков БД.
+
+    :param func: функция, обращающаяся к БД
+    :type func: Callable
+
+    :return: результат функции
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(call_db, func, *args, **kwargs))
+
+
+async def close_connections() -> None:
+    """Закрытие соединений всех потоков пула (при остановке бота)."""
+    barrier = threading.Barrier(BOT_DB_THREADS)
+
+    def close():
+        # Задачи ждут друг друга, поэтому каждая выполняется в своём
+        # потоке пула.
+        barrier.wait()
+        connections.close_all()
+
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, close)
+                           for _ in range(BOT_DB_THREADS)))
+
+
+def database_sync_to_async(func):
+    """Декоратор: синхронная функция с ORM становится корутиной."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
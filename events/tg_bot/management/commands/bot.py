@@ -1,16 +1,32 @@
+import asyncio
 import datetime
-import locale
 import logging
 import os
+import threading
 import time
-
-import requests
-from django.core.management.base import BaseCommand
+import zlib
+from html import escape
+
+import httpx
+from api.models import ChangeSet
+from api.services import EventItem, list_events, table_state
+from api.sync import merge_change_sets
+from cachetools import LRUCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from dotenv import load_dotenv
-from telegram import ParseMode, ReplyKeyboardMarkup, Update
-from telegram.ext import (CallbackContext, CommandHandler, Filters,
-                          MessageHandler, Updater)
-from tg_bot.models import Profile, Subscription
+from telegram import (InlineKeyboardButton, InlineKeyboardMarkup,
+                      ReplyKeyboardMarkup, Update)
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.ext import (Application, CallbackQueryHandler, CommandHandler,
+                          ContextTypes, MessageHandler, filters)
+from tg_bot.broadcast import BroadcastSender, claim_broadcast
+from tg_bot.db import close_connections, database_sync_to_async
+from tg_bot.matching import words
+from tg_bot.models import Broadcast, Profile, Subscription
 
 load_dotenv()
 
@@ -23,54 +39,260 @@ logging.basicConfig(
 )
 
 TOKEN = os.getenv('TOKEN')
-RETRY_PERIOD = int(os.getenv('RETRY_PERIOD', 1800))
+# Интервал проверки новых изменений мероприятий, в секундах.
+RETRY_PERIOD = int(os.getenv('RETRY_PERIOD', 10))
+NOTIFY_JOB_NAME = 'notify_changes'
+# Источник мероприятий: db - прямо из БД, api - HTTP-запросы к API
+# (например, если бот запущен отдельно от БД).
+EVENTS_SOURCE = os.getenv('EVENTS_SOURCE', 'db')
 AUTH_JWT_TOKEN_ACCESS = os.getenv('AUTH_JWT_TOKEN_ACCESS')
 headers = {
     'Authorization': f'Bearer { AUTH_JWT_TOKEN_ACCESS }',
     'Content-Type': 'application/json',
 }
+EVENTS_API_URL = os.getenv('EVENTS_API_URL',
+                           'http://127.0.0.1:8000/api/v1/events/')
+# Последний ответ API: ETag, готовые страницы текста, их версия, срок
+# свежести (по time.monotonic) и выполняющийся запрос к API.
+last_events = {'etag': '', 'pages': [], 'version': '', 'expires': 0,
+               'refresh': None}
+# Максимальная длина сообщения Telegram.
+MESSAGE_LIMIT = 4096
+# Место под строку 'Страница N из M' в конце каждой страницы.
+PAGE_FOOTER_RESERVE = 40
+# Сколько секунд текст кнопки 'Все мероприятия' отдаётся без запроса к API.
+DIGEST_TTL = int(os.getenv('DIGEST_TTL', 60))
+# Попадания и промахи кэша текста 'Все мероприятия' (команда /stats).
+digest_metrics = {'hits': 0, 'misses': 0}
+# Одновременно обрабатываемых обновлений и соединений с API Telegram.
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 256))
+BOT_CONNECTION_POOL_SIZE = int(os.getenv('BOT_CONNECTION_POOL_SIZE', 64))
+# Режим получения обновлений: polling или webhook (за шлюзом nginx).
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Публичный адрес шлюза, на который Telegram отправляет обновления, путь
+# вебхука (маршрут в gateway/nginx.conf) и секрет для проверки запросов.
+BOT_WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL', '')
+BOT_WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH', 'telegram')
+BOT_WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+BOT_WEBHOOK_LISTEN = os.getenv('BOT_WEBHOOK_LISTEN', '0.0.0.0')
+BOT_WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', 8443))
+# Адрес Bot API; для тестов можно указать локальный фейковый сервер.
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL',
+                             'https://api.telegram.org/bot')
+# Общий пул соединений с API мероприятий (создаётся при запуске бота).
+api_client = {'client': None}
+# Известные боту пользователи: ID чата -> значение подписки.
+BOT_SUBSCRIBER_CACHE_SIZE = int(os.getenv('BOT_SUBSCRIBER_CACHE_SIZE',
+                                          100000))
+subscribers = LRUCache(maxsize=BOT_SUBSCRIBER_CACHE_SIZE)
+# ID чатов администраторов через запятую: только им доступна /stats.
+BOT_ADMIN_CHAT_IDS = {
+    int(chat_id) for chat_id in os.getenv('BOT_ADMIN_CHAT_IDS', '').split(',')
+    if chat_id.strip()
+}
+# Ограничения фильтра /keywords: количество слов и длина слова (как у
+# поля Subscription.keywords).
+BOT_MAX_KEYWORDS = int(os.getenv('BOT_MAX_KEYWORDS', 20))
+KEYWORD_MAX_LENGTH = Subscription._meta.get_field(
+    'keywords').base_field.max_length
+# Метрики рассылки уведомлений с момента запуска бота (команда /stats).
+notify_metrics = {'runs': 0, 'last_run': None, 'change_sets': 0,
+                  'messages': 0}
+
 
+def split_pages(entries: list, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Разбиение текста мероприятий на страницы не длиннее limit символов.
 
-def process_information_parsing() -> str:
-    """Обработка информации после парсинга.
-    Возвращает строчку с данными о событиях для бота.
+    Мероприятие не разрывается между страницами; слишком длинное
+    мероприятие обрезается. В конец каждой страницы добавляется номер.
 
-    :rtype: str
-    :return: строка в формате, подходящем для отображения в боте у
-    пользователей
+    :param entries: Тексты мероприятий.
+    :type entries: list
+    :param limit: Максимальная длина страницы.
+    :type limit: int
+    :return: Список страниц.
+    :rtype: list
     """
-    logging.info('Запуск парсинга')
+    size = limit - PAGE_FOOTER_RESERVE
+    pages = []
+    page = ''
+    for entry in entries:
+        if len(entry) > size:
+            entry = entry[:size]
+            # Не оставляем обрезанную HTML-сущность (&amp; и т.п.).
+            if '&' in entry[-8:] and ';' not in entry[entry.rfind('&'):]:
+                entry = entry[:entry.rfind('&')]
+        if page and len(page) + len(entry) > size:
+            pages.append(page)
+            page = ''
+        page += entry
+    if page:
+        pages.append(page)
+    return [f'{page}Страница {number} из {len(pages)}'
+            for number, page in enumerate(pages, start=1)]
+
+
+def split_message(text: str) -> list:
+    """
+    Разбиение текста уведомления на сообщения не длиннее MESSAGE_LIMIT.
+
+    Текст делится по пустым строкам (мероприятие не разрывается между
+    страницами) функцией split_pages; короткий текст не меняется.
+
+    :param text: Текст уведомления.
+    :type text: str
+    :return: Список сообщений.
+    :rtype: list
+    """
+    if len(text) <= MESSAGE_LIMIT:
+        return [text]
+    return split_pages([part.strip('\n') + '\n\n'
+                        for part in text.split('\n\n') if part.strip()])
+
+
+@database_sync_to_async
+def load_events(etag: str) -> tuple:
+    """
+    Мероприятия из БД, если таблица изменилась.
+
+    Версия данных строится из состояния таблицы (число записей и время
+    последнего изменения) так же, как ETag списка в API.
+
+    :param etag: Версия уже полученных данных.
+    :type etag: str
+    :return: Пара (список EventItem или None, если данные не изменились;
+    версия данных).
+    :rtype: tuple
+    """
+    state = table_state()
+    updated_at = state['updated_at']
+    current = '"{}-{}"'.format(
+        state['count'],
+        f'{updated_at.timestamp():.6f}' if updated_at else '',
+    )
+    if current == etag:
+        return None, etag
+    return list_events(), current
+
+
+async def fetch_events(etag: str) -> tuple:
+    """
+    Мероприятия из API (режим EVENTS_SOURCE=api).
 
-    text = []
-    locale.setlocale(locale.LC_ALL, '')
+    Запрос отправляется с ETag предыдущего ответа: если данные не
+    изменились, API отвечает 304. Используется общий пул соединений.
 
+    :param etag: ETag уже полученных данных.
+    :type etag: str
+    :return: Пара (список EventItem или None, если данные не изменились;
+    ETag ответа).
+    :rtype: tuple
+    """
+    request_headers = dict(headers)
+    if etag:
+        request_headers['If-None-Match'] = etag
+
+    events = []
+    etag = ''
+    url = EVENTS_API_URL
+    client = api_client['client'] or httpx.AsyncClient()
+    try:
+        # Список отдаётся по страницам: идём по ссылкам next.
+        while url:
+            response = await client.get(url, headers=request_headers)
+            if response.status_code == 304:
+                return None, request_headers['If-None-Match']
+            response.raise_for_status()
+            page = response.json()
+            events.extend(
+                EventItem(event['date'], event['name'], event['site'])
+                for event in page['results'])
+            url = page['next']
+            etag = etag or response.headers.get('ETag', '')
+            request_headers.pop('If-None-Match', None)
+    finally:
+        if client is not api_client['client']:
+            await client.aclose()
+    return events, etag
+
+
+async def process_information_parsing() -> list:
+    """Обработка информации о мероприятиях.
+    Возвращает страницы текста с данными о событиях для бота.
+
+    Мероприятия читаются прямо из БД или, в режиме EVENTS_SOURCE=api,
+    запрашиваются у API. Если данные не изменились, используются уже
+    готовые страницы. Страницы рендерятся один раз на версию данных;
+    версия - короткий хеш ETag, она передаётся в кнопках листания.
+
+    :rtype: list
+    :return: страницы не длиннее MESSAGE_LIMIT в формате, подходящем для
+    отображения в боте у пользователей
+    """
+    logging.info('Запуск парсинга')
+
+    load = fetch_events if EVENTS_SOURCE == 'api' else load_events
     try:
-        response = requests.get('http://127.0.0.1:8000/api/v1/events/',
-                                headers=headers,
-                                )
-        if response.status_code == 200:
-            logging.info('Данные успешно получены')
-            data_from_the_website = response.json()
+        events, etag = await load(last_events['etag'])
     except Exception as e:
-        logging.error(f'Ошибка при анализе JSON: {e}')
-        data_from_the_website = []
+        logging.error(f'Ошибка при получении мероприятий: {e}')
+        return []
+
+    if events is None:
+        logging.info('Данные не изменились')
+        last_events['expires'] = time.monotonic() + DIGEST_TTL
+        return last_events['pages']
+    if not events:
+        return []
+
+    # Текст уходит с parse_mode HTML.
+    text = [f'Дата: {event.date}\n'
+            f'Название: {escape(event.name)}\n'
+            f'Сайт: {escape(event.site)}\n\n\n'
+            for event in events]
 
-    if not data_from_the_website:
-        return ''
+    logging.info('Завершение парсинга')
 
-    for event_data in data_from_the_website:
-        date = datetime.datetime.strptime(
-            event_data['date'], "%Y-%m-%d").date()
-        name = event_data['name']
-        site = event_data['site']
-        text.append(f'Дата: {date}\nНазвание: {name}\nСайт: {site}\n\n\n')
+    last_events['etag'] = etag
+    last_events['pages'] = split_pages(text)
+    last_events['version'] = f'{zlib.crc32(etag.encode()):08x}'
+    last_events['expires'] = time.monotonic() + DIGEST_TTL
+    return last_events['pages']
 
-    logging.info('Завершение парсинга')
 
-    return ''.join(text)
+async def get_digest() -> list:
+    """Страницы для кнопки 'Все мероприятия' из памяти процесса.
 
+    Пока страницы свежие (DIGEST_TTL секунд после последнего ответа API
+    или до появления новых изменений), они отдаются без запросов. Иначе
+    они обновляются условным запросом к API; одновременные нажатия ждут
+    один и тот же запрос.
 
-def send_message(chat_id, context, text):
+    :rtype: list
+    :return: страницы в формате, подходящем для отображения в боте у
+    пользователей
+    """
+    if last_events['pages'] and time.monotonic() < last_events['expires']:
+        digest_metrics['hits'] += 1
+        return last_events['pages']
+    digest_metrics['misses'] += 1
+    refresh = last_events['refresh']
+    if refresh is None:
+        refresh = asyncio.ensure_future(process_information_parsing())
+        refresh.add_done_callback(
+            lambda task: last_events.update(refresh=None))
+        last_events['refresh'] = refresh
+    # shield: отмена одного обработчика не прерывает запрос для остальных.
+    return await asyncio.shield(refresh)
+
+
+def invalidate_digest():
+    """Страницы 'Все мероприятия' устарели: следующий запрос сходит в API."""
+    last_events['expires'] = 0
+
+
+async def send_message(chat_id, context, text, reply_markup=None):
     """
     Отправка сообщений.
 
@@ -81,25 +303,29 @@ def send_message(chat_id, context, text):
     :type chat_id: int
     :param context: Объект контекста, предоставляющий доступ к ресурсам и
     информации, связанным с текущим обработчиком сообщений.
-    :type context: telegram.ext.CallbackContext
+    :type context: telegram.ext.ContextTypes.DEFAULT_TYPE
     :param text: Текст сообщения, которое нужно отправить.
     :type text: str
+    :param reply_markup: Клавиатура сообщения; по умолчанию - кнопки
+    команд бота.
+    :type reply_markup: telegram.ReplyMarkup
     :return: Возвращает 0 в случае успешной отправки сообщения.
     :rtype: int
     """
     logging.info(f'Отправка сообщения в чат {chat_id}')
 
-    buttons = ReplyKeyboardMarkup([
-        ['Все мероприятия'],
-        ['Подписаться', 'Отписаться'],
-    ],
-        resize_keyboard=True,
-    )
+    if reply_markup is None:
+        reply_markup = ReplyKeyboardMarkup([
+            ['Все мероприятия'],
+            ['Подписаться', 'Отписаться'],
+        ],
+            resize_keyboard=True,
+        )
 
-    context.bot.send_message(
+    await context.bot.send_message(
         chat_id=chat_id,
         text=text,
-        reply_markup=buttons,
+        reply_markup=reply_markup,
         disable_web_page_preview=True,
         parse_mode=ParseMode.HTML,
     )
@@ -107,53 +333,106 @@ def send_message(chat_id, context, text):
     return 0
 
 
-def all_events(update: Update, context: CallbackContext):
+def page_markup(number: int, total: int, version: str):
+    """
+    Кнопки листания страниц 'Все мероприятия'.
+
+    В данных кнопки передаются номер страницы и версия страниц, на
+    которой её показали.
+
+    :param number: Номер текущей страницы, с нуля.
+    :type number: int
+    :param total: Количество страниц.
+    :type total: int
+    :param version: Версия страниц.
+    :type version: str
+    :return: Клавиатура или None, если страница одна.
+    :rtype: telegram.InlineKeyboardMarkup
+    """
+    buttons = []
+    if number > 0:
+        buttons.append(InlineKeyboardButton(
+            '« Назад', callback_data=f'events:{number - 1}:{version}'))
+    if number < total - 1:
+        buttons.append(InlineKeyboardButton(
+            'Далее »', callback_data=f'events:{number + 1}:{version}'))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def all_events(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обработка команды 'Все мероприятия'.
 
+    Отправляет первую страницу списка с кнопками листания.
+
     :param update: Обновление.
     :type update: telegram.Update
     :param context: Контекст.
-    :type context: telegram.ext.callbackcontext.CallbackContext
-    :return: Возвращает 0 в случае успешной отправки сообщения.
-    :rtype: int
+    :type context: telegram.ext.ContextTypes.DEFAULT_TYPE
+    :return: Страницы списка мероприятий.
+    :rtype: list
     """
     chat_id = update.message.chat_id
 
     logging.info(f'Запуск функции all_events для { chat_id }')
 
-    update_subscription_add_user(update, context, False, False)
+    await update_subscription_add_user(update, context, False, False)
 
-    data_from_the_website = process_information_parsing()
-    send_message(chat_id,
-                 context,
-                 data_from_the_website)
+    pages = await get_digest()
+    if pages:
+        await send_message(chat_id,
+                           context,
+                           pages[0],
+                           page_markup(0, len(pages), last_events['version']))
+    else:
+        await send_message(chat_id, context, 'Мероприятия не найдены')
     logging.info(f'Завершение функции all_events для { chat_id }')
-    return data_from_the_website
+    return pages
 
 
-def checking_data_changes() -> bool:
+async def events_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    Проверка изменений/обновлений данных с сайта.
+    Обработка кнопок листания списка мероприятий.
 
-    Если данные изменились, то возвращается True
-    Если нет - False.
+    Страница берётся из уже готовых страниц и заменяет текст сообщения.
+    Если с момента показа список обновился, показывается первая страница
+    нового списка.
 
-    :return: Логическое значение, указывающее, есть ли какие-либо обновления
-    :rtype: bool
+    :param update: Обновление.
+    :type update: telegram.Update
+    :param context: Контекст.
+    :type context: telegram.ext.ContextTypes.DEFAULT_TYPE
+    :return: Возвращает 0 в случае успешной обработки.
+    :rtype: int
     """
-    while True:
-        old_data = process_information_parsing()
-        time.sleep(RETRY_PERIOD)  # Интервал проверки обновлений на сайте
-        new_data = process_information_parsing()
-        logging.debug(f'Равны ли старые и новые данные:{old_data == new_data}')
-        if old_data != new_data:
-            logging.info("Данные в БД были обновлены")
-            return True
-        return False
+    query = update.callback_query
+    _, number, version = query.data.split(':')
+    pages = await get_digest()
+    if not pages:
+        await query.answer('Мероприятия не найдены')
+        return 0
+    notice = None
+    number = int(number)
+    if version != last_events['version'] or number >= len(pages):
+        number = 0
+        notice = 'Список мероприятий обновился'
+    try:
+        await query.edit_message_text(
+            pages[number],
+            reply_markup=page_markup(number, len(pages),
+                                     last_events['version']),
+            disable_web_page_preview=True,
+            parse_mode=ParseMode.HTML,
+        )
+    except BadRequest as error:
+        # Например, повторное нажатие: страница уже показана.
+        logging.info(f'Страница не обновлена: {error}')
+    await query.answer(notice)
+    return 0
 
 
-def hi_say_first_message(update: Update, context: CallbackContext):
+async def hi_say_first_message(update: Update,
+                               context: ContextTypes.DEFAULT_TYPE):
     """
     Отправка первого сообщения.
 
@@ -172,21 +451,106 @@ def hi_say_first_message(update: Update, context: CallbackContext):
             "<u>Подписаться</u> - получать сообщения при обновлении "
             "информации.\n"
 
-            "<u>Отписаться</u> - отписаться от уведомлений."
+            "<u>Отписаться</u> - отписаться от уведомлений.\n"
+            "\n"
+            "/keywords слово ... - уведомлять только о мероприятиях с "
+            "этими словами в названии\n"
+            "/dates ГГГГ-ММ-ДД ГГГГ-ММ-ДД - уведомлять только о "
+            "мероприятиях в этот период\n"
+            "/filters - текущие фильтры уведомлений"
             )
     logging.info(f"Первое сообщение отправлено в чат {chat_id}")
-    update_subscription_add_user(update, context, False, False)
-    return send_message(chat_id,
-                        context,
-                        text=text,)
+    await update_subscription_add_user(update, context, False, False)
+    return await send_message(chat_id,
+                              context,
+                              text=text,)
+
+
+@database_sync_to_async
+def get_subscription(chat_id: int, username: str,
+                     subscription_value: bool = False) -> Subscription:
+    """
+    Получение подписки пользователя, при первом обращении - создание
+    профиля и подписки.
+
+    :param chat_id: ID чата.
+    :param username: Имя пользователя.
+    :param subscription_value: Значение подписки для нового пользователя.
+    :return: Подписка.
+    :rtype: Subscription
+    """
+    profile, _ = Profile.objects.get_or_create(
+        external_id=chat_id,
+        defaults={'name': username or ''},
+    )
+    subscription, _ = Subscription.objects.get_or_create(
+        profile=profile,
+        defaults={'subscription': subscription_value},
+    )
+    return subscription
+
+
+def restore_subscription(chat_id: int, **fields) -> Subscription:
+    """
+    Создание заново подписки пользователя, профиль которого удалён
+    (например, в админке), хотя пользователь остался в кэше subscribers.
+
+    :param chat_id: ID чата.
+    :param fields: Значения полей новой подписки.
+    :return: Подписка.
+    :rtype: Subscription
+    """
+    profile, _ = Profile.objects.get_or_create(external_id=chat_id,
+                                               defaults={'name': ''})
+    subscription, _ = Subscription.objects.get_or_create(profile=profile,
+                                                         defaults=fields)
+    return subscription
 
 
-def update_subscription_add_user(update: Update, context: CallbackContext,
-                                 subscription_value: bool = False,
-                                 text_un_subscribe_status: bool = False):
+@database_sync_to_async
+def set_subscription(chat_id: int, subscription_value: bool) -> bool:
+    """
+    Изменение подписки одним условным UPDATE.
+
+    Новый подписчик получает только изменения после подписки: его
+    доставленной версией становится последний ChangeSet.
+
+    :param chat_id: ID чата.
+    :param subscription_value: Новое значение подписки.
+    :return: True, если подписка изменилась.
+    :rtype: bool
+    """
+    fields = {'subscription': subscription_value,
+              'created_at': timezone.now()}
+    if subscription_value:
+        fields['last_delivered_version'] = Coalesce(
+            Subquery(ChangeSet.objects.order_by('-pk').values('pk')[:1]), 0)
+    subscriptions = Subscription.objects.filter(profile__external_id=chat_id)
+    if subscriptions.exclude(subscription=subscription_value).update(
+            **fields):
+        return True
+    if subscriptions.exists():
+        return False
+    if subscription_value:
+        fields['last_delivered_version'] = ChangeSet.objects.order_by(
+            '-pk').values_list('pk', flat=True).first() or 0
+    restore_subscription(chat_id, **fields)
+    return True
+
+
+async def update_subscription_add_user(update: Update,
+                                       context: ContextTypes.DEFAULT_TYPE,
+                                       subscription_value: bool = False,
+                                       text_un_subscribe_status: bool = False):
     """
     Обновление подписки пользователя на получение обновлений.
 
+    Известные пользователи и их подписки хранятся в LRU-кэше
+    subscribers, поэтому сообщения от них не требуют запросов к БД.
+    Подписка и отписка изменяют подписку в БД условным запросом (так
+    результат верен и при нескольких процессах бота) и сразу обновляют
+    кэш.
+
     :param update: Объект обновления.
     :param context: Контекст обратного вызова.
     :param subscription_value: Значение подписки(True - подписаться,
@@ -199,41 +563,38 @@ def update_subscription_add_user(update: Update, context: CallbackContext,
 
     chat_id = update.effective_chat.id
 
-    subscription, created = Subscription.objects.get_or_create(
-        profile__external_id=chat_id,
-        defaults={
-            'profile': Profile.objects.get_or_create(
-                external_id=update.message.chat_id,
-                name=update.effective_user.username)[0],
-            'subscription': subscription_value
-        }
-    )
+    if chat_id not in subscribers:
+        # Новый пользователь создаётся без подписки: подписку включает
+        # условный запрос ниже, и ответ получается верным.
+        subscription = await get_subscription(
+            chat_id, update.effective_user.username)
+        subscribers[chat_id] = subscription.subscription
 
     logging.info(
         f"Значение подписки для chat_id {chat_id}:"
-        f"{subscription.subscription}")
+        f"{subscribers.get(chat_id)}")
 
     if text_un_subscribe_status:
-        if subscription.subscription == subscription_value:
+        changed = await set_subscription(chat_id, subscription_value)
+        subscribers[chat_id] = subscription_value
+        if not changed:
             if subscription_value:
-                update.message.reply_text('Вы уже подписаны на обновления')
+                await update.message.reply_text(
+                    'Вы уже подписаны на обновления')
             else:
-                update.message.reply_text('Вы не подписаны на обновления')
+                await update.message.reply_text(
+                    'Вы не подписаны на обновления')
         else:
-            subscription.subscription = subscription_value
-            subscription.save()
             if subscription_value:
-                update.message.reply_text(
+                await update.message.reply_text(
                     'Вы успешно подписались на обновления')
             else:
-                update.message.reply_text('Вы отписались от обновлений')
-
-        check_updates(update, context)
+                await update.message.reply_text('Вы отписались от обновлений')
 
     return 0
 
 
-def subscribe(update: Update, context: CallbackContext):
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Подписка пользователя на получение обновлений.
 
@@ -243,10 +604,10 @@ def subscribe(update: Update, context: CallbackContext):
     :rtype: Int
     """
     logging.info(f'Пользователь { update.effective_chat.id } подписался')
-    return update_subscription_add_user(update, context, True, True)
+    return await update_subscription_add_user(update, context, True, True)
 
 
-def unsubscribe(update: Update, context: CallbackContext):
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Отписка пользователя от получений обновлений.
 
@@ -256,29 +617,313 @@ def unsubscribe(update: Update, context: CallbackContext):
     :rtype: Int
     """
     logging.info(f'Пользователь { update.effective_chat.id } отписался')
-    return update_subscription_add_user(update, context, False, True)
+    return await update_subscription_add_user(update, context, False, True)
+
+
+@database_sync_to_async
+def set_filters(chat_id: int, **fields) -> Subscription:
+    """
+    Изменение фильтров уведомлений пользователя.
+
+    :param chat_id: ID чата.
+    :param fields: Поля keywords, date_from, date_to; без них фильтры
+    только читаются.
+    :return: Подписка после изменения.
+    :rtype: Subscription
+    """
+    subscriptions = Subscription.objects.filter(profile__external_id=chat_id)
+    if fields:
+        subscriptions.update(**fields)
+    subscription = subscriptions.first()
+    if subscription is None:
+        subscription = restore_subscription(chat_id, **fields)
+    return subscription
+
+
+def render_filters(subscription: Subscription) -> str:
+    """
+    Текст с фильтрами уведомлений пользователя.
+
+    :param subscription: Подписка.
+    :return: Текст сообщения.
+    :rtype: str
+    """
+    keywords = ', '.join(subscription.keywords) or 'любые'
+    date_from = subscription.date_from or '...'
+    date_to = subscription.date_to or '...'
+    period = (f'{date_from} - {date_to}'
+              if subscription.date_from or subscription.date_to
+              else 'любой')
+    return (f'Ключевые слова: {escape(keywords)}\n'
+            f'Период: {period}')
+
+
+async def keywords(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработка команды /keywords: ключевые слова уведомлений.
+
+    Без аргументов фильтр по словам снимается. Аргументы делятся на
+    слова так же, как названия мероприятий (tg_bot.matching.words), иначе
+    слова с пунктуацией ('ml,', 'data-science') никогда бы не совпали;
+    если слова изменились, пользователь видит итоговый список. Слишком
+    много (больше BOT_MAX_KEYWORDS) или слишком длинные слова не
+    сохраняются.
+
+    :param update: Объект обновления.
+    :param context: Контекст обратного вызова.
+    :return: Возвращает 0 в случае успешной отправки сообщения.
+    :rtype: int
+    """
+    await update_subscription_add_user(update, context, False, False)
+    normalized = sorted(words(' '.join(context.args)))
+    if len(normalized) > BOT_MAX_KEYWORDS or any(
+            len(word) > KEYWORD_MAX_LENGTH for word in normalized):
+        await update.message.reply_text(
+            f'Укажите не больше {BOT_MAX_KEYWORDS} слов длиной до '
+            f'{KEYWORD_MAX_LENGTH} символов.')
+        return 0
+    subscription = await set_filters(update.effective_chat.id,
+                                     keywords=normalized)
+    text = render_filters(subscription)
+    if set(normalized) != {word.lower() for word in context.args}:
+        text = ('Слова приведены к виду, в котором ищутся в названиях '
+                'мероприятий.\n' + text)
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+    return 0
+
+
+async def dates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработка команды /dates: период мероприятий для уведомлений.
+
+    Принимает две даты ГГГГ-ММ-ДД, вместо любой можно указать '-'
+    (период без границы). Без аргументов фильтр по датам снимается.
+
+    :param update: Объект обновления.
+    :param context: Контекст обратного вызова.
+    :return: Возвращает 0 в случае успешной отправки сообщения.
+    :rtype: int
+    """
+    await update_subscription_add_user(update, context, False, False)
+    args = list(context.args) + ['-', '-']
+    try:
+        date_from, date_to = (
+            None if value == '-' else datetime.date.fromisoformat(value)
+            for value in args[:2])
+    except ValueError:
+        await update.message.reply_text(
+            'Укажите даты в формате ГГГГ-ММ-ДД: /dates 2023-12-01 '
+            '2023-12-31')
+        return 0
+    if date_from and date_to and date_from > date_to:
+        await update.message.reply_text(
+            'Начало периода позже конца: /dates 2023-12-01 2023-12-31')
+        return 0
+    subscription = await set_filters(update.effective_chat.id,
+                                     date_from=date_from, date_to=date_to)
+    await update.message.reply_text(render_filters(subscription),
+                                    parse_mode=ParseMode.HTML)
+    return 0
+
+
+async def filters_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработка команды /filters: текущие фильтры уведомлений.
+
+    :param update: Объект обновления.
+    :param context: Контекст обратного вызова.
+    :return: Возвращает 0 в случае успешной отправки сообщения.
+    :rtype: int
+    """
+    await update_subscription_add_user(update, context, False, False)
+    subscription = await set_filters(update.effective_chat.id)
+    await update.message.reply_text(render_filters(subscription),
+                                    parse_mode=ParseMode.HTML)
+    return 0
+
+
+def render_changes(change_set: ChangeSet) -> str:
+    """
+    Текст уведомления об изменениях мероприятий.
+
+    :param change_set: Изменения после синхронизации.
+    :type change_set: api.models.ChangeSet
+    :return: Текст сообщения в формате HTML.
+    :rtype: str
+    """
+    def render_event(event):
+        return (f'Дата: {event["date"]}\n'
+                f'Название: {escape(event["name"])}\n'
+                f'Сайт: {escape(event["site"])}\n')
+
+    parts = []
+    if change_set.added:
+        parts.append('<b>Новые мероприятия</b>\n\n' + '\n'.join(
+            render_event(event) for event in change_set.added))
+    if change_set.changed:
+        lines = []
+        for event in change_set.changed:
+            previous = ', '.join(
+                f'было: {escape(value)}'
+                for value in event['previous'].values())
+            lines.append(f'{render_event(event)}({previous})\n')
+        parts.append('<b>Изменения</b>\n\n' + '\n'.join(lines))
+    if change_set.removed:
+        parts.append('<b>Убраны с сайта</b>\n\n' + '\n'.join(
+            render_event(event) for event in change_set.removed))
+    return '\n\n'.join(parts)
+
+
+@database_sync_to_async
+def get_pending_broadcasts() -> tuple:
+    """
+    Последние изменения и захваченные этим процессом рассылки.
+
+    Подписчики группируются по последней доставленной версии (ID
+    ChangeSet). Для каждой группы изменения после её версии объединяются
+    и рендерятся один раз, поэтому подписчик, пропустивший несколько
+    синхронизаций, получает одно сообщение. Рассылку, которую выполняет
+    другой процесс бота, и завершённую рассылку пропускаем: подписчики,
+    оставшиеся на её версии (например, которым сообщение было отклонено),
+    получат изменения со следующей рассылкой.
+
+    :return: Пара (последний ChangeSet или None, список рассылок).
+    :rtype: tuple
+    """
+    latest = ChangeSet.objects.order_by('-id').first()
+    if latest is None:
+        return None, []
+    versions = list(
+        Subscription.objects.filter(
+            subscription=True,
+            last_delivered_version__lt=latest.pk,
+        ).order_by('last_delivered_version').values_list(
+            'last_delivered_version', flat=True).distinct()
+    )
+    pending = []
+    for version in versions:
+        diff = None
+        broadcast = Broadcast.objects.filter(
+            change_set=latest, from_version=version).first()
+        if broadcast is None:
+            diff = merge_change_sets(ChangeSet.objects.filter(
+                pk__gt=version, pk__lte=latest.pk).order_by('id'))
+            text = render_changes(diff)
+            if not text:
+                # Изменения взаимно погасились: сообщать нечего.
+                Subscription.objects.filter(
+                    subscription=True, last_delivered_version=version,
+                ).update(last_delivered_version=latest.pk)
+                continue
+            broadcast, _ = Broadcast.objects.get_or_create(
+                change_set=latest,
+                from_version=version,
+                defaults={'text': text},
+            )
+        if broadcast.finished_at is None and claim_broadcast(broadcast):
+            # Объединённые изменения нужны для подписчиков с фильтрами.
+            broadcast.diff = diff or merge_change_sets(
+                ChangeSet.objects.filter(
+                    pk__gt=version, pk__lte=latest.pk).order_by('id'))
+            pending.append(broadcast)
+    return latest, pending
+
+
+@database_sync_to_async
+def mark_delivered(change_set: ChangeSet) -> int:
+    """
+    Отметка изменений разосланными, если их получили все подписчики,
+    кроме тех, кому сообщение было отклонено (они получат изменения со
+    следующей рассылкой).
+
+    :param change_set: Последние разосланные изменения.
+    :type change_set: ChangeSet
+    :return: Количество отмеченных записей ChangeSet.
+    :rtype: int
+    """
+    if Subscription.objects.filter(
+            subscription=True,
+            rejected_count=0,
+            last_delivered_version__lt=change_set.pk).exists():
+        return 0
+    return ChangeSet.objects.filter(
+        pk__lte=change_set.pk, delivered_at__isnull=True,
+    ).update(delivered_at=timezone.now())
 
 
-def check_updates(update: Update, context: CallbackContext):
+async def notify_changes(context: ContextTypes.DEFAULT_TYPE):
     """
-    Функция постоянно проверяет наличие изменений в данных и отправляет
-    сообщения подписанным пользователям.
+    Рассылка уведомлений об изменениях мероприятий подписчикам.
+
+    Единственная на процесс задача JobQueue (регистрируется в
+    build_application): по таблице ChangeSet (её заполняет синхронизация)
+    и версиям, доставленным подписчикам, готовит рассылки объединённых
+    изменений, выполняет их через BroadcastSender и отмечает изменения
+    разосланными. Рассылка, прерванная перезапуском бота, продолжается с
+    сохранённого места. Задача срабатывает раз в RETRY_PERIOD секунд.
+
+    :param context: Контекст обратного вызова.
+    :type context: telegram.ext.ContextTypes.DEFAULT_TYPE
+    """
+    notify_metrics['runs'] += 1
+    notify_metrics['last_run'] = timezone.now()
+
+    async def send(chat_id, text):
+        await send_message(chat_id, context, text)
+
+    sender = BroadcastSender(send, render=render_changes,
+                             split=split_message)
+    latest, pending = await get_pending_broadcasts()
+    if latest is None:
+        return
+    if pending:
+        # Данные мероприятий изменились.
+        invalidate_digest()
+    for broadcast in pending:
+        logging.info(f'Рассылка изменений с версии '
+                     f'{ broadcast.from_version } по { latest.pk }')
+        sent = broadcast.sent
+        await sender.run(broadcast)
+        notify_metrics['messages'] += broadcast.sent - sent
+    notify_metrics['change_sets'] += await mark_delivered(latest)
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработка команды /stats: метрики рассылки уведомлений.
+
+    Показывает, сколько задач рассылки зарегистрировано (должна быть
+    ровно одна на процесс), сколько живых потоков и задач asyncio у
+    процесса, сколько изменений и сообщений разослано с момента запуска
+    и счётчики кэша текста 'Все мероприятия'. Команда доступна только
+    чатам из BOT_ADMIN_CHAT_IDS, для остальных она неизвестна.
 
     :param update: Объект обновления.
     :param context: Контекст обратного вызова.
+    :return: Возвращает 0 в случае успешной отправки сообщения.
+    :rtype: int
     """
-    logging.info(f'Запуск функции check_updates для '
-                 f'{ update.effective_chat.id }')
-    while True:
-        if checking_data_changes():
-            subscriptions = Subscription.objects.filter(subscription=True)
-            for subscription in subscriptions:
-                chat_id = subscription.profile.external_id
-                logging.info(f'Отправка сообщения пользователю { chat_id }')
-                send_message(chat_id, context, process_information_parsing())
+    if update.effective_chat.id not in BOT_ADMIN_CHAT_IDS:
+        return await do_echo(update, context)
+    last_run = notify_metrics['last_run']
+    text = (
+        f'Задач рассылки: '
+        f'{len(context.job_queue.get_jobs_by_name(NOTIFY_JOB_NAME))}\n'
+        f'Потоков: {threading.active_count()}\n'
+        f'Задач asyncio: {len(asyncio.all_tasks())}\n'
+        f'Проверок изменений: {notify_metrics["runs"]}\n'
+        f'Последняя проверка: '
+        f'{last_run.isoformat(timespec="seconds") if last_run else "-"}\n'
+        f'Разослано изменений: {notify_metrics["change_sets"]}\n'
+        f'Отправлено сообщений: {notify_metrics["messages"]}\n'
+        f'Кэш мероприятий: попаданий {digest_metrics["hits"]}, '
+        f'промахов {digest_metrics["misses"]}'
+    )
+    await update.message.reply_text(text)
+    return 0
 
 
-def do_echo(update: Update, context: CallbackContext):
+async def do_echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обрабатывает текст, которого нет в командах.
     Добавляет данные о пользователе в БД.
@@ -289,61 +934,134 @@ def do_echo(update: Update, context: CallbackContext):
     :rtype: int
     """
     logging.info(f'Запуск функции do_echo для { update.effective_chat.id }')
-    update_subscription_add_user(update, context, False, False)
+    await update_subscription_add_user(update, context, False, False)
 
-    update.message.reply_text(text='Неизвестная команда')
+    await update.message.reply_text(text='Неизвестная команда')
 
     return 0
 
 
+async def post_init(application: Application):
+    """Создание общего пула соединений с API мероприятий."""
+    api_client['client'] = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=BOT_CONNECTION_POOL_SIZE),
+        timeout=10,
+    )
+
+
+async def post_shutdown(application: Application):
+    """Закрытие пула соединений с API мероприятий и соединений с БД."""
+    if api_client['client'] is not None:
+        await api_client['client'].aclose()
+        api_client['client'] = None
+    await close_connections()
+
+
+def build_application() -> Application:
+    """
+    Сборка приложения бота: обработчики команд и задача рассылки.
+
+    Обновления обрабатываются конкурентно в одном цикле событий (до
+    BOT_CONCURRENT_UPDATES одновременно), без потока на каждое
+    обновление.
+
+    :return: Приложение python-telegram-bot.
+    :rtype: telegram.ext.Application
+    """
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(BOT_API_BASE_URL)
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .connection_pool_size(BOT_CONNECTION_POOL_SIZE)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Обработки команд
+    application.add_handler(CommandHandler('start', hi_say_first_message))
+    application.add_handler(MessageHandler(
+        filters.Text(['Все мероприятия']),
+        all_events,
+    ))
+    application.add_handler(CallbackQueryHandler(events_page,
+                                                 pattern=r'^events:'))
+    application.add_handler(MessageHandler(
+        filters.Text(['Подписаться']),
+        subscribe,
+    ))
+    application.add_handler(MessageHandler(
+        filters.Text(['Отписаться']),
+        unsubscribe,
+    ))
+    application.add_handler(CommandHandler('stats', stats))
+    application.add_handler(CommandHandler('keywords', keywords))
+    application.add_handler(CommandHandler('dates', dates))
+    application.add_handler(CommandHandler('filters', filters_info))
+
+    # Обработчик сообщений по умолчанию
+    application.add_handler(MessageHandler(filters.TEXT, do_echo))
+
+    # Одна задача рассылки на процесс, независимо от числа подписчиков
+    # и их действий. Если процессов несколько, каждую рассылку выполняет
+    # тот, кто её захватил (Broadcast.locked_until).
+    application.job_queue.run_repeating(notify_changes,
+                                        interval=RETRY_PERIOD,
+                                        first=0,
+                                        name=NOTIFY_JOB_NAME)
+    return application
+
+
+def webhook_options() -> dict:
+    """
+    Параметры Application.run_webhook.
+
+    Бот слушает BOT_WEBHOOK_LISTEN:BOT_WEBHOOK_PORT за шлюзом nginx и
+    регистрирует в Telegram адрес BOT_WEBHOOK_URL/BOT_WEBHOOK_PATH.
+    Telegram передаёт секрет в заголовке X-Telegram-Bot-Api-Secret-Token,
+    запросы без него отклоняются.
+
+    :return: Именованные аргументы для run_webhook.
+    :rtype: dict
+    """
+    if not BOT_WEBHOOK_URL or not BOT_WEBHOOK_SECRET:
+        raise CommandError('Для режима webhook нужны переменные '
+                           'BOT_WEBHOOK_URL и BOT_WEBHOOK_SECRET')
+    return {
+        'listen': BOT_WEBHOOK_LISTEN,
+        'port': BOT_WEBHOOK_PORT,
+        'url_path': BOT_WEBHOOK_PATH,
+        'secret_token': BOT_WEBHOOK_SECRET,
+        'webhook_url': f'{BOT_WEBHOOK_URL.rstrip("/")}/{BOT_WEBHOOK_PATH}',
+    }
+
+
 class Command(BaseCommand):
     """Команды Telegram-бота."""
 
     help = 'Телеграмм-бот'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=('polling', 'webhook'),
+            default=BOT_MODE,
+            help='Режим получения обновлений (по умолчанию BOT_MODE)',
+        )
+
     def handle(self, *args, **kwargs):
         """
         Обработчик команд бота.
 
         :param args: Аргументы команды.
         :type args: Any
-        :param kwargs: Аргументы ключевого слова команды.
+        :param kwargs: Аргументы ключевого слова команды (mode).
         :type kwargs: Any
         :return: None
         """
-        # Обработчики
-        updater = Updater(token=TOKEN)
-
-        # Обработки команд
-        updater.dispatcher.add_handler(CommandHandler(
-            'start',
-            hi_say_first_message,
-            run_async=True,
-        )
-        )
-
-        updater.dispatcher.add_handler(MessageHandler(
-            Filters.text('Все мероприятия'),
-            all_events,
-            run_async=True,
-        )
-        )
-        updater.dispatcher.add_handler(MessageHandler(
-            Filters.text('Подписаться'),
-            subscribe,
-            run_async=True,
-        )
-        )
-        updater.dispatcher.add_handler(MessageHandler(
-            Filters.text('Отписаться'),
-            unsubscribe,
-            run_async=True,
-        )
-        )
-
-        # Обработчик сообщений по умолчанию
-        message_handler = MessageHandler(Filters.text, do_echo)
-        updater.dispatcher.add_handler(message_handler)
-
-        updater.start_polling()
-        updater.idle()
+        application = build_application()
+        if kwargs['mode'] == 'webhook':
+            application.run_webhook(**webhook_options())
+        else:
+            application.run_polling()
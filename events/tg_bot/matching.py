@@ -0,0 +1,135 @@
+"""Подбор подписчиков для изменённых мероприятий по фильтрам подписок.
+
+Фильтры подписки - ключевые слова (слово названия мероприятия) и период
+дат. Фильтры не проверяются для каждой пары подписчик-мероприятие:
+подписки раскладываются в обратный индекс (слово -> подписчики, месяц ->
+подписчики с периодом без слов), и для мероприятия проверяются только
+подписчики, найденные по его словам и месяцу.
+"""
+import datetime
+import re
+from collections import defaultdict
+
+from api.models import ChangeSet
+
+WORD_RE = re.compile(r'\w+')
+
+CHANGE_FIELDS = ('added', 'changed', 'removed')
+
+
+def words(text: str) -> set:
+    """Слова текста в нижнем регистре.
+
+    :param text: текст
+    :type text: str
+
+    :rtype: set
+    :return: множество слов
+    """
+    return set(WORD_RE.findall(text.lower()))
+
+
+def months(date_from: datetime.date, date_to: datetime.date):
+    """Месяцы (год, месяц) периода, включая границы."""
+    year, month = date_from.year, date_from.month
+    while (year, month) <= (date_to.year, date_to.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class SubscriptionIndex:
+    """Обратный индекс фильтров подписок.
+
+    Подписчик подходит мероприятию, если в названии есть одно из его
+    слов (или слова не заданы) и дата попадает в его период (или период
+    не задан). Подписки без фильтров в индекс не добавляются.
+    """
+
+    def __init__(self):
+        self.by_word = defaultdict(set)
+        self.by_month = defaultdict(set)
+        # Подписки без слов с периодом, открытым с одной стороны.
+        self.open_windows = set()
+        self.windows = {}
+
+    def __bool__(self):
+        return bool(self.by_word or self.by_month or self.open_windows)
+
+    def add(self, key, keywords=(), date_from: datetime.date = None,
+            date_to: datetime.date = None) -> None:
+        """Добавление подписки.
+
+        :param key: ключ подписчика (например, ID чата)
+        :param keywords: ключевые слова
+        :type keywords: Iterable[str]
+        :param date_from: начало периода (включительно)
+        :type date_from: datetime.date
+        :param date_to: конец периода (включительно)
+        :type date_to: datetime.date
+        """
+        if date_from or date_to:
+            self.windows[key] = (date_from, date_to)
+        if keywords:
+            for word in keywords:
+                self.by_word[word.lower()].add(key)
+        elif date_from and date_to:
+            for month in months(date_from, date_to):
+                self.by_month[month].add(key)
+        elif date_from or date_to:
+            self.open_windows.add(key)
+
+    def in_window(self, key, date: datetime.date) -> bool:
+        date_from, date_to = self.windows.get(key, (None, None))
+        return ((date_from is None or date >= date_from)
+                and (date_to is None or date <= date_to))
+
+    def match(self, event: dict) -> set:
+        """Подписчики, которым подходит мероприятие.
+
+        :param event: мероприятие из ChangeSet (ключи date, name, site)
+        :type event: dict
+
+        :rtype: set
+        :return: ключи подписчиков
+        """
+        date = datetime.date.fromisoformat(event['date'])
+        candidates = set(self.open_windows)
+        candidates.update(self.by_month.get((date.year, date.month), ()))
+        for word in words(event['name']):
+            candidates.update(self.by_word.get(word, ()))
+        return {key for key in candidates if self.in_window(key, date)}
+
+    def match_positions(self, change_set) -> dict:
+        """Позиции изменений, которые подходят каждому подписчику.
+
+        Изменённое мероприятие подходит подписчику и по новым, и по
+        прежним значениям (например, если дата ушла из его периода).
+
+        :param change_set: изменения
+        :type change_set: ChangeSet
+
+        :rtype: dict
+        :return: словарь {ключ подписчика: кортеж пар (поле, позиция)}
+        только для подписчиков, которым подошло хотя бы одно мероприятие
+        """
+        matched = defaultdict(list)
+        for field in CHANGE_FIELDS:
+            for position, event in enumerate(getattr(change_set, field)):
+                keys = self.match(event)
+                if 'previous' in event:
+                    keys |= self.match(dict(event, **event['previous']))
+                for key in keys:
+                    matched[key].append((field, position))
+        return {key: tuple(positions) for key, positions in matched.items()}
+
+
+def subset(change_set, positions: tuple) -> ChangeSet:
+    """Подборка изменений по позициям из match_positions.
+
+    :rtype: ChangeSet
+    :return: несохранённая запись с выбранными изменениями
+    """
+    result = ChangeSet()
+    for field, position in positions:
+        getattr(result, field).append(getattr(change_set, field)[position])
+    return result
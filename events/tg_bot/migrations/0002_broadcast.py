@@ -0,0 +1,32 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_changeset'),
+        ('tg_bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Текст сообщения')),
+                ('last_chat_id', models.BigIntegerField(default=0, verbose_name='Последний обработанный чат')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Отправлено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Не доставлено')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Время завершения')),
+                ('change_set', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='api.ChangeSet', verbose_name='Изменения')),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+                'verbose_name_plural': 'Рассылки',
+            },
+        ),
+    ]
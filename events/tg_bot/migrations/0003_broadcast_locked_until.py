@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0002_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Захвачена до'),
+        ),
+    ]
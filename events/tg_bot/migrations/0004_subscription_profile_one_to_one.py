@@ -0,0 +1,38 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    """Удаление лишних подписок профиля перед уникальным индексом.
+
+    Остаётся последняя по времени изменения подписка профиля.
+    """
+    Subscription = apps.get_model('tg_bot', 'Subscription')
+    kept = set()
+    duplicates = []
+    for pk, profile_id in Subscription.objects.order_by(
+            'profile_id', '-created_at', '-pk').values_list('pk',
+                                                            'profile_id'):
+        if profile_id in kept:
+            duplicates.append(pk)
+        kept.add(profile_id)
+    Subscription.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0003_broadcast_locked_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_subscriptions,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='subscription',
+            name='profile',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='tg_bot.Profile', verbose_name='Профиль'),
+        ),
+    ]
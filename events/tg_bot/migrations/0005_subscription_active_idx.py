@@ -0,0 +1,40 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+def reset_unfinished_cursors(apps, schema_editor):
+    """Курсор незавершённых рассылок хранил ID чата, а не ID профиля.
+
+    Порядки ID чатов и профилей не совпадают, поэтому такие рассылки
+    начинаются заново.
+    """
+    Broadcast = apps.get_model('tg_bot', 'Broadcast')
+    Broadcast.objects.filter(finished_at__isnull=True).update(
+        last_profile_id=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0004_subscription_profile_one_to_one'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='broadcast',
+            old_name='last_chat_id',
+            new_name='last_profile_id',
+        ),
+        migrations.AlterField(
+            model_name='broadcast',
+            name='last_profile_id',
+            field=models.BigIntegerField(default=0, verbose_name='Последний обработанный профиль'),
+        ),
+        migrations.RunPython(reset_unfinished_cursors,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(subscription=True), fields=['profile'], name='subscription_active_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_delivered_versions(apps, schema_editor):
+    """Подписчики уже получили все разосланные изменения."""
+    ChangeSet = apps.get_model('api', 'ChangeSet')
+    Subscription = apps.get_model('tg_bot', 'Subscription')
+    last = ChangeSet.objects.filter(
+        delivered_at__isnull=False).order_by('-pk').first()
+    if last is not None:
+        Subscription.objects.update(last_delivered_version=last.pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_changeset'),
+        ('tg_bot', '0005_subscription_active_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='subscription_active_idx',
+        ),
+        migrations.AddField(
+            model_name='broadcast',
+            name='from_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='С версии'),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='last_delivered_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Последняя доставленная версия'),
+        ),
+        migrations.AlterField(
+            model_name='broadcast',
+            name='change_set',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.ChangeSet', verbose_name='Изменения'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='broadcast',
+            unique_together={('change_set', 'from_version')},
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(subscription=True), fields=['last_delivered_version', 'profile'], name='subscription_active_idx'),
+        ),
+        migrations.RunPython(set_delivered_versions,
+                             migrations.RunPython.noop),
+    ]
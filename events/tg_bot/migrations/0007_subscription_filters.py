@@ -0,0 +1,29 @@
+# Generated by Django 2.2.19 on 2026-10-18 12:32
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0006_subscription_last_delivered_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='date_from',
+            field=models.DateField(blank=True, null=True, verbose_name='Мероприятия с'),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='date_to',
+            field=models.DateField(blank=True, null=True, verbose_name='Мероприятия по'),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='keywords',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None, verbose_name='Ключевые слова'),
+        ),
+    ]
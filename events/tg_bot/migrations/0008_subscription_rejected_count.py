@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0007_subscription_filters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='rejected_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Отклонённых сообщений подряд'),
+        ),
+    ]
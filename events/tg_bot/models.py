@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 
 
@@ -19,7 +20,7 @@ class Profile(models.Model):
 
 
 class Subscription(models.Model):
-    profile = models.ForeignKey(
+    profile = models.OneToOneField(
         to='tg_bot.Profile',
         verbose_name='Профиль',
         on_delete=models.CASCADE,
@@ -32,6 +33,36 @@ class Subscription(models.Model):
         verbose_name='Время подписки',
         auto_now=True,
     )
+    # ID последнего доставленного ChangeSet.
+    last_delivered_version = models.PositiveIntegerField(
+        verbose_name='Последняя доставленная версия',
+        default=0,
+    )
+    # Сколько рассылок подряд Telegram отклонил само сообщение (см.
+    # tg_bot/broadcast.py); после BROADCAST_MAX_REJECTS версия
+    # пропускается.
+    rejected_count = models.PositiveSmallIntegerField(
+        verbose_name='Отклонённых сообщений подряд',
+        default=0,
+    )
+    # Фильтры уведомлений, см. tg_bot/matching.py. Без фильтров
+    # приходят все изменения.
+    keywords = ArrayField(
+        models.CharField(max_length=100),
+        verbose_name='Ключевые слова',
+        default=list,
+        blank=True,
+    )
+    date_from = models.DateField(
+        verbose_name='Мероприятия с',
+        null=True,
+        blank=True,
+    )
+    date_to = models.DateField(
+        verbose_name='Мероприятия по',
+        null=True,
+        blank=True,
+    )
 
     def __str__(self):
         return f'Подписка { self.pk } от { self.profile }'
@@ -39,3 +70,70 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = (
+            # Получатели рассылок: только активные подписки, по версиям
+            # и по порядку профилей.
+            models.Index(fields=('last_delivered_version', 'profile'),
+                         condition=models.Q(subscription=True),
+                         name='subscription_active_idx'),
+        )
+
+
+class Broadcast(models.Model):
+    """Рассылка уведомления об изменениях подписчикам.
+
+    Рассылка доставляет подписчикам, получившим версию from_version,
+    объединённые изменения после неё вплоть до change_set; после
+    доставки их версия становится равной change_set. Текст рендерится
+    один раз при создании рассылки. Подписчики
+    обходятся по возрастанию ID профиля, после каждой пачки сохраняется
+    last_profile_id, поэтому прерванная рассылка продолжается с места
+    остановки. Процесс бота, выполняющий рассылку, продлевает
+    locked_until; пока срок не истёк, другие процессы её не трогают.
+    """
+    change_set = models.ForeignKey(
+        to='api.ChangeSet',
+        verbose_name='Изменения',
+        on_delete=models.CASCADE,
+    )
+    from_version = models.PositiveIntegerField(
+        verbose_name='С версии',
+        default=0,
+    )
+    text = models.TextField(
+        verbose_name='Текст сообщения',
+    )
+    last_profile_id = models.BigIntegerField(
+        verbose_name='Последний обработанный профиль',
+        default=0,
+    )
+    sent = models.PositiveIntegerField(
+        verbose_name='Отправлено',
+        default=0,
+    )
+    failed = models.PositiveIntegerField(
+        verbose_name='Не доставлено',
+        default=0,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Время создания',
+        auto_now_add=True,
+    )
+    finished_at = models.DateTimeField(
+        verbose_name='Время завершения',
+        null=True,
+        blank=True,
+    )
+    locked_until = models.DateTimeField(
+        verbose_name='Захвачена до',
+        null=True,
+        blank=True,
+    )
+
+    def __str__(self):
+        return f'Рассылка { self.pk }: { self.sent } отправлено'
+
+    class Meta:
+        verbose_name = 'Рассылка'
+        verbose_name_plural = 'Рассылки'
+        unique_together = ('change_set', 'from_version')
@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import random
+import time
+from unittest import mock
+
+from api.models import ChangeSet
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from tg_bot.broadcast import BroadcastSender, Recipient, claim_broadcast
+from tg_bot.db import close_connections
+from tg_bot.models import Broadcast, Profile, Subscription
+
+
+def make_sender(send, **kwargs):
+    return BroadcastSender(send, rate=0, chat_interval=0, backoff=0,
+                           **kwargs)
+
+
+def send_one(sender, chat_id, text):
+    return asyncio.run(sender.send_one(asyncio.Semaphore(1), chat_id, text))
+
+
+class BroadcastSenderTest(TransactionTestCase):
+    def setUp(self):
+        for external_id in (1, 2, 3):
+            Subscription.objects.create(
+                profile=Profile.objects.create(external_id=external_id,
+                                               name=f'user{external_id}'),
+                subscription=True,
+            )
+        self.broadcast = Broadcast.objects.create(
+            change_set=ChangeSet.objects.create(), text='Изменения')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Соединения потоков пула БД бота постоянные (CONN_MAX_AGE).
+        asyncio.run(close_connections())
+        super().tearDownClass()
+
+    def test_run_sends_to_all_subscribers(self):
+        """Сообщение отправляется каждому подписчику, прогресс сохраняется."""
+        send = mock.AsyncMock()
+        asyncio.run(make_sender(send, batch_size=2).run(self.broadcast))
+        self.assertEqual(sorted(call.args[0] for call in send.call_args_list),
+                         [1, 2, 3])
+        self.broadcast.refresh_from_db()
+        self.assertEqual(
+            (self.broadcast.sent, self.broadcast.last_profile_id),
+            (3, Profile.objects.get(external_id=3).pk))
+        self.assertFalse(Subscription.objects.exclude(
+            last_delivered_version=self.broadcast.change_set_id).exists())
+        self.assertIsNotNone(self.broadcast.finished_at)
+
+    def test_run_resumes_from_last_chat(self):
+        """Прерванная рассылка продолжается со следующего чата."""
+        self.broadcast.last_profile_id = Profile.objects.get(
+            external_id=2).pk
+        send = mock.AsyncMock()
+        asyncio.run(make_sender(send).run(self.broadcast))
+        send.assert_called_once_with(3, 'Изменения')
+
+    def test_recipients_single_query(self):
+        """Пачка получателей выбирается одним запросом, только ID."""
+        Subscription.objects.filter(profile__external_id=2).update(
+            subscription=False)
+        sender = make_sender(mock.AsyncMock())
+        with self.assertNumQueries(1):
+            recipients = sender.recipients(self.broadcast)
+        self.assertEqual(
+            [recipient.chat_id for recipient in recipients], [1, 3])
+
+    def test_filtered_subscribers_get_matching_changes(self):
+        """Подписчики с фильтрами получают только подходящие изменения."""
+        Subscription.objects.filter(profile__external_id=2).update(
+            keywords=['python'])
+        Subscription.objects.filter(profile__external_id=3).update(
+            keywords=['java'])
+        self.broadcast.diff = ChangeSet(added=[
+            {'date': '2023-12-05', 'name': 'Python & Go', 'site': 'a'},
+            {'date': '2023-12-06', 'name': 'Митап', 'site': 'b'},
+        ])
+        send = mock.AsyncMock()
+        render = mock.Mock(return_value='Python')
+        Subscription.objects.filter(profile__external_id=1).update(
+            keywords=['python'])
+        # Подписчики с одинаковой подборкой попадают в разные пачки, но
+        # текст рендерится один раз за рассылку.
+        asyncio.run(make_sender(send, render=render, batch_size=1)
+                    .run(self.broadcast))
+        self.assertEqual(
+            sorted(call.args for call in send.call_args_list),
+            [(1, 'Python'), (2, 'Python')])
+        render.assert_called_once()
+        self.assertFalse(Subscription.objects.exclude(
+            last_delivered_version=self.broadcast.change_set_id).exists())
+
+    def test_send_one_handles_errors(self):
+        """RetryAfter и сетевые ошибки повторяются, блокировка - нет."""
+        send = mock.AsyncMock(side_effect=[RetryAfter(0),
+                                           NetworkError('timeout'), None])
+        self.assertTrue(send_one(make_sender(send), 1, 'текст'))
+        self.assertEqual(send.call_count, 3)
+
+        send = mock.AsyncMock(side_effect=Forbidden('blocked'))
+        self.assertFalse(send_one(make_sender(send), 1, 'текст'))
+        send.assert_called_once()
+
+        send = mock.AsyncMock(side_effect=NetworkError('timeout'))
+        self.assertFalse(send_one(make_sender(send, retries=2), 1, 'текст'))
+        self.assertEqual(send.call_count, 3)
+
+    def test_rejected_message_keeps_version(self):
+        """Если Telegram отклонил само сообщение, версия подписчика не
+        меняется; ошибка чата версию меняет."""
+        async def send(chat_id, text):
+            if chat_id == 1:
+                raise BadRequest('Message is too long')
+            if chat_id == 2:
+                raise BadRequest('Chat not found')
+
+        asyncio.run(make_sender(send).run(self.broadcast))
+        self.assertEqual(
+            sorted(Subscription.objects.filter(
+                last_delivered_version=self.broadcast.change_set_id,
+            ).values_list('profile__external_id', flat=True)), [2, 3])
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.sent, self.broadcast.failed), (1, 2))
+
+    def test_send_one_sends_all_pages(self):
+        """Текст, разделённый функцией split, отправляется по страницам."""
+        send = mock.AsyncMock()
+        sender = make_sender(send, split=lambda text: text.split('|'))
+        self.assertTrue(send_one(sender, 1, 'первая|вторая'))
+        self.assertEqual([call.args for call in send.call_args_list],
+                         [(1, 'первая'), (1, 'вторая')])
+
+    def test_claim_broadcast_once(self):
+        """Рассылку захватывает один процесс, пока не истёк срок захвата."""
+        self.assertTrue(claim_broadcast(self.broadcast))
+        self.assertFalse(claim_broadcast(self.broadcast))
+        Broadcast.objects.filter(pk=self.broadcast.pk).update(
+            locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertTrue(claim_broadcast(self.broadcast))
+
+
+class BroadcastMatchTest(SimpleTestCase):
+    def test_match_is_fast(self):
+        """Подбор 100 мероприятий 100 тысячам подписчиков с фильтрами и
+        тексты для всех пачек рассылки - меньше секунды."""
+        rng = random.Random(1)
+        vocabulary = [f'слово{number}' for number in range(5000)]
+        start = datetime.date(2024, 1, 1)
+        recipients = []
+        for chat_id in range(100000):
+            date_from = start + datetime.timedelta(days=rng.randrange(365))
+            recipients.append(Recipient(
+                chat_id, chat_id, rng.sample(vocabulary, 3), date_from,
+                date_from + datetime.timedelta(days=30)))
+        broadcast = Broadcast(text='Изменения')
+        broadcast.diff = ChangeSet(added=[
+            {'date': str(start + datetime.timedelta(days=rng.randrange(365))),
+             'name': ' '.join(rng.sample(vocabulary, 4)), 'site': 'a'}
+            for _ in range(100)
+        ])
+        sender = make_sender(mock.AsyncMock(), render=str)
+        began = time.perf_counter()
+        sender.match(broadcast, [recipient[1:] for recipient in recipients])
+        texts = {}
+        for position in range(0, len(recipients), sender.batch_size):
+            texts.update(sender.texts(
+                broadcast, recipients[position:position + sender.batch_size]))
+        self.assertLess(time.perf_counter() - began, 1)
+        self.assertTrue(texts)
+        self.assertLess(len(texts), len(recipients))
@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import time
+from unittest import mock
+
+from api.models import Event
+from django.test import SimpleTestCase, TransactionTestCase
+from tg_bot.db import close_connections
+from tg_bot.management.commands import bot
+from tg_bot.management.commands.bot import (MESSAGE_LIMIT, digest_metrics,
+                                            events_page, get_digest,
+                                            invalidate_digest, last_events,
+                                            page_markup, split_pages)
+
+
+def api_response(status_code, events=(), etag='"1"'):
+    response = mock.Mock(status_code=status_code, headers={'ETag': etag})
+    response.json.return_value = {'results': list(events), 'next': None}
+    return response
+
+
+class DigestTest(SimpleTestCase):
+    def setUp(self):
+        last_events.update(etag='', pages=[], version='', expires=0,
+                           refresh=None)
+        digest_metrics.update(hits=0, misses=0)
+        self.client = mock.Mock()
+        self.client.get = mock.AsyncMock(return_value=api_response(
+            200, [{'date': '2023-12-05', 'name': 'Python & Go',
+                   'site': 'https://events.yandex.ru/events/python'}]))
+        for patcher in (mock.patch.dict(bot.api_client, client=self.client),
+                        mock.patch.object(bot, 'EVENTS_SOURCE', 'api')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_digest_is_cached(self):
+        """Повторное нажатие отдаёт текст из памяти без запроса к API."""
+        first = asyncio.run(get_digest())
+        second = asyncio.run(get_digest())
+        self.assertEqual(first, second)
+        self.assertIn('Python &amp; Go', first[0])
+        self.client.get.assert_called_once()
+        self.assertEqual(digest_metrics, {'hits': 1, 'misses': 1})
+
+    def test_concurrent_presses_share_request(self):
+        """Одновременные нажатия ждут один запрос к API."""
+        async def press_many():
+            return await asyncio.gather(*(get_digest() for _ in range(5)))
+
+        texts = asyncio.run(press_many())
+        self.assertTrue(all(text == texts[0] for text in texts))
+        self.client.get.assert_called_once()
+
+    def test_invalidate_revalidates_with_etag(self):
+        """После сброса текст проверяется условным запросом."""
+        text = asyncio.run(get_digest())
+        invalidate_digest()
+        self.client.get.return_value = api_response(304)
+        self.assertEqual(asyncio.run(get_digest()), text)
+        headers = self.client.get.call_args.kwargs['headers']
+        self.assertEqual(headers['If-None-Match'], '"1"')
+        self.assertEqual(digest_metrics['misses'], 2)
+
+
+class DatabaseDigestTest(TransactionTestCase):
+    # Запросы к БД выполняются в пуле потоков бота: данные должны быть
+    # закоммичены, поэтому используется TransactionTestCase.
+
+    def setUp(self):
+        last_events.update(etag='', pages=[], version='', expires=0,
+                           refresh=None)
+        Event.objects.create(date=datetime.date(2023, 12, 6), name='Митап',
+                             site='https://events.yandex.ru/events/meetup')
+        Event.objects.create(date=datetime.date(2023, 12, 5),
+                             name='Python & Go',
+                             site='https://events.yandex.ru/events/python')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Соединения потоков пула БД бота постоянные (CONN_MAX_AGE).
+        asyncio.run(close_connections())
+        super().tearDownClass()
+
+    def test_digest_from_database(self):
+        """Мероприятия читаются из БД по дате, без запросов к API."""
+        with mock.patch.object(bot.httpx, 'AsyncClient') as client:
+            pages = asyncio.run(get_digest())
+        client.assert_not_called()
+        self.assertLess(pages[0].index('Python &amp; Go'),
+                        pages[0].index('Митап'))
+
+    def test_unchanged_table_keeps_pages(self):
+        """Если таблица не изменилась, страницы не рендерятся заново."""
+        pages = asyncio.run(get_digest())
+        version = last_events['version']
+        invalidate_digest()
+        with mock.patch.object(bot, 'list_events') as list_events:
+            self.assertIs(asyncio.run(get_digest()), pages)
+        list_events.assert_not_called()
+        Event.objects.filter(name='Митап').delete()
+        invalidate_digest()
+        self.assertNotIn('Митап', asyncio.run(get_digest())[0])
+        self.assertNotEqual(last_events['version'], version)
+
+
+class PagesTest(SimpleTestCase):
+    def setUp(self):
+        self.entries = [f'Дата: 2023-12-05\nНазвание: {"x" * 100}{number}'
+                        f'\n\n\n' for number in range(100)]
+
+    def test_split_pages(self):
+        """Страницы не длиннее лимита, мероприятия не разрываются."""
+        pages = split_pages(self.entries)
+        self.assertGreater(len(pages), 1)
+        self.assertTrue(all(len(page) <= MESSAGE_LIMIT for page in pages))
+        self.assertEqual(sum(page.count('Дата:') for page in pages), 100)
+        self.assertTrue(pages[-1].endswith(
+            f'Страница {len(pages)} из {len(pages)}'))
+
+    def test_long_entry_is_truncated(self):
+        """Мероприятие длиннее лимита обрезается до размера страницы."""
+        pages = split_pages(['&amp;' * 2000])
+        self.assertEqual(len(pages), 1)
+        self.assertLessEqual(len(pages[0]), MESSAGE_LIMIT)
+        self.assertIn('&amp;Страница 1', pages[0])
+
+    def test_page_buttons(self):
+        """Листание передаёт номер страницы и версию списка."""
+        self.assertIsNone(page_markup(0, 1, 'v'))
+        buttons = page_markup(1, 3, 'v').inline_keyboard[0]
+        self.assertEqual([button.callback_data for button in buttons],
+                         ['events:0:v', 'events:2:v'])
+
+    def test_events_page(self):
+        """Кнопка показывает готовую страницу; старая версия - первую."""
+        pages = split_pages(self.entries)
+        last_events.update(pages=pages, version='v',
+                           expires=time.monotonic() + 60, refresh=None)
+        update = mock.MagicMock()
+        update.callback_query.edit_message_text = mock.AsyncMock()
+        update.callback_query.answer = mock.AsyncMock()
+        update.callback_query.data = 'events:1:v'
+        asyncio.run(events_page(update, mock.MagicMock()))
+        update.callback_query.edit_message_text.assert_called_with(
+            pages[1], reply_markup=mock.ANY, disable_web_page_preview=True,
+            parse_mode=mock.ANY)
+        update.callback_query.data = 'events:1:old'
+        asyncio.run(events_page(update, mock.MagicMock()))
+        self.assertEqual(
+            update.callback_query.edit_message_text.call_args.args[0],
+            pages[0])
+        update.callback_query.answer.assert_called_with(
+            'Список мероприятий обновился')
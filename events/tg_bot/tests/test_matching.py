@@ -0,0 +1,47 @@
+import datetime
+
+from api.models import ChangeSet
+from django.test import SimpleTestCase
+from tg_bot.matching import SubscriptionIndex, subset
+
+
+def event(name, date='2023-12-05', **kwargs):
+    return dict(date=date, name=name, site=f'https://e/{name}', **kwargs)
+
+
+class SubscriptionIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = SubscriptionIndex()
+        self.index.add('python', ['Python'])
+        self.index.add('december', date_from=datetime.date(2023, 12, 1),
+                       date_to=datetime.date(2023, 12, 31))
+        self.index.add('python-2024', ['python'],
+                       date_from=datetime.date(2024, 1, 1))
+        self.index.add('from-2024', date_from=datetime.date(2024, 1, 1))
+
+    def test_match_keywords_and_dates(self):
+        """Подписчик подходит по словам названия и по периоду."""
+        self.assertEqual(self.index.match(event('Python и Go')),
+                         {'python', 'december'})
+        self.assertEqual(self.index.match(event('Python', '2024-02-01')),
+                         {'python', 'python-2024', 'from-2024'})
+        self.assertEqual(self.index.match(event('Митап', '2023-11-30')),
+                         set())
+
+    def test_match_positions(self):
+        """Подписчики с одинаковой подборкой получают одни позиции;
+        изменённое мероприятие подходит и по прежней дате."""
+        self.index.add('python-too', ['python'])
+        change_set = ChangeSet(
+            added=[event('Python и Go'), event('Митап', '2023-11-01')],
+            changed=[event('Митап', '2024-03-01',
+                           previous={'date': '2023-12-10'})],
+        )
+        matched = self.index.match_positions(change_set)
+        self.assertEqual(set(matched), {'python', 'python-too', 'december',
+                                        'from-2024'})
+        self.assertEqual(matched['python'], matched['python-too'])
+        december = subset(change_set, matched['december'])
+        self.assertEqual(len(december.added), 1)
+        self.assertEqual(len(december.changed), 1)
+        self.assertEqual(subset(change_set, matched['from-2024']).added, [])
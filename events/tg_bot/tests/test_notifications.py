@@ -0,0 +1,207 @@
+import asyncio
+from unittest import mock
+
+from api.models import ChangeSet
+from django.test import TransactionTestCase
+from django.utils import timezone
+from telegram.error import BadRequest
+from tg_bot.broadcast import BROADCAST_MAX_REJECTS
+from tg_bot.db import close_connections
+from tg_bot.management.commands import bot
+from tg_bot.management.commands.bot import (MESSAGE_LIMIT, notify_changes,
+                                            notify_metrics, render_changes,
+                                            stats, subscribe, subscribers)
+from tg_bot.models import Broadcast, Profile, Subscription
+
+
+class NotifyChangesTest(TransactionTestCase):
+    # Запросы к БД выполняются в пуле потоков бота: данные должны быть
+    # закоммичены, поэтому используется TransactionTestCase.
+
+    def setUp(self):
+        subscribers.clear()
+        for external_id, subscribed in ((1, True), (2, False)):
+            Subscription.objects.create(
+                profile=Profile.objects.create(external_id=external_id,
+                                               name=f'user{external_id}'),
+                subscription=subscribed,
+            )
+        self.change_set = ChangeSet.objects.create(
+            added=[{'date': '2023-12-05', 'name': 'Python & Go',
+                    'site': 'https://events.yandex.ru/events/python'}],
+            changed=[{'date': '2023-12-07', 'name': 'Митап',
+                      'site': 'https://events.yandex.ru/events/meetup',
+                      'previous': {'date': '2023-12-06'}}],
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        # Соединения потоков пула БД бота постоянные (CONN_MAX_AGE).
+        asyncio.run(close_connections())
+        super().tearDownClass()
+
+    def test_render_changes(self):
+        """В тексте есть разделы изменений, HTML экранируется."""
+        text = render_changes(self.change_set)
+        self.assertIn('Новые мероприятия', text)
+        self.assertIn('Python &amp; Go', text)
+        self.assertIn('было: 2023-12-06', text)
+        self.assertNotIn('Убраны с сайта', text)
+
+    def test_notify_changes_sends_once(self):
+        """Изменения рассылаются подписчикам один раз."""
+        context = mock.MagicMock()
+        context.bot.send_message = mock.AsyncMock()
+        asyncio.run(notify_changes(context))
+        asyncio.run(notify_changes(context))
+        context.bot.send_message.assert_called_once()
+        self.assertEqual(
+            context.bot.send_message.call_args.kwargs['chat_id'], 1)
+        self.change_set.refresh_from_db()
+        self.assertIsNotNone(self.change_set.delivered_at)
+
+    def test_finished_broadcast_is_not_repeated(self):
+        """Завершённая рассылка не повторяется; подписка, снова включённая
+        со старой версией, получает изменения со следующей рассылкой."""
+        context = mock.MagicMock()
+        context.bot.send_message = mock.AsyncMock()
+        asyncio.run(notify_changes(context))
+        Subscription.objects.filter(profile__external_id=2).update(
+            subscription=True)
+        context.bot.send_message.reset_mock()
+        Broadcast.objects.update(locked_until=timezone.now())
+        asyncio.run(notify_changes(context))
+        context.bot.send_message.assert_not_called()
+
+        ChangeSet.objects.create(added=[{
+            'date': '2023-12-08', 'name': 'Хакатон',
+            'site': 'https://events.yandex.ru/events/hackathon'}])
+        asyncio.run(notify_changes(context))
+        texts = {call.kwargs['chat_id']: call.kwargs['text']
+                 for call in context.bot.send_message.call_args_list}
+        self.assertIn('Python &amp; Go', texts[2])
+        self.assertNotIn('Python &amp; Go', texts[1])
+        self.assertIn('Хакатон', texts[1])
+
+    def test_rejected_recipient_is_not_resent(self):
+        """Отклонённое сообщение не отправляется повторно в каждом цикле;
+        после BROADCAST_MAX_REJECTS рассылок версия подписчика
+        пропускается."""
+        context = mock.MagicMock()
+        context.bot.send_message = mock.AsyncMock(
+            side_effect=BadRequest('Message is too long'))
+        subscription = Subscription.objects.get(profile__external_id=1)
+        for tick in range(5):
+            Broadcast.objects.update(locked_until=timezone.now())
+            asyncio.run(notify_changes(context))
+        self.assertEqual(context.bot.send_message.call_count, 1)
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.last_delivered_version, 0)
+        self.assertEqual(subscription.rejected_count, 1)
+        # Отклонённый подписчик не задерживает отметку о рассылке.
+        self.change_set.refresh_from_db()
+        self.assertIsNotNone(self.change_set.delivered_at)
+
+        for number in range(1, BROADCAST_MAX_REJECTS):
+            latest = ChangeSet.objects.create(added=[{
+                'date': '2023-12-08', 'name': f'Хакатон {number}',
+                'site': f'https://events.yandex.ru/events/{number}'}])
+            for tick in range(3):
+                Broadcast.objects.update(locked_until=timezone.now())
+                asyncio.run(notify_changes(context))
+        self.assertEqual(context.bot.send_message.call_count,
+                         BROADCAST_MAX_REJECTS)
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.last_delivered_version, latest.pk)
+        self.assertEqual(subscription.rejected_count, 0)
+
+    def test_long_changes_are_split(self):
+        """Длинное уведомление отправляется несколькими сообщениями не
+        длиннее лимита Telegram."""
+        ChangeSet.objects.create(added=[
+            {'date': '2023-12-05', 'name': f'Мероприятие {number}',
+             'site': f'https://events.yandex.ru/events/{number}'}
+            for number in range(200)
+        ])
+        context = mock.MagicMock()
+        context.bot.send_message = mock.AsyncMock()
+        asyncio.run(notify_changes(context))
+        texts = [call.kwargs['text']
+                 for call in context.bot.send_message.call_args_list]
+        self.assertGreater(len(texts), 1)
+        self.assertTrue(all(len(text) <= MESSAGE_LIMIT for text in texts))
+        self.assertEqual(sum(text.count('Сайт:') for text in texts), 202)
+
+    def test_missed_versions_are_coalesced(self):
+        """Пропустивший синхронизации подписчик получает одно сообщение,
+        остальные - только новые изменения."""
+        context = mock.MagicMock()
+        context.bot.send_message = mock.AsyncMock()
+        asyncio.run(notify_changes(context))
+        Subscription.objects.create(
+            profile=Profile.objects.create(external_id=4, name='user4'),
+            subscription=True,
+        )
+        ChangeSet.objects.create(removed=[
+            {'date': '2023-12-08', 'name': 'Отменённое',
+             'site': 'https://events.yandex.ru/events/old'}])
+        context.bot.send_message.reset_mock()
+        asyncio.run(notify_changes(context))
+        texts = {call.kwargs['chat_id']: call.kwargs['text']
+                 for call in context.bot.send_message.call_args_list}
+        self.assertEqual(set(texts), {1, 4})
+        self.assertNotIn('Python', texts[1])
+        self.assertIn('Отменённое', texts[1])
+        self.assertIn('Python', texts[4])
+        self.assertIn('Отменённое', texts[4])
+        self.assertFalse(ChangeSet.objects.filter(
+            delivered_at__isnull=True).exists())
+
+    def test_subscribe_skips_history(self):
+        """Новый подписчик не получает изменения до подписки."""
+        update = mock.MagicMock()
+        update.effective_chat.id = update.message.chat_id = 3
+        update.effective_user.username = 'user3'
+        update.message.reply_text = mock.AsyncMock()
+        asyncio.run(subscribe(update, mock.MagicMock()))
+        self.assertEqual(Subscription.objects.get(
+            profile__external_id=3).last_delivered_version,
+            self.change_set.pk)
+
+    def test_subscribe_does_not_start_loops(self):
+        """Подписка не запускает отдельную проверку изменений."""
+        update = mock.MagicMock()
+        update.effective_chat.id = update.message.chat_id = 3
+        update.effective_user.username = 'user3'
+        update.message.reply_text = mock.AsyncMock()
+        context = mock.MagicMock()
+        asyncio.run(subscribe(update, context))
+        context.job_queue.run_repeating.assert_not_called()
+        self.assertTrue(Subscription.objects.get(
+            profile__external_id=3).subscription)
+
+    def test_stats_is_admin_only(self):
+        """Чатам не из BOT_ADMIN_CHAT_IDS /stats не показывает метрики."""
+        update = mock.MagicMock()
+        update.effective_chat.id = 2
+        update.message.reply_text = mock.AsyncMock()
+        with mock.patch.object(bot, 'BOT_ADMIN_CHAT_IDS', {1}):
+            asyncio.run(stats(update, mock.MagicMock()))
+        update.message.reply_text.assert_called_once_with(
+            text='Неизвестная команда')
+
+    def test_stats(self):
+        """Команда /stats показывает число задач и разосланных сообщений."""
+        context = mock.MagicMock()
+        context.bot.send_message = mock.AsyncMock()
+        asyncio.run(notify_changes(context))
+        update = mock.MagicMock()
+        update.effective_chat.id = 1
+        update.message.reply_text = mock.AsyncMock()
+        context.job_queue.get_jobs_by_name.return_value = [mock.Mock()]
+        with mock.patch.object(bot, 'BOT_ADMIN_CHAT_IDS', {1}):
+            asyncio.run(stats(update, context))
+        text = update.message.reply_text.call_args.args[0]
+        self.assertIn('Задач рассылки: 1', text)
+        self.assertIn(f'Отправлено сообщений: {notify_metrics["messages"]}',
+                      text)
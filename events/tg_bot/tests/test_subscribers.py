@@ -0,0 +1,128 @@
+import asyncio
+from unittest import mock
+
+from django.test import TransactionTestCase
+from tg_bot.db import close_connections
+from tg_bot.management.commands.bot import (dates, do_echo, keywords,
+                                            subscribe, subscribers,
+                                            unsubscribe)
+from tg_bot.models import Profile, Subscription
+
+
+def message_update(chat_id):
+    update = mock.MagicMock()
+    update.effective_chat.id = update.message.chat_id = chat_id
+    update.effective_user.username = f'user{chat_id}'
+    update.message.reply_text = mock.AsyncMock()
+    return update
+
+
+class SubscriberCacheTest(TransactionTestCase):
+    # Запросы к БД выполняются в пуле потоков бота: данные должны быть
+    # закоммичены, поэтому используется TransactionTestCase.
+
+    def setUp(self):
+        subscribers.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        # Соединения потоков пула БД бота постоянные (CONN_MAX_AGE).
+        asyncio.run(close_connections())
+        super().tearDownClass()
+
+    def test_known_user_costs_no_queries(self):
+        """Повторные сообщения пользователя не обращаются к БД."""
+        update = message_update(1)
+        asyncio.run(do_echo(update, mock.MagicMock()))
+        self.assertTrue(Profile.objects.filter(external_id=1).exists())
+        with mock.patch('tg_bot.management.commands.bot.'
+                        'get_subscription') as get_subscription:
+            asyncio.run(do_echo(update, mock.MagicMock()))
+        get_subscription.assert_not_called()
+
+    def test_subscribe_writes_through(self):
+        """Подписка и отписка сразу попадают в БД и в кэш."""
+        update = message_update(2)
+        asyncio.run(subscribe(update, mock.MagicMock()))
+        update.message.reply_text.assert_called_with(
+            'Вы успешно подписались на обновления')
+        self.assertTrue(subscribers[2])
+        asyncio.run(subscribe(update, mock.MagicMock()))
+        update.message.reply_text.assert_called_with(
+            'Вы уже подписаны на обновления')
+        asyncio.run(unsubscribe(update, mock.MagicMock()))
+        self.assertFalse(subscribers[2])
+        self.assertFalse(Subscription.objects.get(
+            profile__external_id=2).subscription)
+
+    def test_subscribe_from_other_process(self):
+        """Ответ берётся из БД, даже если кэш устарел."""
+        update = message_update(3)
+        asyncio.run(subscribe(update, mock.MagicMock()))
+        Subscription.objects.update(subscription=False)
+        asyncio.run(subscribe(update, mock.MagicMock()))
+        update.message.reply_text.assert_called_with(
+            'Вы успешно подписались на обновления')
+
+    def test_deleted_profile_is_restored(self):
+        """Если профиль удалён, а пользователь остался в кэше, команды
+        создают профиль и подписку заново."""
+        update = message_update(5)
+        context = mock.MagicMock()
+        asyncio.run(subscribe(update, context))
+        Profile.objects.filter(external_id=5).delete()
+        context.args = ['Python']
+        asyncio.run(keywords(update, context))
+        self.assertEqual(
+            Subscription.objects.get(profile__external_id=5).keywords,
+            ['python'])
+        Profile.objects.filter(external_id=5).delete()
+        asyncio.run(subscribe(update, context))
+        update.message.reply_text.assert_called_with(
+            'Вы успешно подписались на обновления')
+        self.assertTrue(Subscription.objects.get(
+            profile__external_id=5).subscription)
+
+    def test_subscription_is_one_to_one(self):
+        """У профиля одна подписка (уникальный индекс)."""
+        self.assertTrue(
+            Subscription._meta.get_field('profile').one_to_one)
+
+    def test_filters_commands(self):
+        """Команды /keywords и /dates сохраняют фильтры уведомлений."""
+        update = message_update(4)
+        context = mock.MagicMock()
+        context.args = ['Python', 'Go']
+        asyncio.run(keywords(update, context))
+        context.args = ['2023-12-01', '-']
+        asyncio.run(dates(update, context))
+        subscription = Subscription.objects.get(profile__external_id=4)
+        self.assertEqual(subscription.keywords, ['go', 'python'])
+        self.assertEqual(str(subscription.date_from), '2023-12-01')
+        self.assertIsNone(subscription.date_to)
+        context.args = ['ML,', 'data-science']
+        asyncio.run(keywords(update, context))
+        self.assertEqual(
+            Subscription.objects.get(profile__external_id=4).keywords,
+            ['data', 'ml', 'science'])
+        self.assertIn('Ключевые слова: data, ml, science',
+                      update.message.reply_text.call_args.args[0])
+        context.args = ['1 декабря']
+        asyncio.run(dates(update, context))
+        self.assertIn('ГГГГ-ММ-ДД',
+                      update.message.reply_text.call_args.args[0])
+        context.args = ['2023-12-31', '2023-12-01']
+        asyncio.run(dates(update, context))
+        self.assertIn('Начало периода позже конца',
+                      update.message.reply_text.call_args.args[0])
+        self.assertEqual(
+            str(Subscription.objects.get(profile__external_id=4).date_from),
+            '2023-12-01')
+        for args in (['a' * 101], [f'w{number}' for number in range(21)]):
+            context.args = args
+            asyncio.run(keywords(update, context))
+            self.assertIn('Укажите не больше 20 слов длиной до 100 символов',
+                          update.message.reply_text.call_args.args[0])
+        self.assertEqual(
+            Subscription.objects.get(profile__external_id=4).keywords,
+            ['data', 'ml', 'science'])
@@ -0,0 +1,37 @@
+from unittest import mock
+
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+from tg_bot.management.commands import bot
+from tg_bot.management.commands.bot import (NOTIFY_JOB_NAME, build_application,
+                                            webhook_options)
+
+
+class WebhookTest(SimpleTestCase):
+    @mock.patch.multiple(bot, BOT_WEBHOOK_URL='https://example.com/',
+                         BOT_WEBHOOK_SECRET='secret')
+    def test_webhook_options(self):
+        """Адрес вебхука собирается из адреса шлюза и пути."""
+        options = webhook_options()
+        self.assertEqual(options['webhook_url'],
+                         'https://example.com/telegram')
+        self.assertEqual(options['url_path'], 'telegram')
+        self.assertEqual(options['secret_token'], 'secret')
+        self.assertEqual(options['port'], 8443)
+
+    @mock.patch.multiple(bot, BOT_WEBHOOK_URL='https://example.com',
+                         BOT_WEBHOOK_SECRET='')
+    def test_webhook_requires_secret(self):
+        """Без секрета режим webhook не запускается."""
+        with self.assertRaises(CommandError):
+            webhook_options()
+
+    @mock.patch.multiple(bot, TOKEN='123:abc',
+                         BOT_API_BASE_URL='http://localhost:8081/bot')
+    def test_build_application(self):
+        """Приложение использует указанный адрес Bot API и одну задачу."""
+        application = build_application()
+        self.assertTrue(
+            application.bot.base_url.startswith('http://localhost:8081/bot'))
+        self.assertEqual(
+            len(application.job_queue.get_jobs_by_name(NOTIFY_JOB_NAME)), 1)